@@ -0,0 +1,41 @@
+"""Add ai_result_cache table
+
+Revision ID: 7c2d4e9a1b3f
+Revises: 38187091c4ae
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2d4e9a1b3f'
+down_revision: Union[str, Sequence[str], None] = '38187091c4ae'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ai_result_cache',
+        sa.Column('cache_key', sa.VARCHAR(length=64), nullable=False),
+        sa.Column('style', sa.VARCHAR(length=20), nullable=False),
+        sa.Column('prompt_version', sa.VARCHAR(length=16), nullable=False),
+        sa.Column('title', sa.VARCHAR(length=200), nullable=True),
+        sa.Column('markdown', sa.TEXT(), nullable=False),
+        sa.Column('size_bytes', sa.INTEGER(), nullable=False),
+        sa.Column('hit_count', sa.INTEGER(), nullable=False),
+        sa.Column('created_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('last_hit_at', postgresql.TIMESTAMP(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('cache_key', name=op.f('pk_ai_result_cache'))
+    )
+    op.create_index(op.f('ix_ai_result_cache_prompt_version'), 'ai_result_cache', ['prompt_version'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_ai_result_cache_prompt_version'), table_name='ai_result_cache')
+    op.drop_table('ai_result_cache')
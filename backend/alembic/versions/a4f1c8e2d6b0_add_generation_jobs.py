@@ -0,0 +1,60 @@
+"""Add generation_jobs table
+
+Revision ID: a4f1c8e2d6b0
+Revises: 7c2d4e9a1b3f
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4f1c8e2d6b0'
+down_revision: Union[str, Sequence[str], None] = '7c2d4e9a1b3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('generation_jobs',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('user_id', sa.INTEGER(), nullable=False),
+        sa.Column('status', sa.VARCHAR(length=20), nullable=False),
+        sa.Column('source_type', sa.VARCHAR(length=20), nullable=False),
+        sa.Column('input_text', sa.TEXT(), nullable=True),
+        sa.Column('input_path', sa.VARCHAR(length=500), nullable=True),
+        sa.Column('filename', sa.VARCHAR(length=255), nullable=True),
+        sa.Column('file_type', sa.VARCHAR(length=20), nullable=True),
+        sa.Column('style', sa.VARCHAR(length=20), nullable=True),
+        sa.Column('priority', sa.INTEGER(), nullable=False),
+        sa.Column('credit_cost', sa.INTEGER(), nullable=True),
+        sa.Column('credits_charged', sa.BOOLEAN(), nullable=False),
+        sa.Column('result', sa.TEXT(), nullable=True),
+        sa.Column('error', sa.TEXT(), nullable=True),
+        sa.Column('error_code', sa.VARCHAR(length=50), nullable=True),
+        sa.Column('attempts', sa.INTEGER(), nullable=False),
+        sa.Column('worker_id', sa.VARCHAR(length=64), nullable=True),
+        sa.Column('created_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('started_at', postgresql.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('heartbeat_at', postgresql.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('finished_at', postgresql.TIMESTAMP(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], name=op.f('fk_generation_jobs_user_id_users'), ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_generation_jobs'))
+    )
+    op.create_index(op.f('ix_generation_jobs_id'), 'generation_jobs', ['id'], unique=True)
+    op.create_index(op.f('ix_generation_jobs_user_id'), 'generation_jobs', ['user_id'], unique=False)
+    op.create_index(op.f('ix_generation_jobs_status'), 'generation_jobs', ['status'], unique=False)
+    op.create_index(op.f('ix_generation_jobs_created_at'), 'generation_jobs', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_generation_jobs_created_at'), table_name='generation_jobs')
+    op.drop_index(op.f('ix_generation_jobs_status'), table_name='generation_jobs')
+    op.drop_index(op.f('ix_generation_jobs_user_id'), table_name='generation_jobs')
+    op.drop_index(op.f('ix_generation_jobs_id'), table_name='generation_jobs')
+    op.drop_table('generation_jobs')
@@ -0,0 +1,27 @@
+"""Add structure column to mindmaps
+
+Revision ID: b8e3f5a7c9d1
+Revises: a4f1c8e2d6b0
+Create Date: 2026-10-16 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e3f5a7c9d1'
+down_revision: Union[str, Sequence[str], None] = 'a4f1c8e2d6b0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('mindmaps', sa.Column('structure', sa.TEXT(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('mindmaps', 'structure')
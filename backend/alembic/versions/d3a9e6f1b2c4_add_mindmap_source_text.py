@@ -0,0 +1,27 @@
+"""Add source_text column to mindmaps
+
+Revision ID: d3a9e6f1b2c4
+Revises: b8e3f5a7c9d1
+Create Date: 2026-10-16 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3a9e6f1b2c4'
+down_revision: Union[str, Sequence[str], None] = 'b8e3f5a7c9d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('mindmaps', sa.Column('source_text', sa.TEXT(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('mindmaps', 'source_text')
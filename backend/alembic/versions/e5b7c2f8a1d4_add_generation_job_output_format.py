@@ -0,0 +1,30 @@
+"""Add output_format column to generation_jobs
+
+Revision ID: e5b7c2f8a1d4
+Revises: d3a9e6f1b2c4
+Create Date: 2026-10-16 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b7c2f8a1d4'
+down_revision: Union[str, Sequence[str], None] = 'd3a9e6f1b2c4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'generation_jobs',
+        sa.Column('output_format', sa.VARCHAR(length=20), server_default='markdown', nullable=False)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('generation_jobs', 'output_format')
@@ -150,6 +150,24 @@ async def get_admin_stats(
             detail="获取统计数据失败"
         )
 
+@router.get("/ai-metrics")
+async def get_ai_metrics(
+    admin_user: User = Depends(get_current_admin)
+):
+    """
+    获取AI处理器运行指标
+    
+    包括结果缓存命中率、缓存占用字节数等
+    """
+    from app.core.ai_processor import ai_processor
+    from app.services.parse_executor import parse_executor
+    
+    return {
+        "success": True,
+        "metrics": {**ai_processor.get_metrics(), "parsing": parse_executor.get_metrics()},
+        "last_updated": datetime.now().isoformat()
+    }
+
 @router.get("/users", response_model=UserListResponse)
 async def get_users_list(
     admin_user: User = Depends(get_current_admin),
@@ -0,0 +1,221 @@
+"""
+异步生成任务 API 路由
+提交后立即返回任务ID，客户端通过轮询或 SSE 订阅获取结果
+"""
+
+import os
+from pathlib import Path
+from typing import Optional
+
+from fastapi import APIRouter, File, UploadFile, HTTPException, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import get_db, SessionLocal
+from app.models.user import User
+from app.models.generation_job import JobStatus
+from app.services.generation_job_service import GenerationJobService, generation_job_pool
+from .auth import get_current_user
+from .upload import (
+    TextProcessRequest,
+    FileGenerateRequest,
+    FileValidationService,
+    get_file_data,
+    get_ai_priority,
+    normalize_output_format,
+    _sse_event,
+)
+
+router = APIRouter()
+
+# 待解析上传文件的落盘目录
+JOB_UPLOAD_DIR = os.path.join(settings.upload_dir, "jobs")
+os.makedirs(JOB_UPLOAD_DIR, exist_ok=True)
+
+
+def _accepted_response(job) -> JSONResponse:
+    """任务已受理（202），附带查询地址"""
+    payload = GenerationJobService.to_dict(job, include_result=False)
+    payload["status_url"] = f"/api/jobs/{job.id}"
+    payload["events_url"] = f"/api/jobs/{job.id}/events"
+    return JSONResponse(status_code=202, content={"success": True, **payload})
+
+
+@router.post("/text")
+async def submit_text_job(
+    text_request: TextProcessRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """提交文本生成任务（积分在执行时扣除，失败自动退还）"""
+    if not text_request.text.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="文本内容不能为空"
+        )
+
+    job = GenerationJobService.create_job(
+        db,
+        user_id=current_user.id,
+        source_type="text",
+        input_text=text_request.text,
+        style=text_request.style,
+        output_format=normalize_output_format(text_request.output_format),
+        priority=get_ai_priority(current_user)
+    )
+    generation_job_pool.notify_new_job()
+    return _accepted_response(job)
+
+
+@router.post("/upload")
+async def submit_upload_job(
+    file: UploadFile = File(...),
+    style: Optional[str] = None,
+    output_format: Optional[str] = "markdown",
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    提交文件生成任务
+    文件落盘后立即返回，解析在 worker 中进行；output_format=tree 时结果为 JSON 树
+    """
+    file_ext, input_path = await FileValidationService.spool_upload_file(file, JOB_UPLOAD_DIR)
+
+    try:
+        job = GenerationJobService.create_job(
+            db,
+            user_id=current_user.id,
+            source_type="file",
+            input_path=input_path,
+            filename=Path(file.filename).name,
+            file_type=file_ext,
+            style=style,
+            output_format=normalize_output_format(output_format),
+            priority=get_ai_priority(current_user)
+        )
+    except Exception:
+        os.remove(input_path)
+        raise
+    generation_job_pool.notify_new_job()
+    return _accepted_response(job)
+
+
+@router.post("/file-token")
+async def submit_file_token_job(
+    file_request: FileGenerateRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """根据 /upload/analyze 返回的文件token提交生成任务"""
+    file_data = get_file_data(file_request.file_token, current_user.id)
+    if not file_data:
+        raise HTTPException(
+            status_code=404,
+            detail="文件token无效、已过期或无权访问"
+        )
+
+    job = GenerationJobService.create_job(
+        db,
+        user_id=current_user.id,
+        source_type="file_token",
+        input_text=file_data["content"],
+        filename=file_data["filename"],
+        file_type=file_data["file_type"],
+        style=file_request.style,
+        output_format=normalize_output_format(file_request.output_format),
+        priority=get_ai_priority(current_user),
+        credit_cost=file_data.get("credit_cost")
+    )
+    generation_job_pool.notify_new_job()
+    return _accepted_response(job)
+
+
+@router.get("")
+async def list_jobs(
+    limit: int = 20,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """获取当前用户最近的生成任务"""
+    jobs = GenerationJobService.list_user_jobs(db, current_user.id, limit=min(max(limit, 1), 100))
+    return {
+        "success": True,
+        "jobs": [GenerationJobService.to_dict(job, include_result=False) for job in jobs]
+    }
+
+
+@router.get("/{job_id}")
+async def get_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """查询任务状态；成功时包含生成结果"""
+    job = GenerationJobService.get_user_job(db, job_id, current_user.id)
+    if not job:
+        raise HTTPException(
+            status_code=404,
+            detail="任务不存在或无权访问"
+        )
+    return {"success": True, **GenerationJobService.to_dict(job)}
+
+
+@router.get("/{job_id}/events")
+async def job_events(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    订阅任务状态（Server-Sent Events）
+    事件：status（状态变化）、done（成功结果）、error（失败，积分已退还）
+    """
+    job = GenerationJobService.get_user_job(db, job_id, current_user.id)
+    if not job:
+        raise HTTPException(
+            status_code=404,
+            detail="任务不存在或无权访问"
+        )
+    job_key = str(job.id)
+    user_id = current_user.id
+
+    async def event_stream():
+        last_status = None
+        while True:
+            # 每次使用独立会话读取最新状态（请求级会话在流式响应期间可能已关闭）
+            poll_db = SessionLocal()
+            try:
+                current = GenerationJobService.get_user_job(poll_db, job_key, user_id)
+                payload = GenerationJobService.to_dict(current) if current else None
+            finally:
+                poll_db.close()
+
+            if payload is None:
+                yield _sse_event("error", {"success": False, "error": "任务不存在或已删除"})
+                return
+            if payload["status"] == JobStatus.SUCCEEDED:
+                yield _sse_event("done", {"job_id": job_key, **payload["result"]})
+                return
+            if payload["status"] == JobStatus.FAILED:
+                yield _sse_event("error", {"success": False, **payload})
+                return
+            if payload["status"] != last_status:
+                last_status = payload["status"]
+                yield _sse_event("status", payload)
+            else:
+                # 注释行保活，避免代理因长时间无数据断开连接
+                yield ": keep-alive\n\n"
+
+            await generation_job_pool.wait_for_update(
+                job_key, timeout=max(settings.generation_job_poll_interval_seconds, 2.0)
+            )
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
@@ -16,11 +16,12 @@ from ..core.ai_processor import ai_processor
 from ..models.mindmap import Mindmap
 from ..models.user import User
 from ..services.credit_service import CreditService
+from ..services.cache_service import CreditCalculationCache
 from ..services import mindmap_service
 from ..services.mindmap_service import MindmapService
 from .auth import get_current_user
 from .schemas.mindmap_schemas import (
-    MindmapCreate, MindmapResponse, MindmapUpdateRequest, FileGenerateRequest
+    MindmapCreate, MindmapResponse, MindmapUpdateRequest, FileGenerateRequest, MindmapRegenerateRequest
 )
 
 router = APIRouter()
@@ -47,6 +48,8 @@ async def create_mindmap(
             description=mindmap_data.description,
             tags=mindmap_data.tags,
             is_public=mindmap_data.is_public,
+            structure=mindmap_data.structure,
+            source_text=mindmap_data.source_text,
         )
         return mindmap_service.convert_mindmap_to_response(new_mindmap)
         
@@ -188,6 +191,8 @@ async def update_mindmap(
         description=mindmap_data.description,
         tags=mindmap_data.tags,
         is_public=mindmap_data.is_public,
+        structure=mindmap_data.structure,
+        source_text=mindmap_data.source_text,
     )
     return mindmap_service.convert_mindmap_to_response(mindmap)
 
@@ -260,10 +265,103 @@ async def delete_mindmap(
     return  # 204 No Content
 
 
+@router.post("/{mindmap_id}/regenerate")
+async def regenerate_mindmap(
+    request: Request,
+    mindmap_id: str,
+    regenerate_request: MindmapRegenerateRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    源文本修改后重新生成思维导图
+    已保存源文本时只重新生成受修改影响的分支并按发送给模型的内容计费；
+    未保存源文本或修改范围过大时全量生成
+    """
+    from .upload import (
+        new_ai_deadline, calculate_credit_cost, check_and_deduct_credits, get_ai_priority,
+        raise_if_ai_queue_full, raise_if_ai_circuit_open, raise_if_ai_deadline_exceeded
+    )
+    
+    deadline = new_ai_deadline()
+    service = MindmapService(db)
+    mindmap = service.get_for_user(mindmap_id, current_user)
+    if not mindmap:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="思维导图不存在或无权修改"
+        )
+    
+    new_source = regenerate_request.text
+    plan = None
+    if mindmap.source_text:
+        plan = ai_processor.plan_incremental_regeneration(mindmap.source_text, new_source, mindmap.content)
+        if plan is not None and plan.unchanged:
+            return JSONResponse(content={
+                "success": True,
+                "mode": "unchanged",
+                "mindmap": mindmap_service.convert_mindmap_to_response(mindmap).dict(),
+                "cost_info": {"credits_consumed": 0}
+            })
+    
+    # 增量模式只按需要重新生成的源文本计费
+    billed_text = plan.regenerate_text if plan is not None else new_source
+    credit_cost = calculate_credit_cost(billed_text)
+    remaining_balance = check_and_deduct_credits(
+        db, current_user, credit_cost, len(billed_text.strip()),
+        f"重新生成思维导图 - {mindmap.title}, 计费文本长度: {len(billed_text.strip())} 字符"
+    )
+    
+    priority = get_ai_priority(current_user)
+    if plan is not None:
+        result = await ai_processor.regenerate_incremental(
+            plan, user_id=current_user.id, priority=priority, deadline=deadline
+        )
+    else:
+        result = await ai_processor.generate_mindmap_structure(
+            new_source, user_id=current_user.id, priority=priority, deadline=deadline
+        )
+    
+    if not result["success"]:
+        refund_success, refund_error, _ = CreditService.refund_credits(
+            db, current_user.id, credit_cost,
+            f"重新生成思维导图失败退款 - {mindmap.title}, 原因: {result.get('error', 'Unknown error')}"
+        )
+        if not refund_success:
+            print(f"严重错误: 用户 {current_user.id} 的积分退款失败: {refund_error}")
+        raise_if_ai_queue_full(result)
+        raise_if_ai_circuit_open(result)
+        raise_if_ai_deadline_exceeded(result)
+        raise HTTPException(
+            status_code=500,
+            detail=f"思维导图重新生成失败: {result.get('error', 'Unknown error')}"
+        )
+    
+    data = result["data"]
+    mindmap = service.apply_regeneration(
+        mindmap=mindmap, title=data["title"], content=data["markdown"], source_text=new_source
+    )
+    return JSONResponse(content={
+        "success": True,
+        "mode": "incremental" if plan is not None else "full",
+        "mindmap": mindmap_service.convert_mindmap_to_response(mindmap).dict(),
+        "regeneration": {
+            key: data[key] for key in ("regenerated_branches", "removed_branches", "reused_branches") if key in data
+        },
+        "cost_info": {
+            "credits_consumed": credit_cost,
+            "remaining_credits": remaining_balance,
+            "text_length": len(billed_text.strip()),
+            "pricing_rule": CreditCalculationCache.pricing_rule()
+        }
+    })
+
+
 # 新的请求模型
 class FileGenerateRequest(BaseModel):
     """从文件生成思维导图的请求模型"""
     file_token: str
+    output_format: Optional[str] = "markdown"  # markdown/tree
 
 
 @router.post("/generate-from-file")
@@ -277,7 +375,11 @@ async def generate_from_file(
     根据文件token生成思维导图，执行完整的积分扣费流程
     """
     # 导入文件缓存函数
-    from .upload import get_file_data
+    from .upload import get_file_data, new_ai_deadline, normalize_output_format
+    
+    # AI调用总时间预算从请求开始计算
+    deadline = new_ai_deadline()
+    output_format = normalize_output_format(file_request.output_format)
     
     # 获取文件数据
     file_data = get_file_data(file_request.file_token, current_user.id)
@@ -291,7 +393,18 @@ async def generate_from_file(
     filename = file_data['filename']
     file_type = file_data['file_type']
     
-    # 1. 使用缓存的积分成本
+    # 0. 命中AI结果缓存时直接返回，不重复扣费
+    cached_data = await ai_processor.get_cached_result(parsed_content, output_format=output_format)
+    if cached_data:
+        from .upload import cached_generation_response
+        return cached_generation_response(
+            db, current_user, cached_data, parsed_content,
+            extra={"filename": filename, "file_type": file_type}
+        )
+    
+    # 1. 使用缓存的积分成本；AI服务熔断时不扣费直接返回
+    from .upload import ensure_ai_available
+    ensure_ai_available()
     credit_cost = file_data.get('credit_cost')
     if credit_cost is None:
         # 如果缓存中没有积分成本，重新计算
@@ -330,8 +443,12 @@ async def generate_from_file(
     # 4. 调用AI服务生成思维导图
     try:
         # 使用统一的AI生成方法
+        from .upload import (
+            get_ai_priority, raise_if_ai_queue_full, raise_if_ai_circuit_open, raise_if_ai_deadline_exceeded
+        )
         mindmap_result = await ai_processor.generate_mindmap_structure(
-            parsed_content
+            parsed_content, user_id=current_user.id, priority=get_ai_priority(current_user),
+            deadline=deadline, output_format=output_format
         )
         
         if not mindmap_result["success"]:
@@ -346,6 +463,9 @@ async def generate_from_file(
             if not refund_success:
                 print(f"严重错误: 用户 {current_user.id} 的积分退款失败: {refund_error}")
             
+            raise_if_ai_queue_full(mindmap_result)
+            raise_if_ai_circuit_open(mindmap_result)
+            raise_if_ai_deadline_exceeded(mindmap_result)
             raise HTTPException(
                 status_code=500,
                 detail=f"思维导图生成失败: {mindmap_result.get('error', 'Unknown error')}"
@@ -358,12 +478,12 @@ async def generate_from_file(
             "file_type": file_type,
             "content_preview": parsed_content[:200] + "..." if len(parsed_content) > 200 else parsed_content,
             "data": mindmap_result["data"],
-            "format": "markdown",
+            "format": output_format,
             "cost_info": {
                 "credits_consumed": credit_cost,
                 "remaining_credits": remaining_balance,
                 "text_length": len(parsed_content.strip()),
-                "pricing_rule": "每100个字符消耗1积分（向上取整）"
+                "pricing_rule": CreditCalculationCache.pricing_rule()
             }
         })
         
@@ -391,4 +511,62 @@ async def generate_from_file(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"删除思维导图失败: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+@router.post("/generate-from-file/stream")
+async def generate_from_file_stream(
+    request: Request,
+    file_request: FileGenerateRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    根据文件token流式生成思维导图（Server-Sent Events），支持 output_format=tree
+    """
+    from .upload import (
+        get_file_data, calculate_credit_cost, check_and_deduct_credits, stream_mindmap_generation, get_ai_priority,
+        normalize_output_format
+    )
+    output_format = normalize_output_format(file_request.output_format)
+    
+    file_data = get_file_data(file_request.file_token, current_user.id)
+    if not file_data:
+        raise HTTPException(
+            status_code=404,
+            detail="文件token无效、已过期或无权访问"
+        )
+    
+    parsed_content = file_data['content']
+    filename = file_data['filename']
+    
+    # 命中AI结果缓存时不扣费
+    if await ai_processor.get_cached_result(parsed_content, output_format=output_format):
+        credit_cost = 0
+        user_credits = CreditService.get_user_credits(db, current_user.id)
+        remaining_balance = user_credits.balance if user_credits else 0
+    else:
+        credit_cost = file_data.get('credit_cost')
+        if credit_cost is None:
+            credit_cost = calculate_credit_cost(parsed_content)
+        
+        remaining_balance = check_and_deduct_credits(
+            db,
+            current_user,
+            credit_cost,
+            len(parsed_content.strip()),
+            f"文件生成思维导图 - 文件: {filename}, 文本长度: {len(parsed_content.strip())} 字符",
+            filename=filename
+        )
+    
+    return stream_mindmap_generation(
+        user_id=current_user.id,
+        content=parsed_content,
+        style=None,
+        credit_cost=credit_cost,
+        remaining_balance=remaining_balance,
+        refund_label=f"文件AI生成失败退款 - 文件: {filename}",
+        extra={"filename": filename, "file_type": file_data['file_type']},
+        priority=get_ai_priority(current_user),
+        output_format=output_format
+    )
@@ -2,13 +2,20 @@
 Pydantic模型 - 思维导图相关
 """
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, validator, root_validator
 from typing import List, Optional
 
+from app.core.mindmap_tree import normalize_tree, tree_to_markdown
+
 class MindmapCreate(BaseModel):
-    """创建思维导图的请求模型"""
+    """
+    创建思维导图的请求模型
+    content（Markdown）与 structure（JSON 树）至少提供一个；只提供树时由树派生 Markdown
+    """
     title: str
-    content: str
+    content: Optional[str] = None
+    structure: Optional[dict] = None
+    source_text: Optional[str] = None  # 生成所用的源文本，保存后可增量重新生成
     description: Optional[str] = None
     tags: Optional[str] = None  # 逗号分隔的标签
     is_public: bool = False
@@ -23,15 +30,32 @@ class MindmapCreate(BaseModel):
     
     @validator('content')
     def content_must_not_be_empty(cls, v):
-        if not v or not v.strip():
+        if v is None:
+            return v
+        if not v.strip():
             raise ValueError('内容不能为空')
         return v.strip()
+    
+    @validator('structure')
+    def structure_must_be_valid_tree(cls, v):
+        if v is None:
+            return v
+        return normalize_tree(v)
+    
+    @root_validator(skip_on_failure=True)
+    def content_or_structure_required(cls, values):
+        if not values.get('content'):
+            if not values.get('structure'):
+                raise ValueError('内容不能为空')
+            values['content'] = tree_to_markdown(values['structure'])
+        return values
 
 class MindmapResponse(BaseModel):
     """思维导图响应模型"""
     id: str
     title: str
     content: str
+    structure: Optional[dict] = None
     description: Optional[str]
     tags: List[str]
     is_public: bool
@@ -74,6 +98,17 @@ class MindmapUpdateRequest(BaseModel):
             return v.strip()
         return v
 
+class MindmapRegenerateRequest(BaseModel):
+    """源文本修改后重新生成思维导图的请求模型"""
+    text: str
+    
+    @validator('text')
+    def text_must_not_be_empty(cls, v):
+        if not v or not v.strip():
+            raise ValueError('源文本不能为空')
+        return v
+
 class FileGenerateRequest(BaseModel):
     """从文件生成思维导图的请求模型"""
     file_token: str
+    output_format: Optional[str] = "markdown"  # markdown/tree
@@ -3,23 +3,26 @@
 """
 
 import os
+import json
 import math
 import uuid
 import time
 import asyncio
+import tempfile
 from pathlib import Path
 from fastapi import APIRouter, File, UploadFile, HTTPException, BackgroundTasks, Depends, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from app.core.config import settings
-from app.core.file_parser import file_parser
 from app.core.ai_processor import ai_processor
-from app.core.database import get_db
+from app.core.ai_resilience import Deadline
+from app.core.database import get_db, SessionLocal
 from app.models.user import User
 from app.services.credit_service import CreditService
 from app.services.cache_service import FileProcessingCache, CreditCalculationCache
-from typing import Optional, Dict
+from app.services.parse_executor import parse_executor, ParseQueueFullError, ParseTimeoutError
+from typing import Optional, Dict, List
 from functools import lru_cache
 
 router = APIRouter()
@@ -32,6 +35,7 @@ class TextProcessRequest(BaseModel):
     text: str
     format_type: Optional[str] = "standard"
     style: Optional[str] = None  # original/refined
+    output_format: Optional[str] = "markdown"  # markdown/tree
 
 class CreditEstimateRequest(BaseModel):
     text: str
@@ -40,6 +44,16 @@ class FileGenerateRequest(BaseModel):
     file_token: str
     format_type: Optional[str] = "standard"
     style: Optional[str] = None  # original/refined
+    output_format: Optional[str] = "markdown"  # markdown/tree
+
+class BatchItem(BaseModel):
+    text: Optional[str] = None
+    file_token: Optional[str] = None
+    style: Optional[str] = None  # 未指定时使用批次的 style
+
+class BatchProcessRequest(BaseModel):
+    items: List[BatchItem]
+    style: Optional[str] = None  # original/refined
 
 # 确保上传目录存在
 os.makedirs(settings.upload_dir, exist_ok=True)
@@ -51,12 +65,22 @@ class FileValidationService:
     """统一的文件验证服务，消除重复验证逻辑"""
     
     @staticmethod
-    async def validate_upload_file(file: UploadFile) -> tuple[str, bytes]:
+    def _file_too_large() -> HTTPException:
+        return HTTPException(
+            status_code=400,
+            detail=f"文件过大。最大支持 {settings.max_file_size // (1024*1024)} MB"
+        )
+    
+    @staticmethod
+    async def spool_upload_file(file: UploadFile, directory: Optional[str] = None) -> tuple[str, str]:
         """
-        统一的文件验证逻辑
+        统一的文件验证逻辑：校验类型后分块写入临时文件，累计大小一旦超过上限立即拒绝
+        文件不会整体读入内存，解析器直接读取落盘文件
         
+        Args:
+            directory: 落盘目录，默认使用系统临时目录
         Returns:
-            tuple[str, bytes]: (file_extension, file_content)
+            tuple[str, str]: (file_extension, 落盘文件路径)，由调用方负责删除
         """
         # 验证文件类型
         file_ext = Path(file.filename).suffix.lower()
@@ -66,15 +90,58 @@ class FileValidationService:
                 detail=f"不支持的文件类型: {file_ext}。支持的类型: {', '.join(settings.allowed_file_types)}"
             )
         
-        # 验证文件大小
-        file_content = await file.read()
-        if len(file_content) > settings.max_file_size:
-            raise HTTPException(
-                status_code=400,
-                detail=f"文件过大。最大支持 {settings.max_file_size // (1024*1024)} MB"
-            )
+        # 验证文件大小：已知大小时直接判断，否则边写入边累计
+        size = getattr(file, "size", None)
+        if size is not None and size > settings.max_file_size:
+            raise FileValidationService._file_too_large()
+        
+        fd, path = tempfile.mkstemp(suffix=file_ext, dir=directory)
+        written = 0
+        try:
+            with os.fdopen(fd, "wb") as spooled:
+                while True:
+                    chunk = await file.read(settings.upload_chunk_size)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    if written > settings.max_file_size:
+                        raise FileValidationService._file_too_large()
+                    await asyncio.to_thread(spooled.write, chunk)
+        except BaseException:
+            os.remove(path)
+            raise
         
-        return file_ext, file_content
+        return file_ext, path
+
+async def parse_uploaded_file(upload_path: str, filename: str) -> tuple:
+    """
+    在解析进程池中解析已落盘的上传文件，不阻塞事件循环；解析结束后删除该文件
+    
+    Returns:
+        tuple: (解析后的文本, 解析报告)；排队已满时返回 503，解析超时返回 422
+    """
+    try:
+        return await parse_executor.parse(upload_path, filename)
+    except ParseQueueFullError:
+        raise HTTPException(
+            status_code=503,
+            detail={
+                "message": "文件解析繁忙，请稍后重试",
+                "code": "PARSE_QUEUE_FULL",
+                "retry_after": 5
+            },
+            headers={"Retry-After": "5"}
+        )
+    except ParseTimeoutError as e:
+        raise HTTPException(
+            status_code=422,
+            detail=f"文件解析超时，文件可能过大或结构过于复杂: {str(e)}"
+        )
+    finally:
+        try:
+            os.remove(upload_path)
+        except OSError:
+            pass
 
 class RequestCacheService:
     """请求级缓存服务，减少重复数据库查询"""
@@ -134,7 +201,7 @@ def get_file_data(file_token: str, user_id: int) -> Optional[Dict]:
 def calculate_credit_cost(text: str) -> int:
     """
     统一的积分成本计算方法
-    计费规则：每100个字符消耗1个积分（向上取整）
+    计费规则：每100个字符消耗1个积分（向上取整），可通过 CREDIT_PRICING_UNIT 改为按 token 计费
     使用缓存优化重复计算
     
     Args:
@@ -145,6 +212,188 @@ def calculate_credit_cost(text: str) -> int:
     """
     return CreditCalculationCache.calculate_credit_cost_cached(text)
 
+def check_and_deduct_credits(db: Session, user: User, credit_cost: int, text_length: int,
+                             description: str, filename: Optional[str] = None) -> int:
+    """
+    检查积分是否充足并扣除，失败时抛出对应的HTTP异常
+    
+    Returns:
+        int: 扣除后的剩余积分
+    """
+    ensure_ai_available()
+    user_credits = CreditService.get_user_credits(db, user.id)
+    if not user_credits or user_credits.balance < credit_cost:
+        current_balance = user_credits.balance if user_credits else 0
+        detail = {
+            "message": "积分不足",
+            "required_credits": credit_cost,
+            "current_balance": current_balance,
+            "text_length": text_length
+        }
+        if filename:
+            detail["filename"] = filename
+        raise HTTPException(
+            status_code=402,  # Payment Required
+            detail=detail
+        )
+    
+    deduct_success, deduct_error, remaining_balance = CreditService.deduct_credits(
+        db, user.id, credit_cost, description
+    )
+    if not deduct_success:
+        raise HTTPException(
+            status_code=500,
+            detail=f"积分扣除失败: {deduct_error}"
+        )
+    return remaining_balance
+
+def normalize_output_format(output_format: Optional[str]) -> str:
+    """输出格式：tree（JSON 树，附派生的 Markdown）或默认的 markdown"""
+    return "tree" if output_format == "tree" else "markdown"
+
+def get_ai_priority(user: User) -> int:
+    """
+    AI 排队的调度权重：排队时每轮可连续获得的许可数
+    目前仅管理员享有更高权重，付费套餐上线后在此扩展
+    """
+    return settings.ai_priority_weight if user.is_superuser else 1
+
+def raise_if_ai_queue_full(mindmap_result: Dict) -> None:
+    """AI排队已满时返回 429 并附带 Retry-After，而不是让请求一直挂起"""
+    if mindmap_result.get("code") == "AI_QUEUE_FULL":
+        retry_after = mindmap_result.get("retry_after", 5)
+        raise HTTPException(
+            status_code=429,
+            detail={
+                "message": "AI服务繁忙，请稍后重试",
+                "code": "AI_QUEUE_FULL",
+                "retry_after": retry_after
+            },
+            headers={"Retry-After": str(retry_after)}
+        )
+
+def _ai_unavailable_exception(retry_after: int, message: str = "AI服务暂时不可用，请稍后重试") -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail={
+            "message": message,
+            "code": "AI_TEMPORARY_UNAVAILABLE",
+            "retry_after": retry_after
+        },
+        headers={"Retry-After": str(retry_after)}
+    )
+
+def ensure_ai_available() -> None:
+    """AI熔断器打开时在扣费前直接返回 503，避免扣费、重试、退款的无效往返"""
+    retry_after = ai_processor.circuit_retry_after()
+    if retry_after is not None:
+        raise _ai_unavailable_exception(retry_after)
+
+def raise_if_ai_circuit_open(mindmap_result: Dict) -> None:
+    """扣费后熔断器才打开（请求被直接拒绝）时同样返回 503（积分已由调用方退还）"""
+    if mindmap_result.get("code") == "AI_TEMPORARY_UNAVAILABLE" and "retry_after" in mindmap_result:
+        raise _ai_unavailable_exception(mindmap_result["retry_after"], mindmap_result.get("error"))
+
+def raise_if_ai_deadline_exceeded(mindmap_result: Dict) -> None:
+    """AI调用超出请求时间预算时返回 504（积分已由调用方退还）"""
+    if mindmap_result.get("code") == "AI_DEADLINE_EXCEEDED":
+        raise HTTPException(
+            status_code=504,
+            detail={
+                "message": mindmap_result.get("error", "AI服务响应超时，请稍后重试"),
+                "code": "AI_DEADLINE_EXCEEDED"
+            }
+        )
+
+def new_ai_deadline() -> Deadline:
+    """为一次接口请求创建AI调用总时间预算（排队、重试与退避共享）"""
+    return Deadline(settings.ai_request_budget_seconds)
+
+def cached_generation_response(db: Session, user: User, cached_data: Dict, content: str,
+                               extra: Optional[Dict] = None) -> JSONResponse:
+    """
+    AI结果缓存命中时的响应：直接返回已生成的思维导图，不扣除积分
+    """
+    user_credits = CreditService.get_user_credits(db, user.id)
+    payload = {
+        "success": True,
+        "content_preview": content[:200] + "..." if len(content) > 200 else content,
+        "data": cached_data,
+        "format": cached_data.get("format", "markdown"),
+        "cached": True,
+        "cost_info": {
+            "credits_consumed": 0,
+            "remaining_credits": user_credits.balance if user_credits else 0,
+            "text_length": len(content.strip())
+        }
+    }
+    if extra:
+        payload.update(extra)
+    return JSONResponse(content=payload)
+
+def _sse_event(event: str, data: dict) -> str:
+    """格式化一条 Server-Sent Events 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def stream_mindmap_generation(user_id: int, content: str, style: Optional[str], credit_cost: int,
+                              remaining_balance: int, refund_label: str,
+                              extra: Optional[Dict] = None, priority: int = 1,
+                              output_format: str = "markdown") -> StreamingResponse:
+    """
+    以 SSE 流式推送思维导图生成过程（积分已在调用前扣除）
+    
+    事件：progress（分块/大纲生成时每完成一个分块或分支）、line（单行已校验的Markdown）、
+    done（最终结果，output_format=tree 时含 data.tree）、error（失败，积分已退还）
+    生成失败或客户端中途断开时自动退还积分。
+    """
+    async def event_stream():
+        succeeded = False
+        try:
+            async for event in ai_processor.generate_mindmap_stream(
+                content, style=style, user_id=user_id, priority=priority, deadline=new_ai_deadline(),
+                output_format=output_format
+            ):
+                if event["event"] == "done":
+                    succeeded = True
+                    payload = {
+                        "success": True,
+                        "data": event["data"],
+                        "format": output_format,
+                        "cost_info": {
+                            "credits_consumed": credit_cost,
+                            "remaining_credits": remaining_balance,
+                            "text_length": len(content.strip())
+                        }
+                    }
+                    if extra:
+                        payload.update(extra)
+                    yield _sse_event("done", payload)
+                elif event["event"] == "error":
+                    yield _sse_event("error", {"success": False, **event["data"]})
+                else:
+                    yield _sse_event(event["event"], event["data"])
+        finally:
+            if not succeeded and credit_cost > 0:
+                # 请求级会话可能已关闭，退款使用独立会话
+                db = SessionLocal()
+                try:
+                    refund_success, refund_error, _ = CreditService.refund_credits(
+                        db, user_id, credit_cost, f"{refund_label} - 流式生成未完成"
+                    )
+                    if not refund_success:
+                        print(f"严重错误: 用户 {user_id} 的积分退款失败: {refund_error}")
+                finally:
+                    db.close()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 禁止反向代理缓冲，保证逐行推送
+        }
+    )
+
 @router.post("/upload")
 async def upload_file(
     request: Request,
@@ -152,19 +401,25 @@ async def upload_file(
     file: UploadFile = File(...),
     format_type: str = "standard",
     style: Optional[str] = None,
+    output_format: Optional[str] = "markdown",
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     文件上传和处理API
     支持的格式: txt, md, docx, pdf, srt
+    output_format=tree 时返回 JSON 树（data.tree）
     """
+    # AI调用总时间预算从请求开始计算
+    deadline = new_ai_deadline()
+    output_format = normalize_output_format(output_format)
+    
     # 使用统一的文件验证服务
-    file_ext, file_content = await FileValidationService.validate_upload_file(file)
+    file_ext, upload_path = await FileValidationService.spool_upload_file(file)
     
     try:
         # 解析文件内容
-        parsed_content = file_parser.parse_from_bytes(file_content, file.filename)
+        parsed_content, parse_report = await parse_uploaded_file(upload_path, file.filename)
         
         if not parsed_content:
             raise HTTPException(
@@ -172,7 +427,16 @@ async def upload_file(
                 detail="文件解析失败，请检查文件内容"
             )
         
-        # 1. 计算积分成本（基于解析后的文本内容）
+        # 0. 命中AI结果缓存时直接返回，不重复扣费
+        cached_data = await ai_processor.get_cached_result(parsed_content, style=style, output_format=output_format)
+        if cached_data:
+            return cached_generation_response(
+                db, current_user, cached_data, parsed_content,
+                extra={"filename": file.filename, "file_type": file_ext}
+            )
+        
+        # 1. 计算积分成本（基于解析后的文本内容）；AI服务熔断时不扣费直接返回
+        ensure_ai_available()
         credit_cost = calculate_credit_cost(parsed_content)
         
         # 2. 检查用户积分是否充足
@@ -207,7 +471,9 @@ async def upload_file(
         # 4. 调用AI服务生成思维导图（使用try-except处理失败情况）
         try:
             mindmap_result = await ai_processor.generate_mindmap_structure(
-                parsed_content, style=style
+                parsed_content, style=style,
+                user_id=current_user.id, priority=get_ai_priority(current_user),
+                deadline=deadline, output_format=output_format
             )
             
             if not mindmap_result["success"]:
@@ -222,6 +488,9 @@ async def upload_file(
                 if not refund_success:
                     print(f"严重错误: 用户 {current_user.id} 的积分退款失败: {refund_error}")
                 
+                raise_if_ai_queue_full(mindmap_result)
+                raise_if_ai_circuit_open(mindmap_result)
+                raise_if_ai_deadline_exceeded(mindmap_result)
                 error_detail = mindmap_result.get('error', 'Unknown error')
                 
                 # 为用户提供更友好的错误信息
@@ -244,7 +513,8 @@ async def upload_file(
                 "file_type": file_ext,
                 "content_preview": parsed_content[:200] + "..." if len(parsed_content) > 200 else parsed_content,
                 "data": mindmap_result["data"],
-                "format": "markdown",
+                "format": output_format,
+                "parse_report": parse_report,
                 "cost_info": {
                     "credits_consumed": credit_cost,
                     "remaining_credits": remaining_balance,
@@ -292,13 +562,24 @@ async def process_text(
     直接处理文本内容生成思维导图
     包含积分检查和扣除逻辑
     """
+    deadline = new_ai_deadline()
+    
     if not text_request.text.strip():
         raise HTTPException(
             status_code=400,
             detail="文本内容不能为空"
         )
     
-    # 1. 计算积分成本
+    # 0. 命中AI结果缓存时直接返回，不重复扣费
+    output_format = normalize_output_format(text_request.output_format)
+    cached_data = await ai_processor.get_cached_result(
+        text_request.text, style=text_request.style, output_format=output_format
+    )
+    if cached_data:
+        return cached_generation_response(db, current_user, cached_data, text_request.text)
+    
+    # 1. 计算积分成本；AI服务熔断时不扣费直接返回
+    ensure_ai_available()
     credit_cost = calculate_credit_cost(text_request.text)
     
     # 2. 检查用户积分是否充足
@@ -332,7 +613,9 @@ async def process_text(
     # 4. 调用AI服务生成思维导图（使用try-except处理失败情况）
     try:
         mindmap_result = await ai_processor.generate_mindmap_structure(
-            text_request.text, style=text_request.style
+            text_request.text, style=text_request.style,
+            user_id=current_user.id, priority=get_ai_priority(current_user),
+            deadline=deadline, output_format=output_format
         )
         
         if not mindmap_result["success"]:
@@ -348,6 +631,9 @@ async def process_text(
                 # 记录退款失败的严重错误
                 print(f"严重错误: 用户 {current_user.id} 的积分退款失败: {refund_error}")
             
+            raise_if_ai_queue_full(mindmap_result)
+            raise_if_ai_circuit_open(mindmap_result)
+            raise_if_ai_deadline_exceeded(mindmap_result)
             error_detail = mindmap_result.get('error', 'Unknown error')
             
             # 为用户提供更友好的错误信息
@@ -368,7 +654,7 @@ async def process_text(
             "success": True,
             "content_preview": request.text[:200] + "..." if len(request.text) > 200 else request.text,
             "data": mindmap_result["data"],
-            "format": "markdown",
+            "format": output_format,
             "cost_info": {
                 "credits_consumed": credit_cost,
                 "remaining_credits": remaining_balance,
@@ -396,6 +682,262 @@ async def process_text(
             detail=f"处理失败: {str(e)}"
         )
 
+@router.post("/process-text/stream")
+async def process_text_stream(
+    request: Request,
+    text_request: TextProcessRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    流式处理文本内容生成思维导图（Server-Sent Events）
+    逐行推送通过校验的节点，最终 done 事件中的结果与 /process-text 一致（支持 output_format=tree）
+    """
+    if not text_request.text.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="文本内容不能为空"
+        )
+    output_format = normalize_output_format(text_request.output_format)
+    
+    # 命中AI结果缓存时不扣费
+    if await ai_processor.get_cached_result(text_request.text, style=text_request.style, output_format=output_format):
+        credit_cost = 0
+        user_credits = CreditService.get_user_credits(db, current_user.id)
+        remaining_balance = user_credits.balance if user_credits else 0
+    else:
+        credit_cost = calculate_credit_cost(text_request.text)
+        remaining_balance = check_and_deduct_credits(
+            db,
+            current_user,
+            credit_cost,
+            len(text_request.text.strip()),
+            f"生成思维导图 - 文本长度: {len(text_request.text.strip())} 字符"
+        )
+    
+    return stream_mindmap_generation(
+        user_id=current_user.id,
+        content=text_request.text,
+        style=text_request.style,
+        credit_cost=credit_cost,
+        remaining_balance=remaining_balance,
+        refund_label="AI生成失败退款",
+        priority=get_ai_priority(current_user),
+        output_format=output_format
+    )
+
+@router.post("/upload/stream")
+async def upload_file_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    style: Optional[str] = None,
+    output_format: Optional[str] = "markdown",
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    流式文件上传和处理（Server-Sent Events）
+    支持的格式: txt, md, docx, pdf, srt
+    output_format=tree 时 done 事件返回 JSON 树（data.tree）
+    """
+    output_format = normalize_output_format(output_format)
+    file_ext, upload_path = await FileValidationService.spool_upload_file(file)
+    
+    try:
+        parsed_content, parse_report = await parse_uploaded_file(upload_path, file.filename)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"处理失败: {str(e)}"
+        )
+    if not parsed_content:
+        raise HTTPException(
+            status_code=400,
+            detail="文件解析失败，请检查文件内容"
+        )
+    
+    # 命中AI结果缓存时不扣费
+    if await ai_processor.get_cached_result(parsed_content, style=style, output_format=output_format):
+        credit_cost = 0
+        user_credits = CreditService.get_user_credits(db, current_user.id)
+        remaining_balance = user_credits.balance if user_credits else 0
+    else:
+        credit_cost = calculate_credit_cost(parsed_content)
+        remaining_balance = check_and_deduct_credits(
+            db,
+            current_user,
+            credit_cost,
+            len(parsed_content.strip()),
+            f"文件生成思维导图 - 文件: {file.filename}, 文本长度: {len(parsed_content.strip())} 字符",
+            filename=file.filename
+        )
+    
+    return stream_mindmap_generation(
+        user_id=current_user.id,
+        content=parsed_content,
+        style=style,
+        credit_cost=credit_cost,
+        remaining_balance=remaining_balance,
+        refund_label=f"文件AI生成失败退款 - 文件: {file.filename}",
+        extra={"filename": file.filename, "file_type": file_ext, "parse_report": parse_report},
+        priority=get_ai_priority(current_user),
+        output_format=output_format
+    )
+
+@router.post("/process-batch")
+async def process_batch(
+    request: Request,
+    batch_request: BatchProcessRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    批量生成思维导图（Server-Sent Events）
+    一次性预估总成本并在单个事务中扣除，条目在全局限流器下并发生成，
+    每完成一条推送一个 item 事件；失败条目的积分在结束时一次性退还
+    
+    事件：item（单条结果，index 对应请求中的位置）、done（汇总）
+    """
+    items = batch_request.items
+    if not items:
+        raise HTTPException(
+            status_code=400,
+            detail="批量条目不能为空"
+        )
+    if len(items) > settings.batch_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次最多提交 {settings.batch_max_items} 条"
+        )
+    
+    # 1. 解析条目内容并计算成本（命中AI结果缓存的条目不计费）
+    resolved = []
+    for index, item in enumerate(items):
+        style = item.style or batch_request.style
+        entry = {"index": index, "style": style, "filename": None}
+        if item.file_token:
+            file_data = get_file_data(item.file_token, current_user.id)
+            if not file_data:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"第 {index + 1} 条的文件token无效、已过期或无权访问"
+                )
+            entry["content"] = file_data["content"]
+            entry["filename"] = file_data["filename"]
+            entry["credit_cost"] = file_data.get("credit_cost")
+        else:
+            entry["content"] = item.text or ""
+            entry["credit_cost"] = None
+        if not entry["content"].strip():
+            raise HTTPException(
+                status_code=400,
+                detail=f"第 {index + 1} 条的文本内容不能为空"
+            )
+        if await ai_processor.get_cached_result(entry["content"], style=style):
+            entry["credit_cost"] = 0
+        elif entry["credit_cost"] is None:
+            entry["credit_cost"] = calculate_credit_cost(entry["content"])
+        resolved.append(entry)
+    
+    # 2. 一次检查、一次扣除
+    total_cost = sum(entry["credit_cost"] for entry in resolved)
+    total_length = sum(len(entry["content"].strip()) for entry in resolved)
+    if total_cost > 0:
+        remaining_balance = check_and_deduct_credits(
+            db,
+            current_user,
+            total_cost,
+            total_length,
+            f"批量生成思维导图 - {len(resolved)} 条, 文本长度: {total_length} 字符"
+        )
+    else:
+        user_credits = CreditService.get_user_credits(db, current_user.id)
+        remaining_balance = user_credits.balance if user_credits else 0
+    
+    user_id = current_user.id
+    priority = get_ai_priority(current_user)
+    
+    async def generate_item(entry: Dict, semaphore: asyncio.Semaphore) -> tuple:
+        # 限制单个批次同时排队的条目数，避免占满该用户的排队名额
+        async with semaphore:
+            try:
+                result = await ai_processor.generate_mindmap_structure(
+                    entry["content"], style=entry["style"],
+                    user_id=user_id, priority=priority, deadline=new_ai_deadline()
+                )
+            except Exception as e:
+                result = {"success": False, "error": f"AI处理失败: {str(e)}", "code": "AI_ERROR"}
+        return entry, result
+    
+    async def event_stream():
+        semaphore = asyncio.Semaphore(max(1, settings.batch_max_concurrency))
+        tasks = [asyncio.create_task(generate_item(entry, semaphore)) for entry in resolved]
+        settled = set()
+        refund_amount = 0
+        succeeded_count = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                entry, result = await next_done
+                settled.add(entry["index"])
+                payload = {
+                    "index": entry["index"],
+                    "success": result["success"],
+                    "credits_consumed": entry["credit_cost"] if result["success"] else 0
+                }
+                if entry["filename"]:
+                    payload["filename"] = entry["filename"]
+                if result["success"]:
+                    succeeded_count += 1
+                    payload["data"] = result["data"]
+                    payload["format"] = "markdown"
+                else:
+                    refund_amount += entry["credit_cost"]
+                    payload["error"] = result.get("error", "Unknown error")
+                    payload["code"] = result.get("code", "AI_ERROR")
+                yield _sse_event("item", payload)
+            
+            yield _sse_event("done", {
+                "success": True,
+                "total": len(resolved),
+                "succeeded": succeeded_count,
+                "failed": len(resolved) - succeeded_count,
+                "cost_info": {
+                    "credits_consumed": total_cost - refund_amount,
+                    "credits_refunded": refund_amount,
+                    "remaining_credits": remaining_balance + refund_amount,
+                    "text_length": total_length
+                }
+            })
+        finally:
+            for task in tasks:
+                task.cancel()
+            # 未完成（客户端断开）与失败的条目一并退款
+            refund_amount += sum(
+                entry["credit_cost"] for entry in resolved if entry["index"] not in settled
+            )
+            if refund_amount > 0:
+                refund_db = SessionLocal()
+                try:
+                    refund_success, refund_error, _ = CreditService.refund_credits(
+                        refund_db, user_id, refund_amount,
+                        f"批量生成失败退款 - {len(resolved) - succeeded_count} 条未成功"
+                    )
+                    if not refund_success:
+                        print(f"严重错误: 用户 {user_id} 的积分退款失败: {refund_error}")
+                finally:
+                    refund_db.close()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
 @router.post("/estimate-credit-cost")
 async def estimate_credit_cost(
     request: Request,
@@ -409,6 +951,7 @@ async def estimate_credit_cost(
     if not cost_request.text.strip():
         return JSONResponse(content={
             "text_length": 0,
+            "estimated_tokens": 0,
             "estimated_cost": 0,
             "user_balance": 0,
             "sufficient_credits": True
@@ -416,6 +959,8 @@ async def estimate_credit_cost(
     
     # 计算积分成本
     credit_cost = calculate_credit_cost(cost_request.text)
+    # 模型实际处理的 token 数（提供方计数，失败时为本地估算）
+    estimated_tokens = await ai_processor.count_tokens(cost_request.text)
     
     # 获取用户当前积分余额
     user_credits = CreditService.get_user_credits(db, current_user.id)
@@ -423,10 +968,11 @@ async def estimate_credit_cost(
     
     return JSONResponse(content={
         "text_length": len(cost_request.text.strip()),
+        "estimated_tokens": estimated_tokens,
         "estimated_cost": credit_cost,
         "user_balance": current_balance,
         "sufficient_credits": current_balance >= credit_cost,
-        "pricing_rule": "每100个字符消耗1积分（向上取整）"
+        "pricing_rule": CreditCalculationCache.pricing_rule()
     })
 
 @router.post("/upload/analyze")
@@ -445,10 +991,10 @@ async def analyze_file(
     
     try:
         # 使用统一的文件验证服务
-        file_ext, file_content = await FileValidationService.validate_upload_file(file)
+        file_ext, upload_path = await FileValidationService.spool_upload_file(file)
         
         # 1. 解析文件内容
-        parsed_content = file_parser.parse_from_bytes(file_content, file.filename)
+        parsed_content, parse_report = await parse_uploaded_file(upload_path, file.filename)
         
         if not parsed_content:
             raise HTTPException(
@@ -483,11 +1029,14 @@ async def analyze_file(
                 "estimated_cost": credit_cost,
                 "user_balance": current_balance,
                 "sufficient_credits": current_balance >= credit_cost,
-                "pricing_rule": "每100个字符消耗1积分（向上取整）"
+                "pricing_rule": CreditCalculationCache.pricing_rule(),
+                "parse_report": parse_report
             },
             "expires_in": 3600  # 1小时后过期
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -0,0 +1,324 @@
+"""
+AI 模型后端：GeminiProcessor 通过统一接口调用模型
+- GeminiBackend：Google Gemini（含安全过滤设置与多 Key 轮换），
+  基于 google.ai.generativelanguage 的公开异步客户端，每个 Key 独立配置
+- FakeBackend：本地确定性假模型，可配置延迟、错误率与 429 突发，用于离线压测与度量后端自身开销
+通过 AI_BACKEND 配置选择
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import google.ai.generativelanguage as glm
+
+from app.core.ai_key_pool import ApiKeyPool, KeySlot
+from app.core.config import settings
+
+
+class ModelBackend(ABC):
+    """
+    模型后端接口
+    generate 返回带 text 属性的响应对象；stream 逐个产出非空文本分片（子类必须实现这两个方法）
+    超时、重试、并发控制由调用方负责，后端只负责单次调用
+    """
+
+    name = "base"
+    model_name = ""
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    async def generate(self, prompt: str, generation_config: Optional[Dict[str, Any]] = None) -> Any:
+        """单次调用模型，返回带 text 属性的响应对象"""
+
+    @abstractmethod
+    def stream(self, prompt: str) -> AsyncIterator[str]:
+        """流式调用模型（异步生成器），逐个产出非空文本分片"""
+
+    async def count_tokens(self, text: str) -> Optional[int]:
+        """提供方计数的 token 数；不支持时返回 None，由调用方使用本地估算"""
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class GeminiResponse:
+    """GenerateContentResponse 的包装：与 SDK 响应一样通过 text 取结果，无候选内容（被拦截）时抛出 ValueError"""
+
+    def __init__(self, response: Any):
+        self.raw = response
+
+    @property
+    def text(self) -> str:
+        candidates = self.raw.candidates
+        if not candidates:
+            reason = self.raw.prompt_feedback.block_reason
+            raise ValueError(f"模型未返回内容，提示词被拦截: {getattr(reason, 'name', reason)}")
+        parts = candidates[0].content.parts
+        if not parts:
+            reason = candidates[0].finish_reason
+            raise ValueError(f"模型未返回内容，结束原因: {getattr(reason, 'name', reason)}")
+        return "".join(part.text for part in parts)
+
+
+class GeminiKeyClient:
+    """
+    单个 API Key 的客户端：通过 google.ai.generativelanguage 的公开异步客户端按 Key 单独配置，
+    不依赖 SDK 的全局 genai.configure
+    异步客户端绑定事件循环，首次使用时才创建
+    """
+
+    def __init__(self, api_key: str):
+        self._client_options = {"api_key": api_key}
+        self._generative = None
+
+    @property
+    def generative(self):
+        if self._generative is None:
+            self._generative = glm.GenerativeServiceAsyncClient(client_options=self._client_options)
+        return self._generative
+
+
+class GeminiBackend(ModelBackend):
+    """Google Gemini 后端：每个 Key 一个客户端，所有使用 Key 的调用（生成、计数）都经过 Key 池"""
+
+    name = "gemini"
+    model_name = 'gemini-1.5-flash'
+
+    # 安全过滤设置（仅拦截高风险内容）
+    _safety_settings = [
+        glm.SafetySetting(category=category, threshold=glm.SafetySetting.HarmBlockThreshold.BLOCK_ONLY_HIGH)
+        for category in (
+            glm.HarmCategory.HARM_CATEGORY_HARASSMENT,
+            glm.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
+            glm.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
+            glm.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
+        )
+    ]
+
+    # 触发 Key 冷却的限流/配额错误关键字
+    _rate_limit_keywords = ("429", "RESOURCE_EXHAUSTED", "QUOTA_EXCEEDED", "Rate limit", "rate limit")
+
+    def __init__(self, api_keys: List[str]):
+        print(f"API密钥状态: {f'已设置 {len(api_keys)} 个' if api_keys else '未设置'}")
+        self._key_pool: Optional[ApiKeyPool] = None
+        if api_keys:
+            self._key_pool = ApiKeyPool(
+                [KeySlot(key, GeminiKeyClient(key), settings.ai_key_requests_per_minute) for key in api_keys],
+                cooldown_seconds=settings.ai_key_cooldown_seconds,
+                max_cooldown_seconds=settings.ai_key_max_cooldown_seconds,
+            )
+            for slot in self._key_pool.slots:
+                print(f"API密钥前6位: {slot.label}")
+            print("Gemini 模型初始化成功")
+        else:
+            print("警告: Gemini API密钥未设置，AI功能将不可用")
+
+    @property
+    def _model_path(self) -> str:
+        return f"models/{self.model_name}"
+
+    @staticmethod
+    def _contents(text: str) -> List[Any]:
+        return [glm.Content(role="user", parts=[glm.Part(text=text)])]
+
+    def _request(self, text: str, generation_config: Optional[Dict[str, Any]] = None) -> Any:
+        fields: Dict[str, Any] = {
+            "model": self._model_path,
+            "contents": self._contents(text),
+            "safety_settings": self._safety_settings,
+        }
+        if generation_config:
+            fields["generation_config"] = glm.GenerationConfig(**generation_config)
+        return glm.GenerateContentRequest(**fields)
+
+    @property
+    def available(self) -> bool:
+        return self._key_pool is not None
+
+    async def generate(self, prompt: str, generation_config: Optional[Dict[str, Any]] = None) -> Any:
+        slot = self._key_pool.acquire()
+        try:
+            response = await self._generate_with_key(slot, prompt, generation_config)
+        except Exception as e:
+            self._report_failure(slot, e)
+            raise
+        self._key_pool.report_success(slot)
+        return GeminiResponse(response)
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        slot = self._key_pool.acquire()
+        try:
+            responses = await self._generate_with_key(slot, prompt, None, stream=True)
+            async for response in responses:
+                try:
+                    text = GeminiResponse(response).text
+                except ValueError:
+                    # 流式分片可能不含文本（如只携带结束原因或安全评级）
+                    continue
+                if text:
+                    yield text
+        except Exception as e:
+            self._report_failure(slot, e)
+            raise
+        self._key_pool.report_success(slot)
+
+    async def _generate_with_key(self, slot: KeySlot, prompt: str, generation_config: Optional[Dict[str, Any]],
+                                 stream: bool = False) -> Any:
+        client = slot.client.generative
+        call = client.stream_generate_content if stream else client.generate_content
+        return await call(request=self._request(prompt, generation_config))
+
+    async def count_tokens(self, text: str) -> Optional[int]:
+        if self._key_pool is None:
+            return None
+        slot = self._key_pool.acquire()
+        try:
+            response = await slot.client.generative.count_tokens(
+                request=glm.CountTokensRequest(model=self._model_path, contents=self._contents(text))
+            )
+        except Exception as e:
+            self._report_failure(slot, e)
+            raise
+        self._key_pool.report_success(slot)
+        return response.total_tokens
+
+    def _report_failure(self, slot: KeySlot, e: Exception) -> None:
+        message = str(e)
+        if any(k in message for k in self._rate_limit_keywords):
+            self._key_pool.report_rate_limited(slot)
+        else:
+            self._key_pool.report_error(slot)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "keys": self._key_pool.get_stats() if self._key_pool else [],
+        }
+
+
+class FakeResponse:
+    """假模型响应（与 Gemini 响应一样通过 text 取结果）"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeBackend(ModelBackend):
+    """
+    本地确定性假模型：不访问网络，相同提示词总是得到相同输出
+    - 输出由 <user_content> 内的文本派生：首行为根标题，每段为一个二级分支，段内各句为列表项
+    - JSON 输出模式（response_mime_type=application/json）返回同构的 {title, children} 树
+    - latency_seconds ± latency_jitter_seconds 模拟模型延迟；error_rate 概率返回可重试的 503
+    - burst_interval > 0 时每 burst_interval 次调用后连续 burst_length 次返回 429，模拟上游限流
+    随机数使用固定种子，同一调用序列的延迟与错误可复现
+    """
+
+    name = "fake"
+    model_name = "fake-mindmap"
+
+    _user_content = re.compile(r'<user_content>\n(.*)\n</user_content>', re.DOTALL)
+    _sentence_split = re.compile(r'(?<=[。！？!?；;.])\s*')
+    max_branches = 20
+    max_items = 8
+    stream_chunk_lines = 3
+
+    def __init__(self, latency_seconds: float = 1.0, latency_jitter_seconds: float = 0.0,
+                 error_rate: float = 0.0, burst_interval: int = 0, burst_length: int = 0, seed: int = 0):
+        self.latency_seconds = max(0.0, latency_seconds)
+        self.latency_jitter_seconds = max(0.0, latency_jitter_seconds)
+        self.error_rate = min(max(error_rate, 0.0), 1.0)
+        self.burst_interval = max(0, burst_interval)
+        self.burst_length = max(0, burst_length)
+        self._random = random.Random(seed)
+        self._calls = 0
+        self._stats = {"calls": 0, "errors": 0, "rate_limited": 0}
+        print(f"使用本地假模型后端：延迟 {self.latency_seconds}s±{self.latency_jitter_seconds}s，"
+              f"错误率 {self.error_rate}，429 突发 {self.burst_length}/{self.burst_interval}")
+
+    async def generate(self, prompt: str, generation_config: Optional[Dict[str, Any]] = None) -> FakeResponse:
+        await self._simulate_call()
+        tree = self._build_tree(prompt)
+        if generation_config and generation_config.get("response_mime_type") == "application/json":
+            return FakeResponse(json.dumps(tree, ensure_ascii=False))
+        return FakeResponse(self._render_markdown(tree))
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        await self._simulate_call()
+        lines = self._render_markdown(self._build_tree(prompt)).split('\n')
+        for start in range(0, len(lines), self.stream_chunk_lines):
+            if start:
+                await asyncio.sleep(0)
+            yield '\n'.join(lines[start:start + self.stream_chunk_lines]) + '\n'
+
+    async def _simulate_call(self) -> None:
+        self._calls += 1
+        self._stats["calls"] += 1
+        delay = self.latency_seconds
+        if self.latency_jitter_seconds:
+            delay = max(0.0, delay + self._random.uniform(-self.latency_jitter_seconds, self.latency_jitter_seconds))
+        fail = self.error_rate and self._random.random() < self.error_rate
+        if delay:
+            await asyncio.sleep(delay)
+        if self.burst_interval and self.burst_length:
+            position = (self._calls - 1) % (self.burst_interval + self.burst_length)
+            if position >= self.burst_interval:
+                self._stats["rate_limited"] += 1
+                raise RuntimeError("429 Rate limit exceeded (fake backend burst)")
+        if fail:
+            self._stats["errors"] += 1
+            raise RuntimeError("503 UNAVAILABLE: fake backend error, please Retry")
+
+    def _build_tree(self, prompt: str) -> Dict[str, Any]:
+        match = self._user_content.search(prompt)
+        text = match.group(1) if match else prompt
+        paragraphs = [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
+        if not paragraphs:
+            return {"title": "空内容", "children": [{"title": "无可用内容", "children": []}]}
+        first_line, _, rest = paragraphs[0].partition('\n')
+        title = first_line.strip('# ').strip()[:60] or "思维导图"
+        if rest.strip():
+            paragraphs[0] = rest
+        else:
+            paragraphs = paragraphs[1:] or [first_line]
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:8]
+        children: List[Dict[str, Any]] = []
+        for index, paragraph in enumerate(paragraphs[:self.max_branches], start=1):
+            sentences = [s.strip() for s in self._sentence_split.split(' '.join(paragraph.split())) if s.strip()]
+            children.append({
+                "title": f"第{index}部分 {sentences[0][:30] if sentences else digest}",
+                "children": [{"title": s[:120], "children": []} for s in sentences[:self.max_items]],
+            })
+        return {"title": title, "children": children}
+
+    @staticmethod
+    def _render_markdown(tree: Dict[str, Any]) -> str:
+        lines = [f"# {tree['title']}"]
+        for branch in tree["children"]:
+            lines.append(f"## {branch['title']}")
+            lines.extend(f"- {item['title']}" for item in branch["children"])
+        return '\n'.join(lines)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self._stats)
+
+
+def create_backend() -> ModelBackend:
+    """按配置创建模型后端"""
+    if settings.ai_backend == "fake":
+        return FakeBackend(
+            latency_seconds=settings.ai_fake_latency_seconds,
+            latency_jitter_seconds=settings.ai_fake_latency_jitter_seconds,
+            error_rate=settings.ai_fake_error_rate,
+            burst_interval=settings.ai_fake_burst_interval,
+            burst_length=settings.ai_fake_burst_length,
+            seed=settings.ai_fake_seed,
+        )
+    return GeminiBackend(settings.gemini_api_keys)
@@ -0,0 +1,274 @@
+"""
+AI 调用并发控制工具
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional
+
+
+class SingleFlight:
+    """
+    单飞合并：相同键的并发调用只执行一次，其余调用等待同一个结果。
+    执行体运行在独立任务中，发起者被取消（如客户端断开）不会影响其他等待者。
+    共享调用只按发起者自身的条件（如时间预算）执行；发起者条件导致的失败（reissue_if 返回 True）
+    不应波及条件更宽松的等待者，这些等待者改用自己的 func 重新发起（同时重新发起的仍会合并）
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.executed = 0
+        self.collapsed = 0
+        self.reissued = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]],
+                 reissue_if: Optional[Callable[[BaseException], bool]] = None) -> Any:
+        self.calls += 1
+        task = self._inflight.get(key)
+        # 已结束但尚未执行完成回调的任务不再合并（重新发起时可能遇到）
+        leader = task is None or task.done()
+        if leader:
+            self.executed += 1
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._on_done(k, t))
+        else:
+            self.collapsed += 1
+        try:
+            return await asyncio.shield(task)
+        except Exception as e:
+            if leader or reissue_if is None or not reissue_if(e):
+                raise
+        self.reissued += 1
+        return await self.do(key, func, reissue_if)
+
+    def _on_done(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 所有等待者都已取消时，避免出现 "Task exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "executed": self.executed,
+            "collapsed": self.collapsed,
+            "reissued": self.reissued,
+            "inflight": len(self._inflight),
+        }
+
+
+class QueueFullError(Exception):
+    """等待队列已满，调用方应在 retry_after_seconds 秒后重试"""
+
+    def __init__(self, retry_after_seconds: int, message: str = "AI请求排队人数过多，请稍后重试"):
+        super().__init__(message)
+        self.retry_after_seconds = retry_after_seconds
+
+
+class FairQueue:
+    """
+    按用户分组的加权轮询等待队列
+    每个用户一个 FIFO 队列，轮到某用户时最多连续放行 weight 个请求再切换到下一个用户，
+    单个用户提交再多的请求也只能占用自己的轮次
+    """
+
+    def __init__(self):
+        self._queues: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+        self._weights: Dict[Hashable, int] = {}
+        self._served: Dict[Hashable, int] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    def count(self, key: Hashable) -> int:
+        queue = self._queues.get(key)
+        return len(queue) if queue else 0
+
+    def push(self, key: Hashable, waiter: asyncio.Future, weight: int = 1) -> None:
+        if key not in self._queues:
+            self._queues[key] = deque()
+            self._served[key] = 0
+        self._weights[key] = max(1, weight)
+        self._queues[key].append(waiter)
+        self._size += 1
+
+    def remove(self, key: Hashable, waiter: asyncio.Future) -> None:
+        queue = self._queues.get(key)
+        if not queue:
+            return
+        try:
+            queue.remove(waiter)
+            self._size -= 1
+        except ValueError:
+            return
+        if not queue:
+            self._drop_key(key)
+
+    def pop(self) -> Optional[asyncio.Future]:
+        """按轮询顺序取出下一个等待者"""
+        while self._queues:
+            key, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._size -= 1
+            if not queue:
+                self._drop_key(key)
+            else:
+                self._served[key] += 1
+                if self._served[key] >= self._weights.get(key, 1):
+                    # 本轮配额用完，移到队尾
+                    self._served[key] = 0
+                    self._queues.move_to_end(key)
+            if not waiter.done():
+                return waiter
+        return None
+
+    def _drop_key(self, key: Hashable) -> None:
+        self._queues.pop(key, None)
+        self._served.pop(key, None)
+        self._weights.pop(key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._size,
+            "queued_users": len(self._queues),
+            "max_user_queue": max((len(q) for q in self._queues.values()), default=0),
+        }
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD 自适应并发限制器
+    - 成功且延迟低于目标：加性增长（每轮约 +1）
+    - 限流/暂时不可用/超时：乘性收缩
+    - 成功但延迟超过目标：小幅收缩
+    并发上限始终保持在 [min_limit, max_limit] 区间内
+    """
+
+    def __init__(self, initial_limit: int = 5, min_limit: int = 1, max_limit: int = 20,
+                 latency_target_seconds: float = 45.0, decrease_factor: float = 0.7,
+                 decrease_cooldown_seconds: float = 1.0, max_queue: int = 100,
+                 max_queue_per_key: int = 10):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.latency_target_seconds = latency_target_seconds
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown_seconds = decrease_cooldown_seconds
+        self._limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.max_queue = max_queue
+        self.max_queue_per_key = max_queue_per_key
+        self._inflight = 0
+        # 排队中的请求按用户公平调度，而非全局先进先出
+        self._waiters = FairQueue()
+        self._last_decrease = 0.0
+        self._latency_ewma: Optional[float] = None
+        self._stats = {"success": 0, "overload": 0, "error": 0, "increases": 0, "decreases": 0}
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def estimate_wait_seconds(self, position: Optional[int] = None) -> int:
+        """按当前上限与平均延迟估算排在 position 位置的请求需要等待的秒数"""
+        position = self.queue_depth + 1 if position is None else position
+        latency = self._latency_ewma if self._latency_ewma is not None else self.latency_target_seconds / 2
+        return max(1, math.ceil(position / self.limit * latency))
+
+    async def acquire(self, key: Hashable = None, weight: int = 1) -> None:
+        """
+        获取一个并发许可，超过当前上限时进入 key 对应的公平队列等待
+        队列总长或该 key 的排队数超过上限时立即抛出 QueueFullError（附带建议重试时间）
+        """
+        if self._inflight < self.limit and not self._waiters:
+            self._inflight += 1
+            return
+
+        if len(self._waiters) >= self.max_queue or self._waiters.count(key) >= self.max_queue_per_key:
+            raise QueueFullError(self.estimate_wait_seconds())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.push(key, waiter, weight)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 许可已分配但调用方被取消，归还许可
+                self._inflight -= 1
+                self._wake_waiters()
+            else:
+                self._waiters.remove(key, waiter)
+            raise
+
+    def release(self, outcome: str = "success", latency_seconds: Optional[float] = None) -> None:
+        """
+        归还许可并根据调用结果调整上限
+        outcome: success / overload（429、UNAVAILABLE、超时）/ error（其他不影响容量的错误）
+        """
+        self._inflight -= 1
+        self._record(outcome, latency_seconds)
+        self._wake_waiters()
+
+    def _record(self, outcome: str, latency_seconds: Optional[float]) -> None:
+        self._stats[outcome] = self._stats.get(outcome, 0) + 1
+        if latency_seconds is not None:
+            self._latency_ewma = latency_seconds if self._latency_ewma is None else (
+                0.8 * self._latency_ewma + 0.2 * latency_seconds
+            )
+
+        if outcome == "overload":
+            self._decrease(self.decrease_factor)
+        elif outcome == "success":
+            if latency_seconds is not None and latency_seconds > self.latency_target_seconds:
+                self._decrease(0.9)
+            elif self._limit < self.max_limit and (self._inflight + 1 >= self.limit or self._waiters):
+                # 加性增长（仅在许可用满时）：每完成约 limit 次成功调用，上限 +1
+                self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+                self._stats["increases"] += 1
+
+    def _decrease(self, factor: float) -> None:
+        # 同一波拥塞信号只收缩一次，避免并发的多个 429 把上限连续砍到底
+        now = time.monotonic()
+        if now - self._last_decrease < self.decrease_cooldown_seconds:
+            return
+        self._last_decrease = now
+        self._limit = max(float(self.min_limit), self._limit * factor)
+        self._stats["decreases"] += 1
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self._inflight < self.limit:
+            waiter = self._waiters.pop()
+            if waiter is None:
+                break
+            self._inflight += 1
+            waiter.set_result(None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "limit_exact": round(self._limit, 3),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "inflight": self._inflight,
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "max_queue_per_key": self.max_queue_per_key,
+            **self._waiters.get_stats(),
+            "latency_ewma_seconds": round(self._latency_ewma, 3) if self._latency_ewma is not None else None,
+            **self._stats,
+        }
@@ -0,0 +1,91 @@
+"""
+AI 服务 API Key 池：按剩余额度选择 Key，限流的 Key 临时冷却
+"""
+
+import time
+from typing import Any, Dict, List
+
+
+class KeySlot:
+    """单个 Key 的令牌桶与用量统计"""
+
+    def __init__(self, key: str, client: Any, requests_per_minute: float):
+        self.key = key
+        self.client = client
+        self.capacity = max(1.0, float(requests_per_minute))
+        self.refill_per_second = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.cooldown_until = 0.0
+        self.consecutive_limited = 0
+        self.stats = {"calls": 0, "success": 0, "rate_limited": 0, "errors": 0}
+
+    @property
+    def label(self) -> str:
+        return f"{self.key[:6]}..."
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+
+class ApiKeyPool:
+    """
+    多 Key 轮换
+    - 每个 Key 一个令牌桶（容量与补充速率由每分钟请求数决定），acquire 选择剩余令牌最多且未冷却的 Key
+    - 返回 429 / 配额耗尽的 Key 冷却 cooldown_seconds，连续限流时冷却时间翻倍（不超过 max_cooldown_seconds），
+      同时清空其令牌桶
+    - 所有 Key 都在冷却时仍选择最早恢复的 Key，是否拒绝交由上游判断
+    """
+
+    def __init__(self, slots: List[KeySlot], cooldown_seconds: float = 30.0, max_cooldown_seconds: float = 300.0):
+        if not slots:
+            raise ValueError("API Key 池不能为空")
+        self.slots = slots
+        self.cooldown_seconds = cooldown_seconds
+        self.max_cooldown_seconds = max(cooldown_seconds, max_cooldown_seconds)
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def acquire(self) -> KeySlot:
+        now = time.monotonic()
+        for slot in self.slots:
+            slot.refill(now)
+        ready = [slot for slot in self.slots if slot.cooldown_until <= now]
+        if ready:
+            slot = max(ready, key=lambda s: s.tokens / s.capacity)
+        else:
+            slot = min(self.slots, key=lambda s: s.cooldown_until)
+        slot.tokens = max(0.0, slot.tokens - 1)
+        slot.stats["calls"] += 1
+        return slot
+
+    def report_success(self, slot: KeySlot) -> None:
+        slot.consecutive_limited = 0
+        slot.stats["success"] += 1
+
+    def report_rate_limited(self, slot: KeySlot) -> None:
+        slot.stats["rate_limited"] += 1
+        cooldown = min(self.max_cooldown_seconds, self.cooldown_seconds * (2 ** slot.consecutive_limited))
+        slot.consecutive_limited += 1
+        slot.tokens = 0.0
+        slot.cooldown_until = time.monotonic() + cooldown
+        print(f"API Key {slot.label} 被限流，冷却 {cooldown:.0f} 秒")
+
+    def report_error(self, slot: KeySlot) -> None:
+        slot.stats["errors"] += 1
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        result = []
+        for slot in self.slots:
+            slot.refill(now)
+            result.append({
+                "key": slot.label,
+                "tokens": round(slot.tokens, 2),
+                "capacity": slot.capacity,
+                "cooldown_remaining_seconds": round(max(0.0, slot.cooldown_until - now), 1),
+                **slot.stats,
+            })
+        return result
@@ -0,0 +1,163 @@
+"""
+AI 调用韧性工具：请求级时间预算、熔断器
+"""
+
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+
+class DeadlineExceededError(Exception):
+    """请求的总时间预算已耗尽，不足以再发起一次模型调用"""
+
+    def __init__(self, message: str = "AI请求超出时间预算，已停止重试"):
+        super().__init__(message)
+
+
+class Deadline:
+    """
+    请求级总时间预算（基于单调时钟）
+    由接口层创建并向下传递，排队、每次重试与退避等待都从同一预算中扣除
+    """
+
+    def __init__(self, budget_seconds: float):
+        self.budget_seconds = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def cap(self, timeout_seconds: float) -> float:
+        """将单次操作的超时限制在剩余预算以内"""
+        return min(timeout_seconds, self.remaining())
+
+    def ensure(self, min_seconds: float = 0.0) -> None:
+        """剩余预算不足 min_seconds 时立即失败"""
+        if self.remaining() <= min_seconds:
+            raise DeadlineExceededError()
+
+    def __repr__(self) -> str:
+        return f"<Deadline(budget={self.budget_seconds}s, remaining={self.remaining():.1f}s)>"
+
+
+def cap_timeout(timeout_seconds: float, deadline: Optional[Deadline]) -> float:
+    return deadline.cap(timeout_seconds) if deadline is not None else timeout_seconds
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，AI 服务暂不可用，调用方应在 retry_after_seconds 秒后重试"""
+
+    def __init__(self, retry_after_seconds: int, message: str = "AI服务暂时不可用，请稍后重试"):
+        super().__init__(message)
+        self.retry_after_seconds = retry_after_seconds
+
+
+class CircuitBreaker:
+    """
+    基于近期失败率的熔断器
+    - closed：正常放行，记录 window_seconds 内每次调用的结果；
+      样本数达到 min_calls 且失败率不低于 failure_ratio 时打开
+    - open：所有调用立即以 CircuitOpenError 失败，open_seconds 后进入半开
+    - half_open：最多同时放行 half_open_probes 个探测调用；探测成功则关闭并清空统计，失败则重新打开
+    只统计上游故障（超时、限流、暂时不可用等），调用方自身原因的失败不计入
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window_seconds: float = 60.0, min_calls: int = 10, failure_ratio: float = 0.5,
+                 open_seconds: float = 30.0, half_open_probes: int = 1):
+        self.window_seconds = window_seconds
+        self.min_calls = max(1, min_calls)
+        self.failure_ratio = failure_ratio
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes_inflight = 0
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._failures = 0
+        self._stats = {"opened": 0, "rejected": 0, "probes": 0}
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._probes_inflight = 0
+        return self._state
+
+    def retry_after_seconds(self) -> int:
+        if self.state != self.OPEN:
+            return 1
+        return max(1, math.ceil(self.open_seconds - (time.monotonic() - self._opened_at)))
+
+    def is_open(self) -> bool:
+        """是否处于打开状态（半开时返回 False，让请求有机会成为探测调用）"""
+        return self.state == self.OPEN
+
+    def before_call(self) -> bool:
+        """
+        调用前检查，不允许调用时抛出 CircuitOpenError
+        返回本次调用是否为半开探测（调用结束后须通过 record 上报）
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return False
+        if state == self.HALF_OPEN and self._probes_inflight < self.half_open_probes:
+            self._probes_inflight += 1
+            self._stats["probes"] += 1
+            return True
+        self._stats["rejected"] += 1
+        raise CircuitOpenError(self.retry_after_seconds())
+
+    def record(self, success: Optional[bool], probe: bool = False) -> None:
+        """
+        上报调用结果：True 成功、False 上游故障、None 不计入（如调用被取消、请求本身有误）
+        """
+        if probe:
+            self._probes_inflight = max(0, self._probes_inflight - 1)
+            if success is True:
+                self._close()
+            elif success is False:
+                self._open()
+            return
+        if success is None or self._state != self.CLOSED:
+            return
+        now = time.monotonic()
+        self._outcomes.append((now, not success))
+        self._failures += 0 if success else 1
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            _, failed = self._outcomes.popleft()
+            self._failures -= 1 if failed else 0
+        if len(self._outcomes) >= self.min_calls and self._failures / len(self._outcomes) >= self.failure_ratio:
+            self._open()
+
+    def _open(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probes_inflight = 0
+        self._stats["opened"] += 1
+        print(f"AI熔断器打开：{self.open_seconds:.0f} 秒内直接拒绝AI请求")
+
+    def _close(self) -> None:
+        self._state = self.CLOSED
+        self._outcomes.clear()
+        self._failures = 0
+        print("AI熔断器关闭：探测调用成功，恢复正常")
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = len(self._outcomes)
+        return {
+            "state": self.state,
+            "retry_after_seconds": self.retry_after_seconds() if self._state == self.OPEN else None,
+            "window_calls": total,
+            "window_failures": self._failures,
+            "failure_ratio": round(self._failures / total, 3) if total else 0.0,
+            **self._stats,
+        }
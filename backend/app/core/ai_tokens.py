@@ -0,0 +1,84 @@
+"""
+Token 计数：优先使用模型提供方的 count_tokens，不支持或调用失败时回退为本地近似估算
+提供方计数结果按内容哈希缓存；本地估算只需一次线性扫描，直接计算不做缓存
+"""
+
+import asyncio
+import hashlib
+import math
+import re
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# 中日韩文字（含全角符号）大致一字一 token，其余文字按约 4 字符一 token 估算
+CJK_TOKENS_PER_CHAR = 1.0
+OTHER_CHARS_PER_TOKEN = 4.0
+
+_cjk_pattern = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+_whitespace_pattern = re.compile(r'\s+')
+
+
+def estimate_tokens(text: str) -> int:
+    """本地近似 token 数（无网络调用，结果确定，可用于计费）"""
+    if not text:
+        return 0
+    compact = _whitespace_pattern.sub(' ', text)
+    other = len(_cjk_pattern.sub('', compact))
+    cjk = len(compact) - other
+    return max(1, math.ceil(cjk * CJK_TOKENS_PER_CHAR + other / OTHER_CHARS_PER_TOKEN))
+
+
+class TokenCounter:
+    """
+    Token 计数器
+    - estimate：本地近似估算（同步，供分块/提示词预算与计费使用）；计算本身比哈希整段内容更便宜，不缓存
+    - count：调用提供方 count_tokens（超时 remote_timeout_seconds），返回 None 或失败时回退为估算值；
+      成功的计数按内容哈希做 LRU 缓存，最多保留 max_entries 条
+    """
+
+    def __init__(self, count_remote: Optional[Callable[[str], Awaitable[Optional[int]]]] = None,
+                 max_entries: int = 2048, remote_timeout_seconds: float = 3.0):
+        self._count_remote = count_remote
+        self.max_entries = max_entries
+        self.remote_timeout_seconds = remote_timeout_seconds
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+        self._stats = {"estimates": 0, "count_hits": 0, "remote_counts": 0, "remote_failures": 0}
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, value: int) -> None:
+        self._counts[key] = value
+        self._counts.move_to_end(key)
+        while len(self._counts) > self.max_entries:
+            self._counts.popitem(last=False)
+
+    def estimate(self, text: str) -> int:
+        self._stats["estimates"] += 1
+        return estimate_tokens(text)
+
+    async def count(self, text: str) -> int:
+        if not text:
+            return 0
+        key = self._key(text)
+        cached = self._counts.get(key)
+        if cached is not None:
+            self._counts.move_to_end(key)
+            self._stats["count_hits"] += 1
+            return cached
+        if self._count_remote is not None:
+            try:
+                tokens = await asyncio.wait_for(self._count_remote(text), timeout=self.remote_timeout_seconds)
+                if tokens is not None:
+                    self._stats["remote_counts"] += 1
+                    self._remember(key, int(tokens))
+                    return int(tokens)
+            except Exception as e:
+                self._stats["remote_failures"] += 1
+                print(f"Token 计数调用失败，使用本地估算: {e}")
+        # 估算值不写入 count 缓存，提供方恢复后仍可得到精确值
+        return self.estimate(text)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "count_entries": len(self._counts)}
@@ -34,6 +34,90 @@ class Settings(BaseSettings):
     
     # Google Gemini AI
     gemini_api_key: str = os.getenv("GEMINI_API_KEY", "")
+    # 额外的 API Key（逗号分隔），与 GEMINI_API_KEY 一起组成 Key 池
+    gemini_extra_api_keys: str = os.getenv("GEMINI_API_KEYS", "")
+    
+    @property
+    def gemini_api_keys(self) -> list:
+        """Key 池：GEMINI_API_KEY 在前，去重并保持顺序"""
+        keys = [self.gemini_api_key] + self.gemini_extra_api_keys.split(",")
+        return list(dict.fromkeys(key.strip() for key in keys if key and key.strip()))
+    
+    # 单 Key 速率（令牌桶，每分钟请求数）与被限流后的冷却时间（连续限流时翻倍，不超过上限）
+    ai_key_requests_per_minute: float = float(os.getenv("AI_KEY_REQUESTS_PER_MINUTE", "60"))
+    ai_key_cooldown_seconds: float = float(os.getenv("AI_KEY_COOLDOWN_SECONDS", "30"))
+    ai_key_max_cooldown_seconds: float = float(os.getenv("AI_KEY_MAX_COOLDOWN_SECONDS", "300"))
+
+    # 模型后端：gemini（默认）或 fake（本地确定性假模型，用于离线压测，不访问网络）
+    ai_backend: str = os.getenv("AI_BACKEND", "gemini").lower()
+    ai_fake_latency_seconds: float = float(os.getenv("AI_FAKE_LATENCY_SECONDS", "1.0"))
+    ai_fake_latency_jitter_seconds: float = float(os.getenv("AI_FAKE_LATENCY_JITTER_SECONDS", "0"))
+    ai_fake_error_rate: float = float(os.getenv("AI_FAKE_ERROR_RATE", "0"))
+    # 每 AI_FAKE_BURST_INTERVAL 次调用后连续 AI_FAKE_BURST_LENGTH 次返回 429（0 表示不模拟）
+    ai_fake_burst_interval: int = int(os.getenv("AI_FAKE_BURST_INTERVAL", "0"))
+    ai_fake_burst_length: int = int(os.getenv("AI_FAKE_BURST_LENGTH", "0"))
+    ai_fake_seed: int = int(os.getenv("AI_FAKE_SEED", "0"))
+    
+    # 长文分块生成（map-reduce）：超过阈值的内容按结构边界切块并发生成后合并
+    ai_chunk_threshold_chars: int = int(os.getenv("AI_CHUNK_THRESHOLD_CHARS", "100000"))
+    ai_chunk_size_chars: int = int(os.getenv("AI_CHUNK_SIZE_CHARS", "30000"))
+    ai_max_chunks: int = int(os.getenv("AI_MAX_CHUNKS", "24"))
+    
+    # 大纲优先生成：超过阈值（且未达分块阈值）的标准风格内容先生成顶层大纲，再按原文片段并发展开各分支
+    # 需要 1 + 分支数 次模型调用而按单次生成计费，默认 0 表示关闭，按需开启
+    ai_outline_threshold_chars: int = int(os.getenv("AI_OUTLINE_THRESHOLD_CHARS", "0"))
+    ai_outline_segment_chars: int = int(os.getenv("AI_OUTLINE_SEGMENT_CHARS", "2000"))
+    ai_outline_max_branches: int = int(os.getenv("AI_OUTLINE_MAX_BRANCHES", "12"))
+    
+    # 增量重新生成：受影响的二级分支占比超过该值时改为全量生成
+    ai_incremental_max_affected_ratio: float = float(os.getenv("AI_INCREMENTAL_MAX_AFFECTED_RATIO", "0.5"))
+    
+    # Token 预算：单次调用的用户内容不超过上下文窗口减去输出预留与固定指令，超出时改为分块生成
+    ai_context_window_tokens: int = int(os.getenv("AI_CONTEXT_WINDOW_TOKENS", "1000000"))
+    ai_output_reserve_tokens: int = int(os.getenv("AI_OUTPUT_RESERVE_TOKENS", "8192"))
+    
+    # 积分计费单位：chars（每 100 字符 1 积分，默认）或 tokens（按本地估算的 token 数，每 CREDIT_TOKENS_PER_CREDIT 个 1 积分）
+    credit_pricing_unit: str = os.getenv("CREDIT_PRICING_UNIT", "chars").lower()
+    credit_tokens_per_credit: int = int(os.getenv("CREDIT_TOKENS_PER_CREDIT", "100"))
+    
+    # AI 结果缓存（内容寻址：清洗后内容 + 风格 + 提示词模板版本）
+    ai_result_cache_max_entries: int = int(os.getenv("AI_RESULT_CACHE_MAX_ENTRIES", "500"))
+    ai_result_cache_max_bytes: int = int(os.getenv("AI_RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    ai_result_cache_persist: bool = os.getenv("AI_RESULT_CACHE_PERSIST", "true").lower() in ("1", "true", "yes")
+    
+    # Gemini 调用自适应并发（AIMD）：初始值、下限、上限与延迟目标
+    ai_concurrency_initial: int = int(os.getenv("AI_CONCURRENCY_INITIAL", "5"))
+    ai_concurrency_min: int = int(os.getenv("AI_CONCURRENCY_MIN", "1"))
+    ai_concurrency_max: int = int(os.getenv("AI_CONCURRENCY_MAX", "20"))
+    ai_latency_target_seconds: float = float(os.getenv("AI_LATENCY_TARGET_SECONDS", "45"))
+    
+    # AI 请求排队：按用户公平调度，排队总数/单用户排队数超限时返回 429
+    ai_queue_max_total: int = int(os.getenv("AI_QUEUE_MAX_TOTAL", "100"))
+    ai_queue_max_per_user: int = int(os.getenv("AI_QUEUE_MAX_PER_USER", "10"))
+    ai_priority_weight: int = int(os.getenv("AI_PRIORITY_WEIGHT", "3"))
+    
+    # AI 熔断器：统计窗口内调用数达到下限且上游故障率超过阈值时打开，打开期间请求在扣费前直接失败
+    ai_circuit_window_seconds: float = float(os.getenv("AI_CIRCUIT_WINDOW_SECONDS", "60"))
+    ai_circuit_min_calls: int = int(os.getenv("AI_CIRCUIT_MIN_CALLS", "10"))
+    ai_circuit_failure_ratio: float = float(os.getenv("AI_CIRCUIT_FAILURE_RATIO", "0.5"))
+    ai_circuit_open_seconds: float = float(os.getenv("AI_CIRCUIT_OPEN_SECONDS", "30"))
+    ai_circuit_half_open_probes: int = int(os.getenv("AI_CIRCUIT_HALF_OPEN_PROBES", "1"))
+    
+    # AI 请求时间预算：接口级总预算（含排队/重试/退避），剩余不足单次最短调用时间时快速失败
+    ai_request_budget_seconds: float = float(os.getenv("AI_REQUEST_BUDGET_SECONDS", "90"))
+    ai_min_attempt_seconds: float = float(os.getenv("AI_MIN_ATTEMPT_SECONDS", "5"))
+    
+    # 异步生成任务：数据库队列 + 进程内 worker 池
+    generation_job_workers: int = int(os.getenv("GENERATION_JOB_WORKERS", "2"))
+    generation_job_poll_interval_seconds: float = float(os.getenv("GENERATION_JOB_POLL_INTERVAL_SECONDS", "1.0"))
+    generation_job_stale_seconds: int = int(os.getenv("GENERATION_JOB_STALE_SECONDS", "600"))
+    generation_job_max_attempts: int = int(os.getenv("GENERATION_JOB_MAX_ATTEMPTS", "3"))
+    # 解析排队已满/解析超时的任务退避后重新排队
+    generation_job_retry_delay_seconds: float = float(os.getenv("GENERATION_JOB_RETRY_DELAY_SECONDS", "5"))
+    
+    # 批量生成：单次请求条目上限与同时生成的条目数（应不超过单用户排队上限）
+    batch_max_items: int = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+    batch_max_concurrency: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
     
     # 数据库配置
     database_url: str = os.getenv(
@@ -49,8 +133,35 @@ class Settings(BaseSettings):
             return self.database_url.replace("postgres://", "postgresql://", 1)
         return self.database_url
     
+    # 字幕压缩：去除滚动重复字幕、口头禅与重复短语；时间窗口大于 0 时按窗口分段并标注时间
+    srt_compression_enabled: bool = os.getenv("SRT_COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+    srt_similarity_threshold: float = float(os.getenv("SRT_SIMILARITY_THRESHOLD", "0.85"))
+    srt_remove_fillers: bool = os.getenv("SRT_REMOVE_FILLERS", "true").lower() in ("1", "true", "yes")
+    srt_time_window_seconds: float = float(os.getenv("SRT_TIME_WINDOW_SECONDS", "0"))
+    
+    # PDF 提取引擎顺序：auto（pymupdf → pdfplumber → pypdf2）或逗号分隔的引擎名，如 pdfplumber,pypdf2
+    pdf_engine: str = os.getenv("PDF_ENGINE", "auto")
+    
+    # 大 PDF 按页分片并行提取：文件不小于该字节数且每个分片至少 PDF_PARALLEL_PAGES_PER_SHARD 页时启用
+    pdf_parallel_min_bytes: int = int(os.getenv("PDF_PARALLEL_MIN_BYTES", str(1024 * 1024)))
+    pdf_parallel_pages_per_shard: int = int(os.getenv("PDF_PARALLEL_PAGES_PER_SHARD", "25"))
+    
+    # 文件解析进程池：worker 数（0 表示改用线程执行）、排队上限、单个解析任务的执行超时（不含排队）与 worker 可再分配的内存
+    parse_workers: int = int(os.getenv("PARSE_WORKERS", "2"))
+    parse_max_pending: int = int(os.getenv("PARSE_MAX_PENDING", "16"))
+    parse_timeout_seconds: float = float(os.getenv("PARSE_TIMEOUT_SECONDS", "60"))
+    parse_memory_limit_mb: int = int(os.getenv("PARSE_MEMORY_LIMIT_MB", "1024"))
+    
+    # 解析预算：提取的文本达到上限后不再继续提取（0 表示不限）；字符上限默认为分块生成能处理的总量
+    # 策略 head 只取开头，sample 在全文中均匀抽取页/段落；跳过的内容记录在解析报告中
+    parse_char_budget: int = int(os.getenv("PARSE_CHAR_BUDGET", str(ai_chunk_size_chars * ai_max_chunks)))
+    parse_token_budget: int = int(os.getenv("PARSE_TOKEN_BUDGET", "0"))
+    parse_budget_strategy: str = os.getenv("PARSE_BUDGET_STRATEGY", "head").lower()
+    
     # 文件上传配置
     max_file_size: int = 10 * 1024 * 1024  # 10MB
+    # 上传文件分块写入临时文件的块大小（内存中同时只保留一块）
+    upload_chunk_size: int = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
     upload_dir: str = "uploads"
     allowed_file_types: list = [".txt", ".md", ".docx", ".pdf", ".srt"]
     
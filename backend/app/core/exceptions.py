@@ -99,7 +99,8 @@ async def fastapi_http_exception_handler(request: Request, exc: FastAPIHTTPExcep
             "success": False,
             "message": message,
             "details": details
-        }
+        },
+        headers=getattr(exc, "headers", None)  # 保留 Retry-After 等响应头
     )
 
 
@@ -0,0 +1,191 @@
+"""
+文本提取预算：生成流程能处理的文本量有上限，超出部分提取了也会被截断
+解析时按字符/token 预算提前停止（head：只取开头）或在全文中均匀抽样（sample），
+并记录跳过的页/段落与字符数，便于成本预估如实反映实际送入模型的内容
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.core.ai_tokens import estimate_tokens
+
+BUDGET_STRATEGIES = ("head", "sample")
+# 预算比例为浮点数，按比例换算字符数/单元数时补偿舍入误差（如 40 * 0.2 / 0.8 = 9.999…）
+_EPSILON = 1e-9
+
+
+class ExtractionBudget:
+    """
+    提取预算：max_chars / max_tokens 为 0 表示该维度不限，两者都为 0 时不限制
+    token 使用本地估算（与计费估算一致，无网络调用）
+    """
+
+    def __init__(self, max_chars: int = 0, max_tokens: int = 0, strategy: str = "head"):
+        self.max_chars = max(0, max_chars)
+        self.max_tokens = max(0, max_tokens)
+        self.strategy = strategy if strategy in BUDGET_STRATEGIES else "head"
+
+    @classmethod
+    def from_settings(cls, max_chars: Optional[int] = None, max_tokens: Optional[int] = None,
+                      strategy: Optional[str] = None) -> "ExtractionBudget":
+        """未指定的参数使用 PARSE_CHAR_BUDGET / PARSE_TOKEN_BUDGET / PARSE_BUDGET_STRATEGY 配置"""
+        from app.core.config import settings
+
+        return cls(
+            max_chars=settings.parse_char_budget if max_chars is None else max_chars,
+            max_tokens=settings.parse_token_budget if max_tokens is None else max_tokens,
+            strategy=(strategy or settings.parse_budget_strategy).lower(),
+        )
+
+    @property
+    def limited(self) -> bool:
+        return self.max_chars > 0 or self.max_tokens > 0
+
+    def cost(self, text: str) -> float:
+        """文本占预算的比例（取字符与 token 两个维度中较大者）"""
+        ratios = []
+        if self.max_chars:
+            ratios.append(len(text) / self.max_chars)
+        if self.max_tokens:
+            ratios.append(estimate_tokens(text) / self.max_tokens)
+        return max(ratios, default=0.0)
+
+    def sample_indices(self, total: int, unit_cost: float) -> List[int]:
+        """按单元平均开销估算预算内可容纳的单元数，在 [0, total) 中均匀选取（保持原顺序）"""
+        if unit_cost <= 0:
+            return list(range(total))
+        count = max(1, int(1.0 / unit_cost + _EPSILON))
+        if count >= total:
+            return list(range(total))
+        return [index * total // count for index in range(count)]
+
+    def sample_plan(self, total: int, probe: List[str]) -> List[int]:
+        """用已读取的前若干单元估算单元平均开销，返回在全部 total 个单元中均匀抽样的序号"""
+        average = sum(self.cost(text) for text in probe) / len(probe) if probe else 0.0
+        return self.sample_indices(total, average)
+
+    def collector(self, unit: str) -> "BudgetCollector":
+        return BudgetCollector(self, unit)
+
+    def select(self, units: List[str], unit: str) -> "BudgetCollector":
+        """对已全部提取的单元应用预算：head 依次收集直至用尽，sample 均匀抽样后收集"""
+        collector = self.collector(unit)
+        collector.total_units = len(units)
+        if self.limited and self.strategy == "sample":
+            collector.collect_sampled(len(units), self.sample_plan(len(units), units), units, {})
+        else:
+            collector.extend(units)
+        return collector
+
+
+class BudgetCollector:
+    """
+    按顺序收集文本单元（页/段落/行）直到预算用尽；超出预算的单元按比例截断，其后的单元计入跳过
+    未实际提取的单元（如未读取的 PDF 页）通过 skip_unread 记录，跳过字符数按已读单元的平均长度估算
+    """
+
+    def __init__(self, budget: ExtractionBudget, unit: str):
+        self.budget = budget
+        self.unit = unit
+        self.texts: List[str] = []
+        self.total_units: Optional[int] = None
+        self.read_units = 0
+        self.skipped_units = 0
+        self.skipped_chars = 0
+        self.unread_units = 0
+        self.truncated = False
+        self.full = False
+        self._read_chars = 0
+        self._used = 0.0
+
+    def add(self, text: str) -> bool:
+        """收集一个单元；返回 False 表示预算已用尽，调用方应停止继续提取"""
+        self.read_units += 1
+        self._read_chars += len(text)
+        if not text:
+            return not self.full
+        if self.full:
+            self.skipped_units += 1
+            self.skipped_chars += len(text)
+            return False
+        cost = self.budget.cost(text)
+        if not self.budget.limited or self._used + cost <= 1.0:
+            self.texts.append(text)
+            self._used += cost
+            return True
+        keep = min(len(text), int(len(text) * (1.0 - self._used) / cost + _EPSILON))
+        if keep > 0:
+            self.texts.append(text[:keep])
+            self.truncated = True
+        else:
+            self.skipped_units += 1
+        self.skipped_chars += len(text) - keep
+        self._used = 1.0
+        self.full = True
+        return False
+
+    def extend(self, texts: Iterable[str]) -> bool:
+        for text in texts:
+            if not self.add(text):
+                return False
+        return True
+
+    def skip(self, texts: Iterable[str]) -> None:
+        """已提取但按抽样未选中的单元"""
+        for text in texts:
+            self.read_units += 1
+            self._read_chars += len(text)
+            if text:
+                self.skipped_units += 1
+                self.skipped_chars += len(text)
+
+    def skip_unread(self, count: int) -> None:
+        """预算用尽或未被抽中而没有提取的单元"""
+        self.unread_units += max(0, count)
+
+    def collect_sampled(self, total: int, indices: List[int], probe: List[str], fetched: Dict[int, str]) -> None:
+        """
+        按抽样结果收集：probe 为已读取的前 len(probe) 个单元，fetched 为其余被抽中单元的文本
+        probe 中未被抽中的计入跳过，既不在 probe 中也未被抽中的单元计入未读取
+        """
+        chosen = set(indices)
+        self.skip(text for index, text in enumerate(probe) if index not in chosen)
+        for index in indices:
+            self.add(probe[index] if index < len(probe) else fetched.get(index, ""))
+        self.skip_unread(total - len(probe) - sum(1 for index in indices if index >= len(probe)))
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.texts)
+
+    def record(self, report: Optional[Dict[str, Any]]) -> None:
+        """预算导致内容被跳过时写入解析报告的 budget 字段，并打印日志"""
+        budget_report = self.report()
+        if budget_report is None:
+            return
+        print(f"解析预算已用尽（{budget_report['strategy']}）：提取 {budget_report['extracted_units']}/"
+              f"{budget_report['total_units']} {budget_report['unit']}，跳过约 {budget_report['skipped_chars']} 字符")
+        if report is not None:
+            report["budget"] = budget_report
+
+    def report(self) -> Optional[Dict[str, Any]]:
+        """没有跳过任何内容时返回 None"""
+        if not (self.skipped_units or self.unread_units or self.truncated):
+            return None
+        average = self._read_chars / self.read_units if self.read_units else 0
+        estimated = int(average * self.unread_units)
+        extracted_chars = sum(len(text) for text in self.texts)
+        skipped_chars = self.skipped_chars + estimated
+        return {
+            "strategy": self.budget.strategy,
+            "char_budget": self.budget.max_chars,
+            "token_budget": self.budget.max_tokens,
+            "unit": self.unit,
+            "total_units": self.total_units if self.total_units is not None else self.read_units + self.unread_units,
+            "extracted_units": self.read_units - self.skipped_units,
+            "skipped_units": self.skipped_units + self.unread_units,
+            "truncated": self.truncated,
+            "extracted_chars": extracted_chars,
+            "skipped_chars": skipped_chars,
+            "skipped_chars_estimated": self.unread_units > 0,
+            "skipped_ratio": round(skipped_chars / (extracted_chars + skipped_chars), 3) if skipped_chars else 0.0,
+        }
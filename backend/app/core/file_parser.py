@@ -2,20 +2,39 @@
 文件解析器模块 - 支持多种文件格式解析
 """
 
+import codecs
+import mmap
 import os
 import re
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
 import docx
-import PyPDF2
-import pdfplumber
-from io import BytesIO
+
+from app.core.config import settings
+from app.core.extraction_budget import ExtractionBudget
+from app.core.pdf_engines import count_pdf_pages, extract_pdf_pages, resolve_engine_order
+from app.core.transcript_compressor import Caption, TranscriptCompressor, group_by_time_window, format_timestamp
+
+# SRT 时间戳行：00:01:02,345 --> 00:01:04,000
+_srt_timestamp = re.compile(r'(\d+):(\d{1,2}):(\d{1,2})(?:[,.](\d{1,3}))?\s*-->')
 
 class FileParser:
     """文件解析器类"""
     
+    # 按预算提取 PDF 时每批读取的页数（sample 策略下也是估算单页长度的样本页数）
+    pdf_budget_batch_pages = 16
+    # 按预算读取文本类文件（txt/md/srt）时 sample 策略用于估算单行开销的开头字节数
+    text_sample_probe_bytes = 64 * 1024
+    text_encodings = ('utf-8', 'gbk', 'gb2312', 'big5')
+    
     def __init__(self):
         self.supported_formats = ['.txt', '.md', '.docx', '.pdf', '.srt']
+        self.pdf_engine_order = resolve_engine_order(settings.pdf_engine)
+        self.transcript_compressor = TranscriptCompressor(
+            similarity_threshold=settings.srt_similarity_threshold,
+            remove_fillers=settings.srt_remove_fillers,
+        )
     
     def parse_file(self, file_path: str, file_type: str) -> Optional[str]:
         """
@@ -164,38 +183,84 @@ class FileParser:
         return "\n".join(text_content)
     
     def parse_pdf(self, file_path: str) -> str:
-        """解析PDF文件，优先使用 pdfplumber，fallback 到 PyPDF2"""
-        text_content = []
+        """解析PDF文件，按 PDF_ENGINE 配置的引擎顺序提取（默认 PyMuPDF → pdfplumber → PyPDF2）"""
+        with open(file_path, 'rb') as file:
+            file_bytes = file.read()
         
         try:
-            # 尝试使用 pdfplumber（更好的文本提取）
-            with pdfplumber.open(file_path) as pdf:
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text and text.strip():
-                        # 清理文本格式
-                        cleaned_text = self._clean_pdf_text(text)
-                        if cleaned_text:
-                            text_content.append(cleaned_text)
-        except Exception:
-            # fallback 到 PyPDF2
-            try:
-                with open(file_path, 'rb') as file:
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    
-                    for page in pdf_reader.pages:
-                        text = page.extract_text()
-                        if text and text.strip():
-                            cleaned_text = self._clean_pdf_text(text)
-                            if cleaned_text:
-                                text_content.append(cleaned_text)
-            except Exception as e:
-                raise Exception(f"PDF解析失败: {str(e)}")
-        
-        if not text_content:
+            text = self._extract_pdf_text(file_bytes)
+        except Exception as e:
+            raise Exception(f"PDF解析失败: {str(e)}")
+        
+        if not text:
             raise Exception("PDF文件没有可提取的文本内容")
         
-        return "\n".join(text_content)
+        return text
+    
+    def _extract_pdf_text(self, source, report: Optional[Dict[str, Any]] = None,
+                          budget: Optional[ExtractionBudget] = None) -> str:
+        """逐页提取并清理PDF文本，使用的引擎写入 report；有预算时分批读取，预算用尽即停止（或按页均匀抽样）"""
+        if budget is None or not budget.limited:
+            pages, engine = self.extract_pdf_page_range(source)
+            if report is not None and engine:
+                report["pdf_engine"] = engine
+            return "\n".join(page for page in pages if page)
+        
+        total = count_pdf_pages(source, self.pdf_engine_order)
+        collector = budget.collector("pages")
+        collector.total_units = total
+        engines = []
+        batch = self.pdf_budget_batch_pages
+        if budget.strategy == "sample":
+            probe, engine = self.extract_pdf_page_range(source, range(min(total, batch)))
+            engines.append(engine)
+            indices = budget.sample_plan(total, probe)
+            rest = [index for index in indices if index >= len(probe)]
+            fetched = {}
+            if rest:
+                pages, engine = self.extract_pdf_page_range(source, rest)
+                engines.append(engine)
+                fetched = dict(zip(rest, pages))
+            collector.collect_sampled(total, indices, probe, fetched)
+        else:
+            for start in range(0, total, batch):
+                end = min(start + batch, total)
+                pages, engine = self.extract_pdf_page_range(source, range(start, end))
+                engines.append(engine)
+                for page in pages:
+                    collector.add(page)
+                if collector.full:
+                    collector.skip_unread(total - end)
+                    break
+        
+        if report is not None:
+            used = [engine for engine in dict.fromkeys(engines) if engine]
+            if used:
+                report["pdf_engine"] = ",".join(used)
+            collector.record(report)
+        return "\n".join(page for page in collector.texts if page)
+    
+    def extract_pdf_page_range(self, source, pages=None) -> Tuple[list, Optional[str]]:
+        """
+        提取并清理指定页（range 或页码列表，None 为全部页）的文本，source 为字节或文件路径
+        返回 (与所选页一一对应的清理后文本，空页为空字符串, 使用的引擎)；供按页分片与按预算分批提取
+        """
+        texts, engine = extract_pdf_pages(source, self.pdf_engine_order, pages)
+        
+        text_content = []
+        for page_text in texts:
+            # 清理文本格式
+            text_content.append(self._clean_pdf_text(page_text) if page_text and page_text.strip() else "")
+        
+        return text_content, engine
+    
+    def _limit_lines(self, text: str, budget: Optional[ExtractionBudget], report: Optional[Dict[str, Any]]) -> str:
+        """对已完整解码的文本按行应用预算"""
+        if not text or budget is None or not budget.limited:
+            return text
+        collector = budget.select(text.split('\n'), "lines")
+        collector.record(report)
+        return collector.text
     
     def _clean_pdf_text(self, text: str) -> str:
         """清理PDF提取的文本"""
@@ -269,69 +334,219 @@ class FileParser:
         
         return "\n".join(merged_sentences)
     
-    def parse_from_bytes(self, file_bytes: bytes, filename: str) -> Optional[str]:
+    def parse_from_bytes(self, file_bytes: bytes, filename: str, max_chars: Optional[int] = None,
+                         max_tokens: Optional[int] = None, strategy: Optional[str] = None) -> Optional[str]:
         """
         从字节流解析文件内容（优化版本，避免临时文件IO）
         Args:
             file_bytes: 文件字节内容
             filename: 文件名
+            max_chars / max_tokens: 提取预算，达到后停止提取（None 使用配置，0 表示不限）
+            strategy: head（只取开头）或 sample（全文均匀抽样），None 使用配置
         Returns:
             解析后的文本内容
         """
+        budget = ExtractionBudget.from_settings(max_chars, max_tokens, strategy)
+        return self.parse_with_report(file_bytes, filename, budget)[0]
+    
+    def parse_with_report(self, file_bytes: bytes, filename: str,
+                          budget: Optional[ExtractionBudget] = None) -> Tuple[Optional[str], Dict[str, Any]]:
+        """
+        从字节流解析文件内容，同时返回解析报告（如字幕压缩比例、预算跳过的内容），供接口展示与成本预估
+        budget 为 None 时不限制提取量
+        Returns:
+            (解析后的文本内容, 解析报告)
+        """
+        report: Dict[str, Any] = {}
+        return self._parse_source(file_bytes, filename, report, budget), report
+    
+    def parse_path_with_report(self, file_path: str, filename: str,
+                               budget: Optional[ExtractionBudget] = None) -> Tuple[Optional[str], Dict[str, Any]]:
+        """
+        解析已落盘的上传文件，返回值同 parse_with_report
+        PDF/DOCX 由解析库直接读取文件，文本类文件通过只读内存映射解码，不会再把整个文件读成一份 bytes
+        """
+        report: Dict[str, Any] = {}
+        if Path(filename).suffix.lower() in ('.pdf', '.docx'):
+            return self._parse_source(file_path, filename, report, budget), report
+        with open(file_path, 'rb') as file, self._map_file(file) as data:
+            return self._parse_source(data, filename, report, budget), report
+    
+    @staticmethod
+    @contextmanager
+    def _map_file(file):
+        """只读内存映射整个文件（空文件无法映射，返回空字节）"""
+        if os.fstat(file.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+    
+    def _parse_source(self, file_bytes, filename: str, report: Dict[str, Any],
+                      budget: Optional[ExtractionBudget] = None) -> Optional[str]:
+        """file_bytes 为 bytes/内存映射；PDF 与 DOCX 也可以是文件路径"""
         file_ext = Path(filename).suffix.lower()
         
         if file_ext not in self.supported_formats:
             raise ValueError(f"不支持的文件格式: {file_ext}")
         
         try:
-            if file_ext == '.txt':
-                return self._parse_txt_from_bytes(file_bytes)
-            elif file_ext == '.md':
-                return self._parse_md_from_bytes(file_bytes)
+            if file_ext in ('.txt', '.md', '.srt'):
+                return self._parse_text_source(file_bytes, file_ext, report, budget)
             elif file_ext == '.docx':
-                return self._parse_docx_from_bytes(file_bytes, filename)
+                return self._parse_docx_from_bytes(file_bytes, filename, budget, report)
             elif file_ext == '.pdf':
-                return self._parse_pdf_from_bytes(file_bytes, filename)
-            elif file_ext == '.srt':
-                return self._parse_srt_from_bytes(file_bytes)
+                return self._parse_pdf_from_bytes(file_bytes, filename, report, budget)
         except Exception as e:
             raise Exception(f"文件解析失败: {str(e)}")
         
         return None
     
-    def _parse_txt_from_bytes(self, file_bytes: bytes) -> str:
-        """从字节流解析纯文本文件"""
-        # 尝试多种编码
-        encodings = ['utf-8', 'gbk', 'gb2312', 'big5']
-        for encoding in encodings:
+    def _parse_txt_from_bytes(self, file_bytes) -> str:
+        """从字节流（bytes 或内存映射）解析纯文本文件"""
+        return self._decode_text(file_bytes)[0]
+    
+    def _decode_text(self, file_bytes, final: bool = True) -> Tuple[str, str]:
+        """
+        按候选编码依次尝试解码，返回 (文本, 使用的编码)；全部失败时使用utf-8并忽略错误
+        final 为 False 表示 file_bytes 是截取的前缀，末尾被截断的多字节字符直接丢弃，不视为解码失败
+        """
+        for encoding in self.text_encodings:
             try:
-                return file_bytes.decode(encoding)
+                if final:
+                    # str() 直接解码缓冲区，内存映射无需先复制为 bytes
+                    return str(file_bytes, encoding), encoding
+                return codecs.getincrementaldecoder(encoding)().decode(file_bytes), encoding
             except UnicodeDecodeError:
                 continue
-        # 如果所有编码都失败，使用utf-8并忽略错误
-        return file_bytes.decode('utf-8', errors='ignore')
+        return str(file_bytes, 'utf-8', errors='ignore'), 'utf-8'
+    
+    def _process_text(self, content: str, file_ext: str, report: Optional[Dict[str, Any]] = None) -> str:
+        """文本类文件解码后的处理：txt 原样保留，md 提取结构，srt 合并/压缩字幕"""
+        if file_ext == '.md':
+            return self._process_markdown_content(content)
+        if file_ext == '.srt':
+            return self._process_srt_content(content, report)
+        return content
+    
+    def _parse_text_source(self, data, file_ext: str, report: Dict[str, Any],
+                           budget: Optional[ExtractionBudget] = None) -> str:
+        """
+        解析 txt/md/srt（data 为 bytes 或内存映射）；有预算时与 PDF 按页分批读取一样只解码需要的部分：
+        head 从开头截取一段字节（在行边界处截断，srt 在字幕块之间的空行处截断）解码处理，
+        预算仍未用尽才把截取长度加倍，预算用尽后其余字节不再解码；
+        sample 下 txt/md 按行在全文字节范围内均匀抽样，只解码被抽中的行。
+        srt 的去重压缩与按时间分段依赖完整的字幕序列，sample 下仍解码全文后抽样
+        """
+        if budget is None or not budget.limited or (budget.strategy == "sample" and file_ext == '.srt'):
+            return self._limit_lines(self._process_text(self._parse_txt_from_bytes(data), file_ext, report),
+                                     budget, report)
+        if budget.strategy == "sample":
+            return self._sample_text_lines(data, file_ext, report, budget)
+        
+        size = len(data)
+        window = self._text_window_bytes(budget)
+        while True:
+            end = self._text_boundary(data, window, file_ext)
+            text = self._process_text(self._decode_text(data[:end], final=end >= size)[0], file_ext, report)
+            units = text.split('\n') if text else []
+            collector = budget.select(units, "lines")
+            if end >= size or collector.full:
+                break
+            window *= 2
+        if end < size:
+            # 未解码部分的行数按已解码部分每字节的行数估算
+            unread = round((size - end) * len(units) / end) if end else 0
+            collector.skip_unread(unread)
+            collector.total_units = len(units) + unread
+        collector.record(report)
+        return collector.text
+    
+    @staticmethod
+    def _text_window_bytes(budget: ExtractionBudget) -> int:
+        """
+        head 策略首次截取的字节数：按每字符最多 4 字节（utf-8）、每 token 最多约 16 字节估算的上限，
+        纯文本通常一次即可用尽预算；md/srt 处理后文本变短时再按需加倍
+        """
+        bounds = []
+        if budget.max_chars:
+            bounds.append(budget.max_chars * 4)
+        if budget.max_tokens:
+            bounds.append(budget.max_tokens * 16)
+        return max(min(bounds), 1024)
+    
+    @staticmethod
+    def _text_boundary(data, limit: int, file_ext: str) -> int:
+        """不超过 limit 的最后一个行边界（srt 为字幕块之间的空行）；找不到边界时在 limit 处截断"""
+        if limit >= len(data):
+            return len(data)
+        separators = (b'\n\n', b'\n\r\n') if file_ext == '.srt' else (b'\n',)
+        cut = 0
+        for separator in separators:
+            position = data.rfind(separator, 0, limit)
+            if position >= 0:
+                cut = max(cut, position + len(separator))
+        return cut or limit
     
-    def _parse_md_from_bytes(self, file_bytes: bytes) -> str:
-        """从字节流解析Markdown文件"""
-        # 先解码为文本
-        content = self._parse_txt_from_bytes(file_bytes)
-        # 处理Markdown结构
-        return self._process_markdown_content(content)
+    def _sample_text_lines(self, data, file_ext: str, report: Dict[str, Any], budget: ExtractionBudget) -> str:
+        """
+        sample 策略（txt/md）：解码开头一段作为样本估算单行开销与总行数，
+        再按字节位置在全文中均匀选取行，只解码被抽中的行
+        """
+        size = len(data)
+        probe_end = self._text_boundary(data, self.text_sample_probe_bytes, file_ext)
+        if probe_end >= size:
+            return self._limit_lines(self._process_text(self._parse_txt_from_bytes(data), file_ext), budget, report)
+        probe_text, encoding = self._decode_text(data[:probe_end], final=False)
+        probe = self._process_text(probe_text, file_ext).split('\n')
+        if not any(probe):
+            # 开头没有有效内容，无法估算单行开销
+            return self._limit_lines(self._process_text(self._parse_txt_from_bytes(data), file_ext), budget, report)
+        
+        total = max(len(probe) + 1, round(size * len(probe) / probe_end))
+        indices = budget.sample_plan(total, probe)
+        fetched = {}
+        seen = set()
+        for index in indices:
+            if index < len(probe):
+                continue
+            # 第 index 行按比例映射到字节位置，取该位置所在的整行
+            position = max(probe_end, index * size // total)
+            start = max(probe_end, data.rfind(b'\n', 0, position) + 1)
+            end = data.find(b'\n', position)
+            end = size if end < 0 else end
+            if start in seen or start >= end:
+                continue
+            seen.add(start)
+            line = str(data[start:end], encoding, errors='ignore')
+            fetched[index] = self._process_text(line, file_ext)
+        
+        collector = budget.collector("lines")
+        collector.total_units = total
+        collector.collect_sampled(total, indices, probe, fetched)
+        collector.record(report)
+        return collector.text
     
-    def _parse_docx_from_bytes(self, file_bytes: bytes, filename: str) -> str:
-        """从字节流解析DOCX文件"""
+    def _parse_docx_from_bytes(self, file_bytes, filename: str, budget: Optional[ExtractionBudget] = None,
+                               report: Optional[Dict[str, Any]] = None) -> str:
+        """从字节流（或已落盘的文件路径）解析DOCX文件；head 预算用尽后不再读取后续段落与表格"""
         try:
             from io import BytesIO
             from docx import Document
             
-            # 使用BytesIO避免临时文件
-            doc_stream = BytesIO(file_bytes)
+            # 使用BytesIO避免临时文件；文件路径直接交给 python-docx 读取
+            doc_stream = BytesIO(file_bytes) if isinstance(file_bytes, bytes) else file_bytes
             doc = Document(doc_stream)
-            
-            text_content = []
+        except Exception as e:
+            if not isinstance(file_bytes, bytes):
+                raise
+            # 如果内存解析失败，降级到临时文件方式
+            return self._limit_lines(self._fallback_to_temp_file(file_bytes, filename, '.docx'), budget, report)
+        
+        def blocks():
+            # 逐段落/表格行生成文本（空段落为空字符串，便于按总数统计跳过的部分）
             for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    text_content.append(paragraph.text.strip())
+                yield paragraph.text.strip()
             
             # 解析表格内容
             for table in doc.tables:
@@ -340,64 +555,34 @@ class FileParser:
                     for cell in row.cells:
                         if cell.text.strip():
                             row_text.append(cell.text.strip())
-                    if row_text:
-                        text_content.append(" | ".join(row_text))
-            
-            return "\n".join(text_content)
-            
-        except Exception as e:
-            # 如果内存解析失败，降级到临时文件方式
-            return self._fallback_to_temp_file(file_bytes, filename, '.docx')
+                    yield " | ".join(row_text)
+        
+        if budget is None or not budget.limited:
+            return "\n".join(block for block in blocks() if block)
+        
+        if budget.strategy == "sample":
+            collector = budget.select(list(blocks()), "paragraphs")
+        else:
+            collector = budget.collector("paragraphs")
+            collector.total_units = len(doc.paragraphs) + sum(len(table.rows) for table in doc.tables)
+            collector.extend(blocks())
+            if collector.full:
+                collector.skip_unread(collector.total_units - collector.read_units)
+        collector.record(report)
+        return collector.text
     
-    def _parse_pdf_from_bytes(self, file_bytes: bytes, filename: str) -> str:
-        """从字节流解析PDF文件"""
-        try:
-            from io import BytesIO
-            import pdfplumber
-            
-            # 使用BytesIO避免临时文件
-            pdf_stream = BytesIO(file_bytes)
-            
-            with pdfplumber.open(pdf_stream) as pdf:
-                text_content = []
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        # 清理文本
-                        cleaned_text = self._clean_pdf_text(page_text)
-                        if cleaned_text.strip():
-                            text_content.append(cleaned_text)
-                
-                return "\n".join(text_content)
-                
-        except Exception as e:
-            try:
-                # 降级到PyPDF2
-                from io import BytesIO
-                import PyPDF2
-                
-                pdf_stream = BytesIO(file_bytes)
-                pdf_reader = PyPDF2.PdfReader(pdf_stream)
-                
-                text_content = []
-                for page in pdf_reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        cleaned_text = self._clean_pdf_text(page_text)
-                        if cleaned_text.strip():
-                            text_content.append(cleaned_text)
-                
-                return "\n".join(text_content)
-                
-            except Exception as e2:
-                # 如果内存解析都失败，降级到临时文件方式
-                return self._fallback_to_temp_file(file_bytes, filename, '.pdf')
+    def _parse_pdf_from_bytes(self, file_bytes, filename: str,
+                              report: Optional[Dict[str, Any]] = None,
+                              budget: Optional[ExtractionBudget] = None) -> str:
+        """从字节流或文件路径解析PDF文件（各引擎均直接读取内存中的字节或按需读取文件，无需临时文件）"""
+        return self._extract_pdf_text(file_bytes, report, budget)
     
-    def _process_srt_content(self, content: str) -> str:
-        """处理SRT格式内容，提取字幕文本"""
+    def _process_srt_content(self, content: str, report: Optional[Dict[str, Any]] = None) -> str:
+        """处理SRT格式内容，提取字幕文本；启用压缩时去除滚动重复字幕与口头禅，压缩统计写入 report"""
         try:
-            # 解析SRT格式，提取字幕文本
-            subtitle_texts = []
+            # 解析SRT格式，提取字幕文本（记录每条字幕的起始时间）
+            captions = []
+            current_start = None
             lines = content.split('\n')
             
             i = 0
@@ -414,8 +599,12 @@ class FileParser:
                     i += 1
                     continue
                 
-                # 跳过时间戳行（包含 -->）
+                # 时间戳行（包含 -->）：记录起始时间后跳过
                 if '-->' in line:
+                    match = _srt_timestamp.search(line)
+                    if match:
+                        hours, minutes, seconds, millis = match.groups()
+                        current_start = int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(millis or 0) / 1000
                     i += 1
                     continue
                 
@@ -424,25 +613,46 @@ class FileParser:
                     # 清理HTML标签（如果有）
                     cleaned_line = re.sub(r'<[^>]+>', '', line)
                     if cleaned_line.strip():
-                        subtitle_texts.append(cleaned_line.strip())
+                        captions.append(Caption(current_start, cleaned_line.strip()))
                 
                 i += 1
             
-            if not subtitle_texts:
+            if not captions:
+                raise Exception("SRT文件中没有找到有效的字幕文本")
+            
+            if not settings.srt_compression_enabled:
+                # 合并重复的短句，提高可读性
+                return self._merge_subtitle_sentences([caption.text for caption in captions])
+            
+            original_length = sum(len(caption.text) + 1 for caption in captions)
+            kept, stats = self.transcript_compressor.compress(captions)
+            if not kept:
                 raise Exception("SRT文件中没有找到有效的字幕文本")
             
-            # 合并重复的短句，提高可读性
-            return self._merge_subtitle_sentences(subtitle_texts)
+            window = settings.srt_time_window_seconds
+            if window > 0:
+                # 按时间窗口分段，段首标注时间，便于模型按时间线组织分支
+                sections = []
+                for start, texts in group_by_time_window(kept, window):
+                    body = self._merge_subtitle_sentences(texts)
+                    sections.append(f"[{format_timestamp(start)}]\n{body}" if start is not None else body)
+                result = "\n\n".join(sections)
+            else:
+                result = self._merge_subtitle_sentences([caption.text for caption in kept])
+            
+            stats.update({
+                "original_chars": original_length,
+                "compressed_chars": len(result),
+                "reduction_ratio": round(1 - len(result) / original_length, 3) if original_length else 0.0,
+            })
+            print(f"字幕压缩：{stats['captions_in']} 条 -> {stats['captions_out']} 条，"
+                  f"{original_length} -> {len(result)} 字符（减少 {stats['reduction_ratio']:.1%}）")
+            if report is not None:
+                report["srt_compression"] = stats
+            return result
         except Exception as e:
             raise Exception(f"SRT内容处理失败: {str(e)}")
     
-    def _parse_srt_from_bytes(self, file_bytes: bytes) -> str:
-        """从字节流解析SRT字幕文件"""
-        # 先解码为文本
-        content = self._parse_txt_from_bytes(file_bytes)
-        # 处理SRT格式
-        return self._process_srt_content(content)
-    
     def _fallback_to_temp_file(self, file_bytes: bytes, filename: str, file_ext: str) -> str:
         """降级到临时文件方式（仅在内存解析失败时使用）"""
         import tempfile
@@ -0,0 +1,151 @@
+"""
+思维导图增量重新生成
+源文本修改后，按结构单元（标题/段落）对比新旧源文本，把变化映射到受影响的二级分支，
+只重新生成这些分支并拼回原有 Markdown，成本与延迟随修改量而不是全文长度增长
+"""
+
+import difflib
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+_BRANCH_HEADING = re.compile(r'^##\s+(.+?)\s*$')
+_NOISE = re.compile(r'[\s#*\-+>`|]+|\d+\.\s')
+
+
+@dataclass
+class BranchBlock:
+    """一个二级分支：标题与其下的全部行（不含 ## 标题行本身）"""
+    title: str
+    lines: List[str] = field(default_factory=list)
+
+
+@dataclass
+class IncrementalPlan:
+    """
+    增量重新生成计划
+    sources 为每个分支在新源文本中对应的内容；affected 中的分支需要重新生成，
+    removed 中的分支对应的源文本已被全部删除
+    """
+    header: List[str]
+    branches: List[BranchBlock]
+    sources: List[str]
+    affected: List[int]
+    removed: List[int]
+    changed_chars: int
+
+    @property
+    def unchanged(self) -> bool:
+        return not self.affected and not self.removed
+
+    @property
+    def title(self) -> str:
+        for line in self.header:
+            if line.startswith('# '):
+                return line[2:].strip()
+        return ""
+
+    @property
+    def regenerate_text(self) -> str:
+        """需要发送给模型的源文本（用于计费）"""
+        return '\n\n'.join(self.sources[index] for index in self.affected)
+
+    def render(self, expansions: Dict[int, List[str]]) -> str:
+        """用重新生成的分支内容替换原分支，其余分支原样保留"""
+        lines = list(self.header)
+        for index, branch in enumerate(self.branches):
+            if index in self.removed:
+                continue
+            lines.append(f"## {branch.title}")
+            lines.extend(expansions.get(index, branch.lines))
+        return '\n'.join(lines)
+
+
+def split_branches(markdown: str):
+    """拆分 Markdown 为 (二级分支之前的行, [BranchBlock, ...])"""
+    header: List[str] = []
+    branches: List[BranchBlock] = []
+    for line in markdown.split('\n'):
+        match = _BRANCH_HEADING.match(line.strip())
+        if match:
+            branches.append(BranchBlock(match.group(1)))
+        elif branches:
+            branches[-1].lines.append(line)
+        else:
+            header.append(line)
+    return header, branches
+
+
+def _bigrams(text: str) -> Set[str]:
+    compact = _NOISE.sub('', text).lower()
+    return {compact[i:i + 2] for i in range(len(compact) - 1)}
+
+
+def _assign_units(units: List[str], branches: List[BranchBlock]) -> List[int]:
+    """
+    将每个源文本单元归属到与其字符二元组重合度最高的分支
+    没有任何重合时沿用上一单元的归属（分支通常按原文顺序排列）
+    """
+    branch_grams = [_bigrams(branch.title + '\n' + '\n'.join(branch.lines)) for branch in branches]
+    assignment: List[int] = []
+    previous = 0
+    for unit in units:
+        grams = _bigrams(unit)
+        best, best_score = previous, 0.0
+        if grams:
+            for index, candidate in enumerate(branch_grams):
+                score = len(grams & candidate) / len(grams)
+                if score > best_score or (score == best_score and index == previous):
+                    best, best_score = index, score
+        if best_score == 0.0:
+            best = previous
+        assignment.append(best)
+        previous = best
+    return assignment
+
+
+def plan_incremental(old_units: List[str], new_units: List[str], markdown: str,
+                     max_affected_ratio: float = 0.5) -> Optional[IncrementalPlan]:
+    """
+    生成增量计划；无法增量（没有二级分支、旧源为空、受影响分支占比超过 max_affected_ratio）时返回 None，
+    由调用方改为全量生成
+    """
+    header, branches = split_branches(markdown)
+    if not branches or not old_units or not new_units:
+        return None
+
+    old_assignment = _assign_units(old_units, branches)
+    new_assignment: List[int] = []
+    affected: Set[int] = set()
+    changed_chars = 0
+
+    matcher = difflib.SequenceMatcher(None, old_units, new_units, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            new_assignment.extend(old_assignment[i1:i2])
+            continue
+        if i2 > i1:
+            touched = old_assignment[i1:i2]
+        else:
+            # 纯插入：归入前一单元所在分支，位于开头时归入后一单元所在分支
+            touched = [old_assignment[i1 - 1] if i1 > 0 else old_assignment[min(i1, len(old_assignment) - 1)]]
+        affected.update(touched)
+        for offset in range(j2 - j1):
+            new_assignment.append(touched[min(offset, len(touched) - 1)])
+        changed_chars += sum(len(unit) for unit in old_units[i1:i2]) + sum(len(unit) for unit in new_units[j1:j2])
+
+    sources = ['\n\n'.join(unit for unit, owner in zip(new_units, new_assignment) if owner == index)
+               for index in range(len(branches))]
+    removed = sorted(index for index in affected if not sources[index])
+    regenerate = sorted(index for index in affected if sources[index])
+
+    if len(affected) > max(1, int(len(branches) * max_affected_ratio)):
+        return None
+    return IncrementalPlan(
+        header=header,
+        branches=branches,
+        sources=sources,
+        affected=regenerate,
+        removed=removed,
+        changed_chars=changed_chars,
+    )
@@ -0,0 +1,151 @@
+"""
+思维导图树结构工具
+树节点格式：{"title": str, "children": [节点, ...]}
+提供规范化校验、与 Markdown 的互相转换，以及展开为节点列表
+"""
+
+import re
+from typing import Any, Dict, List, Optional
+
+DEFAULT_TITLE = "思维导图"
+
+# 树的深度与节点数上限，防止异常输出撑爆存储与前端渲染
+MAX_TREE_DEPTH = 10
+MAX_TREE_NODES = 5000
+MAX_LABEL_LENGTH = 500
+
+_WHITESPACE = re.compile(r'\s+')
+_HTML_TAG = re.compile(r'<[^>]*>')
+_LEADING_MARKERS = re.compile(r'^(?:#{1,6}\s+|[-*+]\s+|\d+\.\s+)+')
+_UNSAFE_LABEL = re.compile(r'javascript:|data:text/html|vbscript:', re.IGNORECASE)
+_HEADING_LINE = re.compile(r'^(#{1,6})\s+(.+)$')
+_LIST_LINE = re.compile(r'^(\s*)(?:[-*+]|\d+\.)\s+(.+)$')
+
+
+def clean_label(value: Any) -> str:
+    """规范化节点文本：单行、去除HTML标签与Markdown前缀，过滤可疑内容"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str):
+        return ""
+    label = _WHITESPACE.sub(' ', value).strip()
+    label = _HTML_TAG.sub('', label).strip()
+    label = _LEADING_MARKERS.sub('', label).strip()
+    if _UNSAFE_LABEL.search(label):
+        return ""
+    return label[:MAX_LABEL_LENGTH]
+
+
+def normalize_tree(data: Any) -> Dict[str, Any]:
+    """
+    校验并规范化树结构，非法时抛出 ValueError
+    兼容模型常见的键名变体（label/name/text、items/nodes），空节点被丢弃
+    """
+    if not isinstance(data, dict):
+        raise ValueError("树结构必须是对象")
+
+    counter = {"nodes": 0}
+
+    def build(node: Any, depth: int) -> Optional[Dict[str, Any]]:
+        if not isinstance(node, dict):
+            label = clean_label(node)
+            raw_children: List[Any] = []
+        else:
+            label = clean_label(node.get("title") or node.get("label") or node.get("name") or node.get("text"))
+            raw_children = node.get("children") or node.get("items") or node.get("nodes") or []
+            if not isinstance(raw_children, list):
+                raw_children = []
+        if not label:
+            return None
+        counter["nodes"] += 1
+        if counter["nodes"] > MAX_TREE_NODES:
+            raise ValueError(f"节点数超过上限 {MAX_TREE_NODES}")
+        children = []
+        if depth < MAX_TREE_DEPTH:
+            for child in raw_children:
+                built = build(child, depth + 1)
+                if built:
+                    children.append(built)
+        return {"title": label, "children": children}
+
+    root = build(data, 0)
+    if root is None:
+        raise ValueError("缺少根节点标题")
+    return root
+
+
+def tree_to_markdown(tree: Dict[str, Any]) -> str:
+    """
+    树 → Markdown：根为 #，第一、二层为 ## / ###，更深层为缩进列表
+    与 markdown_to_tree 互为逆运算
+    """
+    lines = [f"# {tree['title']}"]
+
+    def walk(node: Dict[str, Any], depth: int) -> None:
+        for child in node.get("children", []):
+            if depth <= 2:
+                lines.append(f"{'#' * (depth + 1)} {child['title']}")
+            else:
+                lines.append(f"{'  ' * (depth - 3)}- {child['title']}")
+            walk(child, depth + 1)
+
+    walk(tree, 1)
+    return "\n".join(lines)
+
+
+def markdown_to_tree(markdown: str) -> Dict[str, Any]:
+    """
+    Markdown → 树：标题按级别嵌套，列表项挂在最近的标题下并按缩进（2空格一级）嵌套
+    存在多个一级标题时，以默认标题作为虚拟根节点
+    """
+    super_root: Dict[str, Any] = {"title": DEFAULT_TITLE, "children": []}
+    # 栈中保存 (深度, 节点)；虚拟根深度为 -1
+    stack = [(-1, super_root)]
+    heading_depth = -1
+
+    for raw_line in markdown.split('\n'):
+        line = raw_line.rstrip()
+        if not line.strip():
+            continue
+        heading = _HEADING_LINE.match(line.strip())
+        if heading:
+            depth = len(heading.group(1)) - 1
+            heading_depth = depth
+            label = clean_label(heading.group(2))
+        else:
+            item = _LIST_LINE.match(line.replace('\t', '  '))
+            if not item:
+                continue
+            depth = heading_depth + 1 + len(item.group(1)) // 2
+            label = clean_label(item.group(2))
+        if not label:
+            continue
+
+        while stack[-1][0] >= depth:
+            stack.pop()
+        node = {"title": label, "children": []}
+        stack[-1][1]["children"].append(node)
+        stack.append((depth, node))
+
+    if len(super_root["children"]) == 1:
+        return super_root["children"][0]
+    return super_root
+
+
+def tree_to_nodes(tree: Dict[str, Any]) -> Dict[str, Any]:
+    """展开为 {title, nodes} 节点列表（节点含 id / type / data.label / parent）"""
+    nodes: List[Dict[str, Any]] = []
+
+    def walk(node: Dict[str, Any], parent_id: Optional[str], depth: int) -> None:
+        node_id = f"n{len(nodes)}"
+        nodes.append({
+            "id": node_id,
+            "type": "root" if parent_id is None else ("branch" if node["children"] else "leaf"),
+            "data": {"label": node["title"], "depth": depth},
+            "parent": parent_id,
+        })
+        for child in node["children"]:
+            walk(child, node_id, depth + 1)
+
+    walk(tree, None, 0)
+    return {"title": tree["title"], "nodes": nodes}
@@ -0,0 +1,280 @@
+"""
+PDF 文本提取引擎
+- pymupdf：基于 MuPDF 的 C 实现，速度最快
+- pdfplumber：纯 Python，按字符坐标重建版面，对多栏/表格等版面更稳妥但较慢
+- pypdf2：最后的兜底
+按 PDF_ENGINE 配置的顺序依次尝试（默认 auto：pymupdf → pdfplumber → pypdf2），
+引擎不可用、抛出异常或提取结果质量不合格（无文本、乱码比例过高）时自动换下一个；
+PyMuPDF 的结果中检测到左右分栏的页，在配置了 pdfplumber 时改由 pdfplumber 按栏裁剪后逐栏提取
+输入可以是内存中的字节或文件路径（路径方式由引擎按需读取，便于多进程按页分片）；可只提取指定页（range 或页码列表）
+"""
+
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+PdfSource = Union[bytes, str]
+
+DEFAULT_ENGINE_ORDER = ("pymupdf", "pdfplumber", "pypdf2")
+
+# 提取结果中替换字符/私用区字符占比超过该值视为乱码（常见于缺少 ToUnicode 映射的字体）
+MAX_GARBLED_RATIO = 0.05
+
+# 分栏检测：页面中部 30%~70% 范围内有一条纵向空白带（栏间距），至多该比例的文本行横跨它（标题、页脚），
+# 两侧各有至少 MIN_COLUMN_LINES 行，且各行通常占满本栏宽度的一半以上（排除单元格较短的表格）
+MIN_COLUMN_LINES = 3
+MAX_GUTTER_CROSSING_RATIO = 0.2
+MIN_GUTTER_WIDTH = 12.0
+
+
+def _open_stream(source: PdfSource):
+    return BytesIO(source) if isinstance(source, bytes) else source
+
+
+def _select(count: int, pages: Optional[Sequence[int]]) -> Sequence[int]:
+    """要提取的页码（超出页数的忽略）"""
+    if pages is None:
+        return range(count)
+    return [index for index in pages if 0 <= index < count]
+
+
+def _extract_pymupdf(source: PdfSource, pages: Optional[Sequence[int]] = None) -> List[str]:
+    import fitz  # PyMuPDF
+
+    document = fitz.open(stream=source, filetype="pdf") if isinstance(source, bytes) else fitz.open(source)
+    with document:
+        return [document[index].get_text("text", sort=True) or "" for index in _select(document.page_count, pages)]
+
+
+def _extract_pdfplumber(source: PdfSource, pages: Optional[Sequence[int]] = None) -> List[str]:
+    import pdfplumber
+
+    # 页对象按需解析，只对指定页提取文本
+    with pdfplumber.open(_open_stream(source)) as pdf:
+        return [pdf.pages[index].extract_text() or "" for index in _select(len(pdf.pages), pages)]
+
+
+def _extract_pypdf2(source: PdfSource, pages: Optional[Sequence[int]] = None) -> List[str]:
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(_open_stream(source))
+    return [reader.pages[index].extract_text() or "" for index in _select(len(reader.pages), pages)]
+
+
+def _count_pymupdf(source: PdfSource) -> int:
+    import fitz
+
+    document = fitz.open(stream=source, filetype="pdf") if isinstance(source, bytes) else fitz.open(source)
+    with document:
+        return document.page_count
+
+
+def _count_pdfplumber(source: PdfSource) -> int:
+    import pdfplumber
+
+    with pdfplumber.open(_open_stream(source)) as pdf:
+        return len(pdf.pages)
+
+
+def _count_pypdf2(source: PdfSource) -> int:
+    import PyPDF2
+
+    return len(PyPDF2.PdfReader(_open_stream(source)).pages)
+
+
+PDF_ENGINES: Dict[str, Callable[..., List[str]]] = {
+    "pymupdf": _extract_pymupdf,
+    "pdfplumber": _extract_pdfplumber,
+    "pypdf2": _extract_pypdf2,
+}
+
+PAGE_COUNTERS: Dict[str, Callable[[PdfSource], int]] = {
+    "pymupdf": _count_pymupdf,
+    "pdfplumber": _count_pdfplumber,
+    "pypdf2": _count_pypdf2,
+}
+
+
+def count_pdf_pages(source: PdfSource, order: Optional[List[str]] = None) -> int:
+    """
+    PDF 页数（只读取页目录，不提取文本），按引擎顺序尝试（默认顺序同提取）
+    引擎不可用或无法打开文件（损坏、加密等）时换下一个；全部失败时抛出最后的异常
+    """
+    last_error: Optional[Exception] = None
+    for name in order or DEFAULT_ENGINE_ORDER:
+        try:
+            return PAGE_COUNTERS[name](source)
+        except ImportError as e:
+            last_error = e
+        except Exception as e:
+            print(f"PDF 引擎 {name} 读取页数失败，尝试下一个引擎: {e}")
+            last_error = e
+    raise last_error or ValueError("没有可用的 PDF 引擎")
+
+
+def _column_layout(page) -> Optional[Tuple[float, float, float]]:
+    """PyMuPDF 页面含左右两栏时返回 (栏间距中线的横坐标, 分栏区域的上沿, 下沿)，否则 None"""
+    words = [word for word in page.get_text("words") if word[4].strip()]
+    if not words:
+        return None
+    width = page.rect.width
+    band = max(MIN_GUTTER_WIDTH, width * 0.03)
+    lines = {(word[5], word[6]) for word in words}
+    scan = []
+    x = page.rect.x0 + width * 0.3
+    while x + band <= page.rect.x0 + width * 0.7:
+        scan.append((len({(w[5], w[6]) for w in words if w[0] < x + band and w[2] > x}), x))
+        x += 2.0
+    if not scan:
+        return None
+    fewest = min(crossing for crossing, _ in scan)
+    if fewest > len(lines) * MAX_GUTTER_CROSSING_RATIO:
+        return None
+    
+    # 取横跨行数最少的最长连续空白带的中间位置
+    runs: List[List[float]] = []
+    previous = None
+    for crossing, x in scan:
+        if crossing == fewest:
+            if previous == fewest:
+                runs[-1].append(x)
+            else:
+                runs.append([x])
+        previous = crossing
+    run = max(runs, key=len)
+    gutter = run[len(run) // 2]
+    left_margin = min(word[0] for word in words)
+    right_margin = max(word[2] for word in words)
+    # 横跨栏间距的行（标题、页脚等）不属于任何一栏
+    crossing = {(w[5], w[6]) for w in words if w[0] < gutter + band and w[2] > gutter}
+    in_columns = [word for word in words if (word[5], word[6]) not in crossing]
+    sides = (
+        ([w for w in in_columns if w[2] <= gutter], gutter - left_margin),
+        ([w for w in in_columns if w[0] >= gutter + band], right_margin - gutter - band),
+    )
+    for side, span in sides:
+        extents: Dict[Tuple[int, int], List[float]] = {}
+        for x0, _, x1, _, _, block, line, _ in side:
+            extent = extents.setdefault((block, line), [x0, x1])
+            extent[0], extent[1] = min(extent[0], x0), max(extent[1], x1)
+        if len(extents) < MIN_COLUMN_LINES:
+            return None
+        widths = sorted(x1 - x0 for x0, x1 in extents.values())
+        if widths[len(widths) // 2] < span * 0.5:
+            return None
+    # 分栏区域：两栏文字共同覆盖的纵向范围，之外的标题、页脚等整行提取
+    top = max(min(word[1] for word in side) for side, _ in sides)
+    bottom = min(max(word[3] for word in side) for side, _ in sides)
+    return gutter + band / 2, min(top, bottom), max(top, bottom)
+
+
+ColumnLayout = Tuple[int, Tuple[float, float, float]]
+
+
+def _pymupdf_column_pages(source: PdfSource, pages: Optional[Sequence[int]]) -> Dict[int, ColumnLayout]:
+    """所选页中检测为两栏的页：{在结果中的位置: (页码, 分栏布局)}"""
+    import fitz
+
+    document = fitz.open(stream=source, filetype="pdf") if isinstance(source, bytes) else fitz.open(source)
+    columns = {}
+    with document:
+        for position, index in enumerate(_select(document.page_count, pages)):
+            layout = _column_layout(document[index])
+            if layout is not None:
+                columns[position] = (index, layout)
+    return columns
+
+
+def _extract_pdfplumber_columns(source: PdfSource, columns: Dict[int, ColumnLayout]) -> Dict[int, str]:
+    """用 pdfplumber 提取两栏页：分栏区域之上的整行、左栏、右栏、分栏区域之下的整行"""
+    import pdfplumber
+
+    texts = {}
+    with pdfplumber.open(_open_stream(source)) as pdf:
+        for position, (index, (gutter, column_top, column_bottom)) in columns.items():
+            page = pdf.pages[index]
+            x0, top, x1, bottom = page.bbox
+            split = min(max(x0 + gutter, x0), x1)
+            upper = min(max(top + column_top, top), bottom)
+            lower = min(max(top + column_bottom, upper), bottom)
+            regions = [(x0, top, x1, upper), (x0, upper, split, lower), (split, upper, x1, lower),
+                       (x0, lower, x1, bottom)]
+            parts = [page.crop(region).extract_text() or "" for region in regions
+                     if region[2] > region[0] and region[3] > region[1]]
+            texts[position] = "\n".join(part for part in parts if part)
+    return texts
+
+
+def _refine_column_pages(source: PdfSource, texts: List[str], pages: Optional[Sequence[int]],
+                         order: List[str]) -> Tuple[List[str], str]:
+    """
+    PyMuPDF 按坐标排序输出时会把左右两栏的同一行拼在一起；检测到分栏的页改由 pdfplumber 逐栏提取
+    （引擎顺序中没有 pdfplumber 或 pdfplumber 失败时保留 PyMuPDF 的结果）
+    """
+    if "pdfplumber" not in order:
+        return texts, "pymupdf"
+    try:
+        columns = _pymupdf_column_pages(source, pages)
+        if not columns:
+            return texts, "pymupdf"
+        replaced = _extract_pdfplumber_columns(source, columns)
+    except Exception as e:
+        print(f"PDF 分栏页改用 pdfplumber 提取失败，保留 PyMuPDF 结果: {e}")
+        return texts, "pymupdf"
+    refined = list(texts)
+    for position, text in replaced.items():
+        if text.strip():
+            refined[position] = text
+    return refined, "pymupdf+pdfplumber"
+
+
+def resolve_engine_order(setting: str) -> List[str]:
+    """解析 PDF_ENGINE 配置：auto 或逗号分隔的引擎名（未知名称被忽略，全部无效时使用默认顺序）"""
+    names = [name.strip().lower() for name in (setting or "").split(",") if name.strip()]
+    if not names or names == ["auto"]:
+        return list(DEFAULT_ENGINE_ORDER)
+    order = [name for name in dict.fromkeys(names) if name in PDF_ENGINES]
+    return order or list(DEFAULT_ENGINE_ORDER)
+
+
+def _garbled_ratio(text: str) -> float:
+    visible = [ch for ch in text if not ch.isspace()]
+    if not visible:
+        return 1.0
+    garbled = sum(1 for ch in visible if ch == '\ufffd' or '\ue000' <= ch <= '\uf8ff' or ord(ch) < 32)
+    return garbled / len(visible)
+
+
+def pages_look_valid(pages: List[str]) -> bool:
+    """提取结果是否可用：至少有文本且乱码比例不高"""
+    text = "".join(pages)
+    return bool(text.strip()) and _garbled_ratio(text) <= MAX_GARBLED_RATIO
+
+
+def extract_pdf_pages(source: PdfSource, order: List[str],
+                      pages: Optional[Sequence[int]] = None) -> Tuple[List[str], Optional[str]]:
+    """
+    按顺序尝试各引擎提取指定页（None 为全部页），返回 (逐页文本, 使用的引擎名)
+    PyMuPDF 结果合格但含两栏页时，这些页改由 pdfplumber 逐栏提取，引擎名为 pymupdf+pdfplumber
+    所有引擎结果都不合格时返回最后一个成功引擎的结果；全部抛出异常时抛出最后的异常
+    """
+    fallback: Tuple[List[str], Optional[str]] = ([], None)
+    last_error: Optional[Exception] = None
+    for name in order:
+        try:
+            texts = PDF_ENGINES[name](source, pages)
+        except ImportError as e:
+            last_error = e
+            continue
+        except Exception as e:
+            print(f"PDF 引擎 {name} 提取失败，尝试下一个引擎: {e}")
+            last_error = e
+            continue
+        if pages_look_valid(texts):
+            if name == "pymupdf":
+                return _refine_column_pages(source, texts, pages, order)
+            return texts, name
+        print(f"PDF 引擎 {name} 提取结果为空或乱码，尝试下一个引擎")
+        fallback = (texts, name)
+    if fallback[1] is None and last_error is not None:
+        raise last_error
+    return fallback
@@ -0,0 +1,124 @@
+"""
+字幕转写稿压缩：在送入模型之前去除滚动字幕造成的重复、口头禅与重复短语，可选按时间窗口分段
+长视频字幕的大部分体积来自逐字滚动的重复字幕，压缩后可显著减少 token、延迟与积分消耗
+"""
+
+import difflib
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+_normalize_pattern = re.compile(r'[\W_]+', re.UNICODE)
+# 独立出现的语气词/口头禅（前后为句首、空白或标点）
+_filler_patterns = (
+    re.compile(r'(?:^|(?<=[\s，,。！？!?、]))(?:嗯+|呃+|额+|唔+|emm+)[，,、\s]*', re.IGNORECASE),
+    re.compile(r'\b(?:um+|uh+|erm+|hmm+)\b[,，]?\s*', re.IGNORECASE),
+)
+# 连续重复的短语：英文单词/短语重复两次及以上，中文 2~6 字短语重复三次及以上
+_repeated_words = re.compile(r'\b(\w+(?:\s+\w+){0,3})(?:\s+\1\b)+', re.IGNORECASE)
+_repeated_cjk = re.compile(r'([\u4e00-\u9fff]{2,6})\1{2,}')
+_whitespace = re.compile(r'\s+')
+
+
+@dataclass
+class Caption:
+    """一条字幕：起始时间（秒，未知时为 None）与文本"""
+    start: Optional[float]
+    text: str
+
+
+class TranscriptCompressor:
+    """
+    字幕压缩
+    - 相邻字幕近似重复（归一化后相同、相似度不低于 similarity_threshold，或一条是另一条的开头/结尾）时只保留较完整的一条；
+      包含判断要求较短一条至少 min_overlap_chars 个字符，"好的"、"yes" 之类的简短回复不会被当作重复丢弃
+    - 滚动字幕：新字幕开头与上一条结尾重叠（至少 min_overlap_chars 个字符）时只保留新增部分
+    - 去除独立的语气词，折叠连续重复的短语
+    """
+
+    def __init__(self, similarity_threshold: float = 0.85, min_overlap_chars: int = 4, remove_fillers: bool = True):
+        self.similarity_threshold = similarity_threshold
+        self.min_overlap_chars = max(1, min_overlap_chars)
+        self.remove_fillers = remove_fillers
+
+    def clean_text(self, text: str) -> str:
+        if self.remove_fillers:
+            for pattern in _filler_patterns:
+                text = pattern.sub('', text)
+        text = _repeated_words.sub(r'\1', text)
+        text = _repeated_cjk.sub(r'\1', text)
+        return _whitespace.sub(' ', text).strip()
+
+    def _similar(self, a: str, b: str) -> bool:
+        # 相似度上界 2*min/(len_a+len_b) 已低于阈值时无需计算
+        if not a or not b or 2 * min(len(a), len(b)) / (len(a) + len(b)) < self.similarity_threshold:
+            return False
+        return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio() >= self.similarity_threshold
+
+    def _contains(self, longer: str, shorter: str) -> bool:
+        """滚动字幕的包含关系：shorter 足够长且位于 longer 的开头或结尾（出现在中间的短语视为新内容）"""
+        return (len(shorter) >= self.min_overlap_chars
+                and (longer.startswith(shorter) or longer.endswith(shorter)))
+
+    def _overlap(self, previous: str, current: str) -> int:
+        """上一条结尾与当前开头的最长重叠字符数（不足 min_overlap_chars 时为 0）"""
+        for size in range(min(len(previous), len(current)), self.min_overlap_chars - 1, -1):
+            if previous.endswith(current[:size]):
+                return size
+        return 0
+
+    def compress(self, captions: List[Caption]) -> Tuple[List[Caption], Dict[str, Any]]:
+        kept: List[Caption] = []
+        kept_keys: List[str] = []
+        stats = {"captions_in": len(captions), "duplicates_removed": 0, "overlaps_trimmed": 0}
+
+        for caption in captions:
+            text = self.clean_text(caption.text)
+            key = _normalize_pattern.sub('', text).lower()
+            if not key:
+                stats["duplicates_removed"] += 1
+                continue
+            if kept:
+                last_key = kept_keys[-1]
+                if key == last_key or self._contains(last_key, key):
+                    stats["duplicates_removed"] += 1
+                    continue
+                if self._contains(key, last_key) or self._similar(key, last_key):
+                    # 滚动增长的字幕：用更完整的一条替换上一条，保留上一条的起始时间
+                    if len(key) >= len(last_key):
+                        kept[-1] = Caption(kept[-1].start, text)
+                        kept_keys[-1] = key
+                    stats["duplicates_removed"] += 1
+                    continue
+                overlap = self._overlap(kept[-1].text, text)
+                if overlap:
+                    text = text[overlap:].strip()
+                    key = _normalize_pattern.sub('', text).lower()
+                    stats["overlaps_trimmed"] += 1
+                    if not key:
+                        continue
+            kept.append(Caption(caption.start, text))
+            kept_keys.append(key)
+
+        stats["captions_out"] = len(kept)
+        return kept, stats
+
+
+def group_by_time_window(captions: List[Caption], window_seconds: float) -> List[Tuple[Optional[float], List[str]]]:
+    """按起始时间分组为 (窗口起始秒数, [字幕文本, ...])；缺少时间的字幕归入当前窗口"""
+    groups: List[Tuple[Optional[float], List[str]]] = []
+    window_end = None
+    for caption in captions:
+        if caption.start is not None and (window_end is None or caption.start >= window_end):
+            window_start = caption.start - caption.start % window_seconds
+            window_end = window_start + window_seconds
+            groups.append((window_start, []))
+        elif not groups:
+            groups.append((None, []))
+        groups[-1][1].append(caption.text)
+    return groups
+
+
+def format_timestamp(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
@@ -0,0 +1,50 @@
+"""
+上传大小限制中间件
+multipart 请求体在进入路由前就会被完整接收并缓存，路由中再检查文件大小为时已晚；
+本中间件在接收请求体的过程中累计字节数，Content-Length 超限或已接收的字节超限时立即以 413 拒绝
+"""
+
+from fastapi import HTTPException
+
+# 表单字段、分隔符等 multipart 开销的余量
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadSizeLimitMiddleware:
+    """纯 ASGI 中间件，只作用于 multipart/form-data 请求；超限时抛出的 HTTPException 由全局异常处理器统一返回"""
+
+    def __init__(self, app, max_body_bytes: int):
+        self.app = app
+        self.max_body_bytes = max_body_bytes + MULTIPART_OVERHEAD_BYTES
+
+    def _too_large(self) -> HTTPException:
+        return HTTPException(
+            status_code=413,
+            detail=f"文件过大。最大支持 {(self.max_body_bytes - MULTIPART_OVERHEAD_BYTES) // (1024 * 1024)} MB"
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        if not headers.get(b"content-type", b"").lower().startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        declared = headers.get(b"content-length", b"")
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            # 在读取第一块请求体之前检查声明的长度，超限时不再接收任何数据
+            if declared.isdigit() and int(declared) > self.max_body_bytes:
+                raise self._too_large()
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise self._too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -9,3 +9,5 @@ from .user_credits import UserCredits
 from .credit_transaction import CreditTransaction, TransactionType
 from .login_token import LoginToken  # Import the new model
 from .referral_event import ReferralEvent
+from .ai_result_cache import AIResultCacheEntry
+from .generation_job import GenerationJob, JobStatus
@@ -0,0 +1,36 @@
+"""
+AI 生成结果缓存数据模型
+"""
+
+from sqlalchemy import Column, Integer, String, Text, DateTime, func
+from ..core.database import Base
+
+
+class AIResultCacheEntry(Base):
+    """
+    AI 结果缓存表模型
+    以（清洗后内容 + 风格 + 提示词模板版本）的哈希为键，持久化思维导图生成结果
+    """
+    __tablename__ = "ai_result_cache"
+
+    # 主键 - 内容寻址的缓存键（sha256 十六进制）
+    cache_key = Column(String(64), primary_key=True)
+    
+    # 生成风格（standard / refined）
+    style = Column(String(20), nullable=False)
+    
+    # 提示词模板版本，模板变化后旧版本条目自动失效
+    prompt_version = Column(String(16), nullable=False, index=True)
+    
+    # 生成结果
+    title = Column(String(200), nullable=True)
+    markdown = Column(Text, nullable=False)
+    size_bytes = Column(Integer, nullable=False, default=0)
+    
+    # 命中统计
+    hit_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_hit_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self):
+        return f"<AIResultCacheEntry(cache_key='{self.cache_key[:12]}', style='{self.style}', size_bytes={self.size_bytes})>"
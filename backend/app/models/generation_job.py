@@ -0,0 +1,80 @@
+"""
+思维导图异步生成任务数据模型
+"""
+
+import uuid
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer, Boolean
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+
+from ..core.database import Base
+
+
+class JobStatus:
+    """任务状态"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    FINISHED = (SUCCEEDED, FAILED)
+
+
+class GenerationJob(Base):
+    """
+    生成任务表模型
+    数据库即队列：提交后状态为 queued，由后台 worker 认领执行，
+    执行流程为 解析 → 扣费 → 生成 → 失败退款，结果与状态持久化在本表
+    """
+    __tablename__ = "generation_jobs"
+
+    # 主键 - 任务ID
+    id = Column(
+        UUID(as_uuid=True),
+        primary_key=True,
+        default=uuid.uuid4,
+        unique=True,
+        nullable=False,
+        index=True
+    )
+
+    # 外键关联到用户表
+    user_id = Column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True
+    )
+
+    # 任务状态（queued / running / succeeded / failed）
+    status = Column(String(20), nullable=False, default=JobStatus.QUEUED, index=True)
+
+    # 输入：source_type 为 text / file / file_token
+    source_type = Column(String(20), nullable=False)
+    input_text = Column(Text, nullable=True)  # 文本或已解析内容
+    input_path = Column(String(500), nullable=True)  # 待解析的上传文件（执行后删除）
+    filename = Column(String(255), nullable=True)
+    file_type = Column(String(20), nullable=True)
+    style = Column(String(20), nullable=True)
+    output_format = Column(String(20), nullable=False, default="markdown", server_default="markdown")  # markdown / tree
+    priority = Column(Integer, nullable=False, default=1)
+
+    # 计费：credits_charged 与扣费/退款在同一事务中更新
+    credit_cost = Column(Integer, nullable=True)
+    credits_charged = Column(Boolean, nullable=False, default=False)
+
+    # 结果（JSON 字符串）与错误信息
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    error_code = Column(String(50), nullable=True)
+
+    # 执行信息
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_id = Column(String(64), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self):
+        return f"<GenerationJob(id={self.id}, user_id={self.user_id}, status='{self.status}')>"
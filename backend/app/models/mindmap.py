@@ -2,6 +2,7 @@
 思维导图数据模型 - ThinkSo v3.0.0 分享功能
 """
 
+import json
 import uuid
 from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer, Boolean
 from sqlalchemy.dialects.postgresql import UUID
@@ -35,6 +36,12 @@ class Mindmap(Base):
     # 思维导图内容 (Markdown格式)
     content = Column(Text, nullable=False)
     
+    # 思维导图树结构 (JSON，{title, children})；以树保存时 content 为由树派生的 Markdown
+    structure = Column(Text, nullable=True)
+    
+    # 生成该思维导图所用的源文本（用于源文本修改后的增量重新生成）
+    source_text = Column(Text, nullable=True)
+    
     # 外键关联到用户表
     user_id = Column(
         Integer, 
@@ -83,6 +90,7 @@ class Mindmap(Base):
             "id": str(self.id),
             "title": self.title,
             "content": self.content,
+            "structure": self.get_structure(),
             "user_id": self.user_id,
             "description": self.description,
             "tags": self.tags.split(',') if self.tags else [],
@@ -98,6 +106,10 @@ class Mindmap(Base):
             } if hasattr(self, 'user') and self.user else None
         }
     
+    def get_structure(self):
+        """解析树结构，未保存树时返回 None"""
+        return json.loads(self.structure) if self.structure else None
+    
     def to_summary_dict(self):
         """
         转换为摘要字典 (不包含完整content，用于列表显示)
@@ -0,0 +1,176 @@
+"""
+AI 生成结果缓存服务 - 内容寻址的两级缓存
+一级：进程内有界 LRU；二级：主数据库持久化，重启后仍可命中
+"""
+
+import asyncio
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.ai_result_cache import AIResultCacheEntry
+
+
+class AIResultCache:
+    """AI 结果缓存（LRU + 数据库持久化）"""
+
+    def __init__(self, max_entries: int = 500, max_bytes: int = 64 * 1024 * 1024, persist: bool = True):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.persist = persist
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._entry_sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = Lock()
+        # 已清理过旧模板条目的版本集合（每个进程每个版本只清理一次）
+        self._purged_versions = set()
+        self._stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "persistent_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "persistent_errors": 0,
+        }
+
+    @staticmethod
+    def make_key(sanitized_content: str, style: str, prompt_version: str) -> str:
+        """缓存键：清洗后内容 + 风格 + 提示词模板版本的 sha256"""
+        digest = hashlib.sha256()
+        digest.update(prompt_version.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(style.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(sanitized_content.encode("utf-8"))
+        return digest.hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """查询缓存，先查内存再查数据库"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                self._stats["memory_hits"] += 1
+                return dict(data)
+
+        data = None
+        if self.persist:
+            data = await asyncio.to_thread(self._load_persistent, key)
+
+        with self._lock:
+            if data is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            self._stats["persistent_hits"] += 1
+            self._put_memory(key, data)
+        return dict(data)
+
+    async def set(self, key: str, data: Dict[str, Any], style: str, prompt_version: str) -> None:
+        """写入缓存（内存立即生效，数据库在线程池中写入）"""
+        with self._lock:
+            self._put_memory(key, data)
+            self._stats["stores"] += 1
+        if self.persist:
+            await asyncio.to_thread(self._store_persistent, key, data, style, prompt_version)
+
+    def _put_memory(self, key: str, data: Dict[str, Any]) -> None:
+        """写入内存 LRU，超出条目数或字节上限时淘汰最久未使用的条目（调用方持有锁）"""
+        size = len(data.get("markdown", "").encode("utf-8"))
+        if key in self._entries:
+            self._bytes -= self._entry_sizes.pop(key, 0)
+            del self._entries[key]
+        self._entries[key] = data
+        self._entry_sizes[key] = size
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            old_key, _ = self._entries.popitem(last=False)
+            self._bytes -= self._entry_sizes.pop(old_key, 0)
+            self._stats["evictions"] += 1
+
+    def _load_persistent(self, key: str) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            entry = db.query(AIResultCacheEntry).filter(AIResultCacheEntry.cache_key == key).first()
+            if not entry:
+                return None
+            entry.hit_count += 1
+            entry.last_hit_at = datetime.now(timezone.utc)
+            db.commit()
+            return {"title": entry.title, "markdown": entry.markdown, "format": "markdown"}
+        except Exception as e:
+            db.rollback()
+            self._stats["persistent_errors"] += 1
+            print(f"⚠️ 读取AI结果缓存失败: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _store_persistent(self, key: str, data: Dict[str, Any], style: str, prompt_version: str) -> None:
+        db = SessionLocal()
+        try:
+            # 提示词模板变化后，清理旧版本的条目（仅首次遇到新版本时执行）
+            if prompt_version not in self._purged_versions:
+                db.query(AIResultCacheEntry).filter(
+                    AIResultCacheEntry.style == style,
+                    AIResultCacheEntry.prompt_version != prompt_version
+                ).delete(synchronize_session=False)
+                self._purged_versions.add(prompt_version)
+
+            markdown = data.get("markdown", "")
+            entry = db.query(AIResultCacheEntry).filter(AIResultCacheEntry.cache_key == key).first()
+            if entry is None:
+                entry = AIResultCacheEntry(cache_key=key, style=style, prompt_version=prompt_version, hit_count=0)
+                db.add(entry)
+            entry.title = (data.get("title") or "")[:200]
+            entry.markdown = markdown
+            entry.size_bytes = len(markdown.encode("utf-8"))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self._stats["persistent_errors"] += 1
+            print(f"⚠️ 写入AI结果缓存失败: {e}")
+        finally:
+            db.close()
+
+    def get_stats(self, include_persistent: bool = True) -> Dict[str, Any]:
+        """缓存统计：命中率、内存占用、持久化条目数与字节数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._entries)
+            stats["memory_bytes"] = self._bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["max_bytes"] = self.max_bytes
+
+        if include_persistent and self.persist:
+            db = SessionLocal()
+            try:
+                count, total_bytes = db.query(
+                    func.count(AIResultCacheEntry.cache_key),
+                    func.coalesce(func.sum(AIResultCacheEntry.size_bytes), 0)
+                ).one()
+                stats["persistent_entries"] = count
+                stats["persistent_bytes"] = int(total_bytes)
+            except Exception as e:
+                stats["persistent_error"] = str(e)
+            finally:
+                db.close()
+        return stats
+
+
+# 全局 AI 结果缓存实例
+ai_result_cache = AIResultCache(
+    max_entries=settings.ai_result_cache_max_entries,
+    max_bytes=settings.ai_result_cache_max_bytes,
+    persist=settings.ai_result_cache_persist,
+)
@@ -12,6 +12,9 @@ from threading import Lock
 from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 
+from app.core.config import settings
+from app.core.ai_tokens import estimate_tokens
+
 
 
 @dataclass
@@ -200,7 +203,8 @@ class CreditCalculationCache:
     def calculate_credit_cost_cached(content: str) -> int:
         """
         统一的积分成本计算方法（带缓存）
-        计费规则：每100个字符消耗1个积分（向上取整）
+        计费规则：每100个字符消耗1个积分（向上取整）；
+        CREDIT_PRICING_UNIT=tokens 时按本地估算的 token 数计费（估算结果确定，预估与实际扣费一致）
         """
         # 先尝试从缓存获取
         cached_cost = CreditCalculationCache.get_cached_credit_cost(content, 'unified')
@@ -208,12 +212,23 @@ class CreditCalculationCache:
             return cached_cost
         
         # 计算成本
-        text_length = len(content.strip())
-        cost = max(1, (text_length + 99) // 100)  # 每100字符1积分，向上取整
+        if settings.credit_pricing_unit == "tokens":
+            per_credit = max(1, settings.credit_tokens_per_credit)
+            cost = max(1, (estimate_tokens(content.strip()) + per_credit - 1) // per_credit)
+        else:
+            text_length = len(content.strip())
+            cost = max(1, (text_length + 99) // 100)  # 每100字符1积分，向上取整
         
         # 存入缓存
         CreditCalculationCache.set_credit_cost_cache(content, cost, 'unified')
         return cost
+    
+    @staticmethod
+    def pricing_rule() -> str:
+        """当前计费规则说明（随接口返回给前端）"""
+        if settings.credit_pricing_unit == "tokens":
+            return f"每{max(1, settings.credit_tokens_per_credit)}个token消耗1积分（向上取整）"
+        return "每100个字符消耗1积分（向上取整）"
 
 
 # 导出主要接口
@@ -0,0 +1,662 @@
+"""
+异步生成任务服务 - 数据库队列 + 进程内 async worker 池
+无需外部消息中间件：任务写入 generation_jobs 表，worker 通过条件更新原子认领，
+执行流程为 解析 → 扣费 → 生成 → 失败退款，状态与结果持久化供客户端轮询或订阅
+"""
+
+import asyncio
+import json
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.ai_processor import ai_processor
+from app.core.ai_resilience import Deadline
+from app.models.generation_job import GenerationJob, JobStatus
+from app.services.credit_service import CreditService
+from app.services.cache_service import CreditCalculationCache
+from app.services.parse_executor import parse_executor, ParseQueueFullError, ParseTimeoutError
+
+
+class GenerationJobService:
+    """生成任务的数据库操作"""
+
+    @staticmethod
+    def create_job(db: Session, user_id: int, source_type: str, input_text: Optional[str] = None,
+                   input_path: Optional[str] = None, filename: Optional[str] = None,
+                   file_type: Optional[str] = None, style: Optional[str] = None,
+                   output_format: str = "markdown", priority: int = 1,
+                   credit_cost: Optional[int] = None) -> GenerationJob:
+        """
+        创建排队中的生成任务
+
+        Args:
+            source_type: text（文本）/ file（待解析的上传文件）/ file_token（已解析的文件内容）
+            input_text: 文本或已解析内容；source_type 为 file 时为空
+            input_path: 待解析文件的落盘路径，任务结束后删除
+            output_format: markdown / tree（JSON 树，结果中附带由树派生的 Markdown）
+        """
+        job = GenerationJob(
+            user_id=user_id,
+            status=JobStatus.QUEUED,
+            source_type=source_type,
+            input_text=input_text,
+            input_path=input_path,
+            filename=filename,
+            file_type=file_type,
+            style=style,
+            output_format=output_format,
+            priority=priority,
+            credit_cost=credit_cost,
+            credits_charged=False,
+            attempts=0
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    @staticmethod
+    def get_user_job(db: Session, job_id: str, user_id: int) -> Optional[GenerationJob]:
+        """获取用户自己的任务，ID 非法或无权访问时返回 None"""
+        try:
+            job_uuid = uuid.UUID(str(job_id))
+        except ValueError:
+            return None
+        return db.query(GenerationJob).filter(
+            GenerationJob.id == job_uuid,
+            GenerationJob.user_id == user_id
+        ).first()
+
+    @staticmethod
+    def list_user_jobs(db: Session, user_id: int, limit: int = 20) -> List[GenerationJob]:
+        return db.query(GenerationJob).filter(
+            GenerationJob.user_id == user_id
+        ).order_by(GenerationJob.created_at.desc()).limit(limit).all()
+
+    @staticmethod
+    def to_dict(job: GenerationJob, include_result: bool = True) -> Dict[str, Any]:
+        """任务的对外表示（不含输入内容）"""
+        payload = {
+            "job_id": str(job.id),
+            "status": job.status,
+            "source_type": job.source_type,
+            "filename": job.filename,
+            "file_type": job.file_type,
+            "style": job.style,
+            "output_format": job.output_format,
+            "credit_cost": job.credit_cost,
+            "attempts": job.attempts,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "started_at": job.started_at.isoformat() if job.started_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        }
+        if job.status == JobStatus.FAILED:
+            payload["error"] = job.error
+            payload["error_code"] = job.error_code
+        if include_result and job.status == JobStatus.SUCCEEDED and job.result:
+            payload["result"] = json.loads(job.result)
+        return payload
+
+    @staticmethod
+    def claim_next_job(db: Session, worker_id: str) -> Optional[GenerationJob]:
+        """
+        按用户轮转原子认领排队任务：优先认领执行中任务最少的用户（相同时按其最早排队任务的时间），
+        取该用户最早的排队任务，单个用户大量提交时不会让其他用户一直等待
+        先读候选再做带状态条件的 UPDATE，只有更新成功（rowcount == 1）的 worker 拿到任务，
+        多进程/多实例共享同一数据库时也不会重复执行
+        """
+        running = db.query(
+            GenerationJob.user_id, func.count(GenerationJob.id).label("running")
+        ).filter(GenerationJob.status == JobStatus.RUNNING).group_by(GenerationJob.user_id).subquery()
+        heads = db.query(
+            GenerationJob.user_id, func.min(GenerationJob.created_at).label("head")
+        ).filter(GenerationJob.status == JobStatus.QUEUED).group_by(GenerationJob.user_id).subquery()
+        users = db.query(heads.c.user_id).outerjoin(
+            running, running.c.user_id == heads.c.user_id
+        ).order_by(func.coalesce(running.c.running, 0), heads.c.head).limit(5).all()
+
+        candidates = []
+        for (user_id,) in users:
+            candidate = db.query(GenerationJob.id).filter(
+                GenerationJob.user_id == user_id,
+                GenerationJob.status == JobStatus.QUEUED
+            ).order_by(GenerationJob.created_at).first()
+            if candidate:
+                candidates.append(candidate)
+
+        for (job_id,) in candidates:
+            now = datetime.now(timezone.utc)
+            claimed = db.execute(
+                update(GenerationJob)
+                .where(GenerationJob.id == job_id, GenerationJob.status == JobStatus.QUEUED)
+                .values(
+                    status=JobStatus.RUNNING,
+                    worker_id=worker_id,
+                    started_at=now,
+                    heartbeat_at=now,
+                    attempts=GenerationJob.attempts + 1
+                )
+            ).rowcount
+            db.commit()
+            if claimed:
+                return db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+        return None
+
+    @staticmethod
+    def touch(db: Session, job: GenerationJob) -> None:
+        """刷新心跳，避免执行中的任务被判定为失联"""
+        job.heartbeat_at = datetime.now(timezone.utc)
+        db.commit()
+
+    @staticmethod
+    def heartbeat(db: Session, job_id: uuid.UUID, worker_id: str) -> bool:
+        """
+        执行期间定期刷新心跳；只更新仍由该 worker 执行中的任务，
+        返回 False 表示任务已被回收或由其他 worker 重新认领
+        """
+        updated = db.execute(
+            update(GenerationJob)
+            .where(
+                GenerationJob.id == job_id,
+                GenerationJob.status == JobStatus.RUNNING,
+                GenerationJob.worker_id == worker_id
+            )
+            .values(heartbeat_at=datetime.now(timezone.utc))
+        ).rowcount
+        db.commit()
+        return bool(updated)
+
+    @staticmethod
+    def mark_succeeded(db: Session, job: GenerationJob, result: Dict[str, Any]) -> None:
+        job.status = JobStatus.SUCCEEDED
+        job.result = json.dumps(result, ensure_ascii=False)
+        job.error = None
+        job.error_code = None
+        job.finished_at = datetime.now(timezone.utc)
+        db.commit()
+
+    @staticmethod
+    def requeue(db: Session, job: GenerationJob, error: str, error_code: str) -> None:
+        """
+        扣费前的临时失败（解析排队已满、解析超时）重新排队，保留上传文件供下次执行；
+        错误信息仅作记录，任务最终成功时会被清除
+        """
+        job.status = JobStatus.QUEUED
+        job.worker_id = None
+        job.error = error
+        job.error_code = error_code
+        db.commit()
+
+    @staticmethod
+    def mark_failed(db: Session, job: GenerationJob, error: str, error_code: str) -> None:
+        """
+        标记任务失败；已扣费的任务在同一事务中退还积分并清除扣费标记，
+        退款失败时回滚未提交的修改，扣费标记保持为 True
+        """
+        job.status = JobStatus.FAILED
+        job.error = error
+        job.error_code = error_code
+        job.finished_at = datetime.now(timezone.utc)
+
+        if job.credits_charged and job.credit_cost:
+            job.credits_charged = False
+            refund_success, refund_error, _ = CreditService.refund_credits(
+                db, job.user_id, job.credit_cost,
+                f"异步任务失败退款 - 任务: {job.id}, 原因: {error}"
+            )
+            if refund_success:
+                return
+            # 退款失败时保留扣费标记，便于人工核对
+            print(f"严重错误: 用户 {job.user_id} 的积分退款失败: {refund_error}")
+            job = GenerationJobService._reload_after_failed_refund(db, job)
+            job.status = JobStatus.FAILED
+            job.error = error
+            job.error_code = error_code
+            job.finished_at = datetime.now(timezone.utc)
+        db.commit()
+
+    @staticmethod
+    def recover_stale_jobs(db: Session) -> int:
+        """
+        回收心跳超时的执行中任务（worker 崩溃或进程重启）
+        已扣费的先退款；未超过最大尝试次数的重新排队，否则标记失败
+
+        Returns:
+            int: 回收的任务数
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.generation_job_stale_seconds)
+        stale_jobs = db.query(GenerationJob).filter(
+            GenerationJob.status == JobStatus.RUNNING,
+            GenerationJob.heartbeat_at < cutoff
+        ).all()
+
+        for job in stale_jobs:
+            if job.attempts >= settings.generation_job_max_attempts:
+                GenerationJobService.mark_failed(db, job, "任务多次执行中断，已停止重试", "JOB_ABANDONED")
+                GenerationJobWorkerPool.remove_input_file(job.input_path)
+                continue
+
+            job.status = JobStatus.QUEUED
+            job.worker_id = None
+            if job.credits_charged and job.credit_cost:
+                job.credits_charged = False
+                refund_success, refund_error, _ = CreditService.refund_credits(
+                    db, job.user_id, job.credit_cost,
+                    f"异步任务中断退款（将重新执行） - 任务: {job.id}"
+                )
+                if refund_success:
+                    continue
+                print(f"严重错误: 用户 {job.user_id} 的积分退款失败: {refund_error}")
+                job = GenerationJobService._reload_after_failed_refund(db, job)
+                job.status = JobStatus.FAILED
+                job.error = "任务执行中断且积分退还失败"
+                job.error_code = "JOB_ABANDONED"
+                job.finished_at = datetime.now(timezone.utc)
+            db.commit()
+        return len(stale_jobs)
+
+    @staticmethod
+    def _reload_after_failed_refund(db: Session, job: GenerationJob) -> GenerationJob:
+        """
+        退款失败后回滚会话中未提交的修改（含已清除的扣费标记），重新加载任务并保留扣费标记
+        部分失败分支（如积分记录不存在）不会自行回滚，不回滚的话后续提交会把扣费标记一并清除
+        """
+        job_id = job.id
+        db.rollback()
+        job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+        job.credits_charged = True
+        return job
+
+
+class JobFailure(Exception):
+    """任务执行中的业务失败（带错误码）；retryable 表示扣费前的临时失败，可重新排队"""
+
+    def __init__(self, message: str, code: str, retryable: bool = False):
+        super().__init__(message)
+        self.code = code
+        self.retryable = retryable
+
+
+class GenerationJobWorkerPool:
+    """
+    进程内 async worker 池
+    worker 空闲时按轮询间隔检查队列；本进程提交的任务会立即唤醒 worker
+    任务执行期间后台定期刷新心跳（间隔为失联判定时间的 1/4），长时间生成不会被误判为失联而重复执行
+    """
+
+    def __init__(self, concurrency: int = 2, poll_interval_seconds: float = 1.0):
+        self.concurrency = max(1, concurrency)
+        self.poll_interval_seconds = poll_interval_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        # job_id -> 等待状态变化的订阅者
+        self._listeners: Dict[str, Set[asyncio.Event]] = {}
+        self._stats = {
+            "claimed": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "retried": 0,
+            "recovered": 0,
+            "active": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker_loop(index)) for index in range(self.concurrency)
+        ]
+        self._tasks.append(asyncio.create_task(self._recovery_loop()))
+        print(f"✅ 生成任务 worker 已启动: {self.concurrency} 个 ({self.worker_id})")
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def notify_new_job(self) -> None:
+        """唤醒空闲 worker"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def wait_for_update(self, job_id: str, timeout: float) -> None:
+        """等待任务状态变化（本进程内的变化立即返回，其余情况按超时返回后由调用方重新查询）"""
+        event = asyncio.Event()
+        listeners = self._listeners.setdefault(job_id, set())
+        listeners.add(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            listeners.discard(event)
+            if not listeners:
+                self._listeners.pop(job_id, None)
+
+    def _notify_update(self, job_id: str) -> None:
+        for event in self._listeners.get(job_id, ()):
+            event.set()
+
+    async def _worker_loop(self, index: int) -> None:
+        while True:
+            try:
+                job_id = await asyncio.to_thread(self._claim)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ 认领生成任务失败: {e}")
+                job_id = None
+
+            if job_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._stats["claimed"] += 1
+            self._stats["active"] += 1
+            try:
+                await self._execute(job_id)
+            finally:
+                self._stats["active"] -= 1
+
+    async def _recovery_loop(self) -> None:
+        interval = max(self.poll_interval_seconds, settings.generation_job_stale_seconds / 4)
+        while True:
+            try:
+                recovered = await asyncio.to_thread(self._recover)
+                if recovered:
+                    self._stats["recovered"] += recovered
+                    print(f"♻️ 已回收 {recovered} 个中断的生成任务")
+                    self.notify_new_job()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ 回收中断任务失败: {e}")
+            await asyncio.sleep(interval)
+
+    def _claim(self) -> Optional[str]:
+        db = SessionLocal()
+        try:
+            job = GenerationJobService.claim_next_job(db, self.worker_id)
+            return str(job.id) if job else None
+        finally:
+            db.close()
+
+    def _recover(self) -> int:
+        db = SessionLocal()
+        try:
+            return GenerationJobService.recover_stale_jobs(db)
+        finally:
+            db.close()
+
+    async def _heartbeat_loop(self, job_id: str) -> None:
+        interval = max(1.0, settings.generation_job_stale_seconds / 4)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await asyncio.to_thread(self._heartbeat, job_id):
+                    print(f"⚠️ 生成任务 {job_id} 已不由本 worker 执行，停止刷新心跳")
+                    return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ 刷新生成任务 {job_id} 心跳失败: {e}")
+
+    def _heartbeat(self, job_id: str) -> bool:
+        db = SessionLocal()
+        try:
+            return GenerationJobService.heartbeat(db, uuid.UUID(job_id), self.worker_id)
+        finally:
+            db.close()
+
+    async def _execute(self, job_id: str) -> None:
+        """执行单个任务：解析 → 扣费 → 生成 → 失败退款；执行期间后台刷新心跳"""
+        self._notify_update(job_id)
+        heartbeat = asyncio.create_task(self._heartbeat_loop(job_id))
+        try:
+            job_input = await asyncio.to_thread(self._load_input, job_id)
+            if not job_input["content"] and job_input["input_path"]:
+                job_input["content"], job_input["parse_report"] = await self._parse_input(job_input)
+                await asyncio.to_thread(self._store_parsed_input, job_id, job_input["content"])
+            content = job_input["content"]
+            if not content or not content.strip():
+                raise JobFailure("文本内容不能为空", "EMPTY_CONTENT")
+
+            cached_data = await ai_processor.get_cached_result(
+                content, style=job_input["style"], output_format=job_input["output_format"]
+            )
+            if cached_data:
+                remaining_balance = await asyncio.to_thread(self._current_balance, job_input["user_id"])
+                await asyncio.to_thread(
+                    self._finish_success, job_id,
+                    self._build_result(job_input, cached_data, 0, remaining_balance, cached=True)
+                )
+                return
+
+            # AI服务熔断时不扣费，任务直接失败
+            retry_after = ai_processor.circuit_retry_after()
+            if retry_after is not None:
+                raise JobFailure(f"AI服务暂时不可用，请 {retry_after} 秒后重试", "AI_TEMPORARY_UNAVAILABLE")
+
+            credit_cost, remaining_balance = await asyncio.to_thread(self._charge, job_id, content)
+
+            mindmap_result = await ai_processor.generate_mindmap_structure(
+                content,
+                style=job_input["style"],
+                user_id=job_input["user_id"],
+                priority=job_input["priority"],
+                deadline=Deadline(settings.ai_request_budget_seconds),
+                output_format=job_input["output_format"]
+            )
+            if not mindmap_result["success"]:
+                raise JobFailure(
+                    mindmap_result.get("error", "Unknown error"),
+                    mindmap_result.get("code", "AI_ERROR")
+                )
+
+            await asyncio.to_thread(
+                self._finish_success, job_id,
+                self._build_result(job_input, mindmap_result["data"], credit_cost, remaining_balance)
+            )
+        except asyncio.CancelledError:
+            # 进程关闭：任务保持 running，心跳超时后由回收流程退款并重新排队
+            raise
+        except JobFailure as e:
+            if e.retryable:
+                # 退避后重新排队，避免解析繁忙时立即被再次认领
+                await asyncio.sleep(settings.generation_job_retry_delay_seconds)
+                await asyncio.to_thread(self._finish_retry, job_id, str(e), e.code)
+            else:
+                await asyncio.to_thread(self._finish_failure, job_id, str(e), e.code)
+        except Exception as e:
+            print(f"生成任务 {job_id} 执行异常: {e}")
+            await asyncio.to_thread(self._finish_failure, job_id, f"任务执行失败: {e}", "JOB_ERROR")
+        finally:
+            heartbeat.cancel()
+            self._notify_update(job_id)
+
+    def _load_input(self, job_id: str) -> Dict[str, Any]:
+        """加载任务输入并刷新心跳；上传文件尚未解析时 content 为空"""
+        db = SessionLocal()
+        try:
+            job = db.query(GenerationJob).filter(GenerationJob.id == uuid.UUID(job_id)).first()
+            GenerationJobService.touch(db, job)
+            return {
+                "content": job.input_text,
+                "input_path": job.input_path,
+                "style": job.style,
+                "output_format": job.output_format,
+                "user_id": job.user_id,
+                "priority": job.priority,
+                "filename": job.filename,
+                "file_type": job.file_type,
+            }
+        finally:
+            db.close()
+
+    async def _parse_input(self, job_input: Dict[str, Any]) -> tuple:
+        """
+        在解析进程池中解析上传文件（超时与内存上限、解析预算与同步上传接口一致）
+        排队已满与解析超时为可重试失败，任务重新排队；其余解析错误直接失败
+        """
+        filename = job_input["filename"] or f"upload{job_input['file_type'] or ''}"
+        try:
+            content, parse_report = await parse_executor.parse(job_input["input_path"], filename)
+        except ParseQueueFullError as e:
+            raise JobFailure(f"文件解析繁忙，稍后自动重试: {e}", "PARSE_QUEUE_FULL", retryable=True)
+        except ParseTimeoutError as e:
+            raise JobFailure(f"文件解析超时，文件可能过大或结构过于复杂: {e}", "PARSE_TIMEOUT", retryable=True)
+        except Exception as e:
+            raise JobFailure(f"文件解析失败: {e}", "PARSE_FAILED")
+        if not content:
+            raise JobFailure("文件解析失败，请检查文件内容", "PARSE_FAILED")
+        return content, parse_report
+
+    def _store_parsed_input(self, job_id: str, content: str) -> None:
+        """解析结果写回任务，重试时复用"""
+        db = SessionLocal()
+        try:
+            job = db.query(GenerationJob).filter(GenerationJob.id == uuid.UUID(job_id)).first()
+            job.input_text = content
+            GenerationJobService.touch(db, job)
+        finally:
+            db.close()
+
+    def _charge(self, job_id: str, content: str) -> tuple:
+        """
+        扣除积分；扣费标记与扣费记录在同一事务中提交，
+        进程在任意时刻中断都能据此判断是否需要退款
+        """
+        db = SessionLocal()
+        try:
+            job = db.query(GenerationJob).filter(GenerationJob.id == uuid.UUID(job_id)).first()
+            credit_cost = job.credit_cost
+            if credit_cost is None:
+                credit_cost = CreditCalculationCache.calculate_credit_cost_cached(content)
+            job.credit_cost = credit_cost
+            job.credits_charged = True
+            job.heartbeat_at = datetime.now(timezone.utc)
+
+            deduct_success, deduct_error, remaining_balance = CreditService.deduct_credits(
+                db,
+                job.user_id,
+                credit_cost,
+                f"异步生成思维导图 - 任务: {job.id}, 文本长度: {len(content.strip())} 字符"
+            )
+            if not deduct_success:
+                code = "INSUFFICIENT_CREDITS" if "积分不足" in (deduct_error or "") else "CREDIT_DEDUCT_FAILED"
+                raise JobFailure(deduct_error or "积分扣除失败", code)
+            return credit_cost, remaining_balance
+        finally:
+            db.close()
+
+    def _current_balance(self, user_id: int) -> int:
+        db = SessionLocal()
+        try:
+            user_credits = CreditService.get_user_credits(db, user_id)
+            return user_credits.balance if user_credits else 0
+        finally:
+            db.close()
+
+    @staticmethod
+    def _build_result(job_input: Dict[str, Any], data: Dict[str, Any], credit_cost: int,
+                      remaining_balance: int, cached: bool = False) -> Dict[str, Any]:
+        content = job_input["content"]
+        result = {
+            "success": True,
+            "content_preview": content[:200] + "..." if len(content) > 200 else content,
+            "data": data,
+            "format": job_input["output_format"],
+            "cost_info": {
+                "credits_consumed": credit_cost,
+                "remaining_credits": remaining_balance,
+                "text_length": len(content.strip())
+            }
+        }
+        if job_input.get("filename"):
+            result["filename"] = job_input["filename"]
+            result["file_type"] = job_input["file_type"]
+        if job_input.get("parse_report"):
+            result["parse_report"] = job_input["parse_report"]
+        if cached:
+            result["cached"] = True
+        return result
+
+    def _finish_success(self, job_id: str, result: Dict[str, Any]) -> None:
+        db = SessionLocal()
+        try:
+            job = db.query(GenerationJob).filter(GenerationJob.id == uuid.UUID(job_id)).first()
+            GenerationJobService.mark_succeeded(db, job, result)
+            self.remove_input_file(job.input_path)
+            self._stats["succeeded"] += 1
+        finally:
+            db.close()
+
+    def _finish_failure(self, job_id: str, error: str, error_code: str) -> None:
+        db = SessionLocal()
+        try:
+            job = db.query(GenerationJob).filter(GenerationJob.id == uuid.UUID(job_id)).first()
+            GenerationJobService.mark_failed(db, job, error, error_code)
+            self.remove_input_file(job.input_path)
+            self._stats["failed"] += 1
+        finally:
+            db.close()
+
+    def _finish_retry(self, job_id: str, error: str, error_code: str) -> None:
+        """可重试失败：未超过最大尝试次数时重新排队，否则按失败处理"""
+        db = SessionLocal()
+        try:
+            job = db.query(GenerationJob).filter(GenerationJob.id == uuid.UUID(job_id)).first()
+            if job.attempts < settings.generation_job_max_attempts:
+                GenerationJobService.requeue(db, job, error, error_code)
+                self._stats["retried"] += 1
+                self.notify_new_job()
+                return
+            GenerationJobService.mark_failed(db, job, error, error_code)
+            self.remove_input_file(job.input_path)
+            self._stats["failed"] += 1
+        finally:
+            db.close()
+
+    @staticmethod
+    def remove_input_file(path: Optional[str]) -> None:
+        if not path:
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"⚠️ 删除任务上传文件失败: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["workers"] = self.concurrency
+        stats["running"] = self.running
+        stats["worker_id"] = self.worker_id
+        return stats
+
+
+# 全局生成任务 worker 池
+generation_job_pool = GenerationJobWorkerPool(
+    concurrency=settings.generation_job_workers,
+    poll_interval_seconds=settings.generation_job_poll_interval_seconds,
+)
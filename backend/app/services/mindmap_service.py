@@ -5,6 +5,7 @@
 from __future__ import annotations
 
 import base64
+import json
 import uuid
 from dataclasses import dataclass
 from datetime import datetime
@@ -90,10 +91,13 @@ class MindmapService:
         return items, next_cursor, has_next
 
     # 写入/修改
-    def create(self, *, user: User, title: str, content: str, description: Optional[str], tags: Optional[str], is_public: bool) -> Mindmap:
+    def create(self, *, user: User, title: str, content: str, description: Optional[str], tags: Optional[str], is_public: bool,
+               structure: Optional[dict] = None, source_text: Optional[str] = None) -> Mindmap:
         mindmap = Mindmap(
             title=title.strip(),
             content=content,
+            structure=json.dumps(structure, ensure_ascii=False) if structure else None,
+            source_text=source_text or None,
             description=(description or None),
             tags=(tags or None),
             is_public=bool(is_public),
@@ -104,9 +108,15 @@ class MindmapService:
         self.db.refresh(mindmap)
         return mindmap
 
-    def update_full(self, *, mindmap: Mindmap, title: str, content: str, description: Optional[str], tags: Optional[str], is_public: bool) -> Mindmap:
+    def update_full(self, *, mindmap: Mindmap, title: str, content: str, description: Optional[str], tags: Optional[str], is_public: bool,
+                    structure: Optional[dict] = None, source_text: Optional[str] = None) -> Mindmap:
         mindmap.title = title.strip()
         mindmap.content = content
+        # 仅更新 Markdown 时旧树已过期，一并清除
+        mindmap.structure = json.dumps(structure, ensure_ascii=False) if structure else None
+        # 未提供源文本时保留原有源文本
+        if source_text:
+            mindmap.source_text = source_text
         mindmap.description = description
         mindmap.tags = tags
         mindmap.is_public = bool(is_public)
@@ -114,6 +124,16 @@ class MindmapService:
         self.db.refresh(mindmap)
         return mindmap
 
+    def apply_regeneration(self, *, mindmap: Mindmap, title: str, content: str, source_text: str) -> Mindmap:
+        """保存重新生成的结果：Markdown 已变化，旧树一并清除"""
+        mindmap.title = title.strip()[:200]
+        mindmap.content = content
+        mindmap.structure = None
+        mindmap.source_text = source_text
+        self.db.commit()
+        self.db.refresh(mindmap)
+        return mindmap
+
     def patch(self, *, mindmap: Mindmap, updates: dict) -> Mindmap:
         for key, value in updates.items():
             setattr(mindmap, key, value)
@@ -131,6 +151,7 @@ def convert_mindmap_to_response(mindmap: Mindmap) -> MindmapResponse:
         id=str(mindmap.id),
         title=mindmap.title,
         content=mindmap.content,
+        structure=mindmap.get_structure(),
         description=mindmap.description,
         tags=mindmap.tags.split(',') if mindmap.tags else [],
         is_public=mindmap.is_public,
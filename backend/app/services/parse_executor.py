@@ -0,0 +1,445 @@
+"""
+文件解析执行器：上传文件在独立的进程池中解析，pdfplumber 等纯 Python 解析不再阻塞事件循环
+- worker 以 spawn 方式启动（父进程中的 gRPC 等线程不适合 fork），启动时预先导入解析库
+- 排队数有上限，超出时直接拒绝；worker 进程限制可用内存
+- 每个 worker 是独立进程，同一时间只执行一个任务；超时从任务开始执行时计算，
+  超时后只终止执行该任务的进程并补充新进程，其他进程上的任务不受影响
+- 大 PDF 落盘后按页分片，由多个 worker 各自打开同一文件并行提取，结果按页序拼接
+- 按解析预算提取：达到字符/token 上限后不再提取后续页（或按页均匀抽样），跳过的内容写入解析报告
+- 上传文件已落盘时只传递路径，worker 直接读取文件（文本类内存映射），不经进程间传输整份字节
+- 记录排队深度与各格式的解析耗时
+"""
+
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Set, Tuple, Union
+
+from app.core.config import settings
+from app.core.extraction_budget import ExtractionBudget
+
+
+# 待解析的文件：内存中的字节，或已落盘的文件路径
+ParseSource = Union[bytes, str]
+
+
+class ParseQueueFullError(Exception):
+    """排队中的解析任务数已达上限"""
+
+
+class ParseTimeoutError(Exception):
+    """单个解析任务执行超时（执行该任务的进程已被终止）"""
+
+
+def _current_address_space() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _init_worker(memory_limit_mb: int) -> None:
+    """worker 预热：预先导入解析库；在当前地址空间之上限制可再分配的内存"""
+    import docx  # noqa: F401
+    import PyPDF2  # noqa: F401
+    import pdfplumber  # noqa: F401
+    from app.core.file_parser import file_parser  # noqa: F401
+    try:
+        # PyMuPDF 为可选的快速引擎
+        import fitz  # noqa: F401
+    except ImportError:
+        pass
+
+    if memory_limit_mb > 0:
+        try:
+            import resource
+            limit = _current_address_space() + memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError) as e:
+            print(f"解析进程内存上限设置失败: {e}")
+
+
+def _worker_main(conn, memory_limit_mb: int) -> None:
+    """worker 进程主循环：初始化完成后通知父进程，然后逐个执行 (函数, 参数) 任务，None 表示退出"""
+    _init_worker(memory_limit_mb)
+    conn.send("ready")
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        fn, args = task
+        try:
+            reply = (True, fn(*args))
+        except BaseException as e:
+            reply = (False, e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # 结果或异常无法序列化时只回传错误描述
+            conn.send((False, Exception(f"解析结果无法回传: {e}")))
+
+
+class _WorkerCrashedError(Exception):
+    """worker 进程在执行任务期间退出"""
+
+
+class _ParseWorker:
+    """一个解析进程及与其通信的管道；收发均为阻塞调用，在执行器的 IO 线程中进行"""
+
+    def __init__(self, context, memory_limit_mb: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_limit_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.broken = False
+
+    def wait_ready(self) -> None:
+        try:
+            self.conn.recv()
+        except (EOFError, OSError) as e:
+            self.broken = True
+            raise _WorkerCrashedError(f"解析进程启动失败: {e}")
+
+    def call(self, fn: Callable, args: Tuple) -> Tuple[bool, Any]:
+        try:
+            self.conn.send((fn, args))
+            return self.conn.recv()
+        except (EOFError, OSError) as e:
+            self.broken = True
+            raise _WorkerCrashedError(str(e))
+
+    @property
+    def usable(self) -> bool:
+        return not self.broken and self.process.is_alive()
+
+    def kill(self) -> None:
+        self.broken = True
+        if self.process.is_alive():
+            self.process.kill()
+
+    def close(self) -> None:
+        """通知进程退出；未及时退出的进程由 daemon 标记随父进程结束"""
+        if self.usable:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+        self.conn.close()
+
+
+def _parse_in_worker(file_bytes: bytes, filename: str,
+                     budget: Optional[ExtractionBudget] = None) -> Tuple[Optional[str], Dict[str, Any]]:
+    from app.core.file_parser import file_parser
+    return file_parser.parse_with_report(file_bytes, filename, budget)
+
+
+def _parse_path_in_worker(path: str, filename: str,
+                          budget: Optional[ExtractionBudget] = None) -> Tuple[Optional[str], Dict[str, Any]]:
+    from app.core.file_parser import file_parser
+    return file_parser.parse_path_with_report(path, filename, budget)
+
+
+def _count_pdf_pages(path: str) -> int:
+    from app.core.file_parser import file_parser
+    from app.core.pdf_engines import count_pdf_pages
+    return count_pdf_pages(path, file_parser.pdf_engine_order)
+
+
+def _extract_pdf_pages(path: str, pages: Sequence[int]) -> Tuple[List[str], Optional[str]]:
+    from app.core.file_parser import file_parser
+    return file_parser.extract_pdf_page_range(path, pages)
+
+
+def _spool_to_temp_file(file_bytes: bytes, suffix: str) -> str:
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temp_file:
+        temp_file.write(file_bytes)
+        return temp_file.name
+
+
+def split_page_ranges(page_count: int, shards: int) -> List[Tuple[int, int]]:
+    """把 [0, page_count) 均分为 shards 个连续区间"""
+    base, extra = divmod(page_count, shards)
+    ranges = []
+    start = 0
+    for index in range(shards):
+        end = start + base + (1 if index < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+class ParseExecutor:
+    """
+    进程池解析执行器
+    workers 为 0 时退化为线程池执行（仍不阻塞事件循环，但受 GIL 限制）
+    超时针对单个任务，从任务被 worker 开始执行时计算，不含排队时间；分片解析时每个分片各自计时
+    """
+
+    _latency_samples = 200
+    _respawn_delay_seconds = 1.0
+
+    def __init__(self, workers: int = 2, max_pending: int = 16, timeout_seconds: float = 60.0,
+                 memory_limit_mb: int = 1024):
+        self.workers = max(0, workers)
+        self.max_pending = max(1, max_pending)
+        self.timeout_seconds = timeout_seconds
+        self.memory_limit_mb = memory_limit_mb
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: Optional[asyncio.Queue] = None
+        self._io: Optional[ThreadPoolExecutor] = None
+        self._workers: Set[_ParseWorker] = set()
+        self._pending = 0
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "timeouts": 0, "rejected": 0,
+                       "worker_restarts": 0, "sharded": 0}
+
+    def start(self) -> None:
+        """启动全部 worker 进程并预热（应用启动时调用）"""
+        if self.workers > 0:
+            self._ensure_workers()
+
+    def shutdown(self) -> None:
+        workers, self._workers = self._workers, set()
+        for worker in workers:
+            worker.close()
+        if self._io is not None:
+            self._io.shutdown(wait=False, cancel_futures=True)
+        self._idle = None
+        self._io = None
+
+    def _ensure_workers(self) -> None:
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        # 每个 worker 同一时间最多占用一个 IO 线程（等待启动或执行任务）
+        self._io = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="parse-io")
+        for _ in range(self.workers):
+            self._spawn()
+
+    def _spawn(self) -> None:
+        worker = _ParseWorker(self._context, self.memory_limit_mb)
+        self._workers.add(worker)
+        asyncio.ensure_future(self._wait_ready(worker, self._idle))
+
+    async def _wait_ready(self, worker: _ParseWorker, idle: asyncio.Queue) -> None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._io, worker.wait_ready)
+        except Exception as e:
+            print(f"{e}，{self._respawn_delay_seconds:.0f} 秒后重试")
+            await asyncio.sleep(self._respawn_delay_seconds)
+            self._replace(worker, idle)
+            return
+        if self._idle is idle:
+            idle.put_nowait(worker)
+        else:
+            worker.close()
+
+    def _replace(self, worker: _ParseWorker, idle: asyncio.Queue) -> None:
+        """终止一个 worker 并补充新进程（执行器已关闭或重启时不再补充）"""
+        worker.kill()
+        worker.close()
+        self._workers.discard(worker)
+        if self._idle is idle:
+            self._stats["worker_restarts"] += 1
+            self._spawn()
+
+    def _release(self, worker: _ParseWorker, idle: asyncio.Queue) -> None:
+        """任务结束（含调用方已放弃等待的任务真正结束）后归还 worker；进程已不可用时替换"""
+        if not worker.usable:
+            self._replace(worker, idle)
+        elif self._idle is idle:
+            idle.put_nowait(worker)
+        else:
+            worker.close()
+
+    async def parse(self, source: ParseSource, filename: str,
+                    budget: Optional[ExtractionBudget] = None) -> Tuple[Optional[str], Dict[str, Any]]:
+        """
+        解析上传文件，返回 (文本, 解析报告)；budget 为 None 时使用配置的解析预算
+        source 为文件路径时由调用方负责在解析结束后删除文件
+        """
+        if budget is None:
+            budget = ExtractionBudget.from_settings()
+        if self._pending >= self.max_pending:
+            self._stats["rejected"] += 1
+            raise ParseQueueFullError(f"排队解析的文件数已达上限 {self.max_pending}")
+        self._pending += 1
+        self._stats["submitted"] += 1
+        started = time.monotonic()
+        try:
+            if self.workers <= 0:
+                worker = _parse_in_worker if isinstance(source, bytes) else _parse_path_in_worker
+                result = await asyncio.wait_for(
+                    asyncio.to_thread(worker, source, filename, budget), timeout=self.timeout_seconds
+                )
+            else:
+                result = await self._parse_job(source, filename, budget)
+            self._stats["completed"] += 1
+            return result
+        except Exception:
+            self._stats["failed"] += 1
+            raise
+        finally:
+            self._pending -= 1
+            file_type = Path(filename).suffix.lower() or "unknown"
+            self._latencies.setdefault(file_type, deque(maxlen=self._latency_samples)).append(
+                time.monotonic() - started
+            )
+
+    async def _submit(self, fn: Callable, *args: Any) -> Any:
+        """
+        在空闲 worker 上执行一个任务：等待空闲 worker 的时间不计入超时；
+        超时后只终止该 worker 进程，调用方取消等待时任务继续执行完再归还 worker
+        """
+        self._ensure_workers()
+        idle = self._idle
+        worker = await idle.get()
+        if not worker.usable:
+            self._replace(worker, idle)
+            return await self._submit(fn, *args)
+        call = asyncio.get_running_loop().run_in_executor(self._io, worker.call, fn, args)
+        call.add_done_callback(lambda _: self._release(worker, idle))
+        try:
+            ok, value = await asyncio.wait_for(asyncio.shield(call), timeout=self.timeout_seconds)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            worker.kill()
+            raise ParseTimeoutError(f"文件解析超过 {self.timeout_seconds:.0f} 秒")
+        except _WorkerCrashedError:
+            # 本任务导致 worker 退出（如超出内存上限）
+            raise Exception("文件解析进程异常退出，文件可能过大或已损坏")
+        if not ok:
+            raise value
+        return value
+    
+    async def _parse_job(self, source: ParseSource, filename: str,
+                         budget: ExtractionBudget) -> Tuple[Optional[str], Dict[str, Any]]:
+        size = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+        if (self.workers > 1 and Path(filename).suffix.lower() == ".pdf"
+                and size >= settings.pdf_parallel_min_bytes):
+            return await self._parse_pdf_sharded(source, filename, budget)
+        if isinstance(source, bytes):
+            return await self._submit(_parse_in_worker, source, filename, budget)
+        return await self._submit(_parse_path_in_worker, source, filename, budget)
+    
+    async def _parse_pdf_sharded(self, source: ParseSource, filename: str,
+                                 budget: ExtractionBudget) -> Tuple[Optional[str], Dict[str, Any]]:
+        """
+        大 PDF 按页分片并行提取：字节只落盘一次（已落盘的上传文件直接使用），各 worker 直接打开同一文件
+        （引擎按需读取），只提取自己负责的页区间，结果按页序拼接
+        """
+        spooled = isinstance(source, bytes)
+        path = await asyncio.to_thread(_spool_to_temp_file, source, ".pdf") if spooled else source
+        try:
+            page_count = await self._submit(_count_pdf_pages, path)
+            shards = min(self.workers, page_count // max(1, settings.pdf_parallel_pages_per_shard))
+            if shards < 2:
+                return await self._submit(_parse_path_in_worker, path, filename, budget)
+            if budget.limited:
+                return await self._extract_pdf_budgeted(path, page_count, budget)
+            
+            results = await asyncio.gather(*[
+                self._submit(_extract_pdf_pages, path, range(start, end))
+                for start, end in split_page_ranges(page_count, shards)
+            ])
+            engines = list(dict.fromkeys(engine for _, engine in results if engine))
+            self._stats["sharded"] += 1
+            return "\n".join(page for pages, _ in results for page in pages if page), {
+                "pdf_engine": ",".join(engines),
+                "pdf_pages": page_count,
+                "pdf_shards": shards,
+            }
+        finally:
+            if spooled:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    async def _extract_pdf_budgeted(self, path: str, page_count: int,
+                                    budget: ExtractionBudget) -> Tuple[Optional[str], Dict[str, Any]]:
+        """
+        按预算分片提取：
+        head - 每轮由全部 worker 并行提取相邻的若干分片，预算用尽后不再提交后续页
+        sample - 先提取第一个分片估算单页长度，再把均匀抽中的其余页分给各 worker 提取
+        """
+        shard_pages = max(1, settings.pdf_parallel_pages_per_shard)
+        collector = budget.collector("pages")
+        collector.total_units = page_count
+        engines: List[Optional[str]] = []
+        shards = 0
+        if budget.strategy == "sample":
+            probe, engine = await self._submit(_extract_pdf_pages, path, range(min(page_count, shard_pages)))
+            engines.append(engine)
+            shards += 1
+            indices = budget.sample_plan(page_count, probe)
+            rest = [index for index in indices if index >= len(probe)]
+            fetched: Dict[int, str] = {}
+            if rest:
+                groups = [rest[start:end] for start, end in split_page_ranges(len(rest), min(self.workers, len(rest)))]
+                results = await asyncio.gather(*[self._submit(_extract_pdf_pages, path, group) for group in groups])
+                shards += len(groups)
+                engines.extend(engine for _, engine in results)
+                fetched = dict(zip(rest, (page for pages, _ in results for page in pages)))
+            collector.collect_sampled(page_count, indices, probe, fetched)
+        else:
+            wave_pages = shard_pages * self.workers
+            for wave_start in range(0, page_count, wave_pages):
+                wave_end = min(wave_start + wave_pages, page_count)
+                results = await asyncio.gather(*[
+                    self._submit(_extract_pdf_pages, path, range(start, min(start + shard_pages, wave_end)))
+                    for start in range(wave_start, wave_end, shard_pages)
+                ])
+                shards += len(results)
+                engines.extend(engine for _, engine in results)
+                for pages, _ in results:
+                    for page in pages:
+                        collector.add(page)
+                if collector.full:
+                    collector.skip_unread(page_count - wave_end)
+                    break
+        
+        self._stats["sharded"] += 1
+        report: Dict[str, Any] = {
+            "pdf_engine": ",".join(engine for engine in dict.fromkeys(engines) if engine),
+            "pdf_pages": page_count,
+            "pdf_shards": shards,
+        }
+        collector.record(report)
+        return "\n".join(page for page in collector.texts if page), report
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        latency = {}
+        for file_type, samples in self._latencies.items():
+            ordered = sorted(samples)
+            latency[file_type] = {
+                "count": len(ordered),
+                "avg_seconds": round(sum(ordered) / len(ordered), 3),
+                "p50_seconds": round(ordered[len(ordered) // 2], 3),
+                "p95_seconds": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                "max_seconds": round(ordered[-1], 3),
+            }
+        return {
+            **self._stats,
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "latency_by_format": latency,
+        }
+
+
+parse_executor = ParseExecutor(
+    workers=settings.parse_workers,
+    max_pending=settings.parse_max_pending,
+    timeout_seconds=settings.parse_timeout_seconds,
+    memory_limit_mb=settings.parse_memory_limit_mb,
+)
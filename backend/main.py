@@ -4,6 +4,7 @@ from fastapi.middleware.cors import CORSMiddleware
 import os
 from app.core import register_exception_handlers
 from app.core.config import settings
+from app.core.upload_limit import UploadSizeLimitMiddleware
 
 app = FastAPI(
     title="ThinkSo API",
@@ -36,14 +37,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 上传大小限制：接收请求体的过程中超过上限立即拒绝，不等整个文件上传完
+app.add_middleware(UploadSizeLimitMiddleware, max_body_bytes=settings.max_file_size)
+
 # 健康检查接口
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
+    from app.core.ai_processor import ai_processor
+    return {"status": "ok", "ai": ai_processor.get_health()}
 
 # 注册业务路由
 from app.api import upload, mindmaps, auth, share, invitations, admin, redemption
 from app.api import referrals
+from app.api import jobs
 
 app.include_router(upload.router, prefix="/api", tags=["upload"])
 app.include_router(mindmaps.router, prefix="/api/mindmaps", tags=["mindmaps"])
@@ -52,4 +58,19 @@ app.include_router(share.router, prefix="/api", tags=["share"])
 app.include_router(invitations.router, prefix="/api/invitations", tags=["invitations"])
 app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 app.include_router(redemption.router, prefix="/api/codes", tags=["redemption"])
-app.include_router(referrals.router, prefix="/api/referrals", tags=["referrals"])
\ No newline at end of file
+app.include_router(referrals.router, prefix="/api/referrals", tags=["referrals"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
+
+# 异步生成任务 worker 池与文件解析进程池随应用启停
+from app.services.generation_job_service import generation_job_pool
+from app.services.parse_executor import parse_executor
+
+@app.on_event("startup")
+async def start_generation_job_workers():
+    generation_job_pool.start()
+    parse_executor.start()
+
+@app.on_event("shutdown")
+async def stop_generation_job_workers():
+    await generation_job_pool.stop()
+    parse_executor.shutdown()
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""
+本地脚本：PDF 提取引擎基准（吞吐与文本保真度）
+
+对语料目录中的每个 PDF 分别用各引擎提取，统计每秒页数、每秒 MB 与提取字符数；
+保真度以参考引擎（默认 pdfplumber）的结果为基准，按字符二元组的 Jaccard 相似度计算。
+未安装的引擎自动跳过。
+
+使用方法（在 backend 目录执行）：
+   python scripts/benchmark_pdf_engines.py ./pdf_corpus
+   python scripts/benchmark_pdf_engines.py ./pdf_corpus --repeat 3 --reference pymupdf
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.core.pdf_engines import PDF_ENGINES, DEFAULT_ENGINE_ORDER, pages_look_valid  # noqa: E402
+
+_whitespace = re.compile(r'\s+')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="PDF 提取引擎基准")
+    parser.add_argument("corpus", help="PDF 语料目录（递归查找 *.pdf）")
+    parser.add_argument("--engines", default=",".join(DEFAULT_ENGINE_ORDER), help="参与对比的引擎，逗号分隔")
+    parser.add_argument("--reference", default="pdfplumber", help="保真度基准引擎")
+    parser.add_argument("--repeat", type=int, default=1, help="每个文件重复提取次数（取最短耗时）")
+    return parser.parse_args()
+
+
+def bigrams(text):
+    compact = _whitespace.sub('', text)
+    return {compact[i:i + 2] for i in range(len(compact) - 1)}
+
+
+def similarity(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def run_engine(name, data, repeat):
+    best = None
+    pages = []
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        pages = PDF_ENGINES[name](data)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return pages, best
+
+
+def main():
+    args = parse_args()
+    files = sorted(Path(args.corpus).rglob("*.pdf"))
+    if not files:
+        print(f"目录 {args.corpus} 中没有 PDF 文件")
+        return
+    engines = [name.strip() for name in args.engines.split(",") if name.strip() in PDF_ENGINES]
+    if args.reference not in engines:
+        engines.append(args.reference)
+
+    totals = {name: {"seconds": 0.0, "pages": 0, "bytes": 0, "chars": 0, "failures": 0, "invalid": 0,
+                     "similarity": []} for name in engines}
+    for path in files:
+        data = path.read_bytes()
+        results = {}
+        for name in engines:
+            try:
+                pages, elapsed = run_engine(name, data, args.repeat)
+            except ImportError:
+                totals[name]["failures"] += 1
+                continue
+            except Exception as e:
+                print(f"  {path.name}: {name} 提取失败: {e}")
+                totals[name]["failures"] += 1
+                continue
+            text = "\n".join(pages)
+            results[name] = bigrams(text)
+            stat = totals[name]
+            stat["seconds"] += elapsed
+            stat["pages"] += len(pages)
+            stat["bytes"] += len(data)
+            stat["chars"] += len(text)
+            stat["invalid"] += 0 if pages_look_valid(pages) else 1
+        reference = results.get(args.reference)
+        if reference is not None:
+            for name, grams in results.items():
+                totals[name]["similarity"].append(similarity(grams, reference))
+
+    print(f"\n语料 {len(files)} 个文件，保真度基准: {args.reference}")
+    print(f"{'引擎':<12}{'页/秒':>10}{'MB/秒':>10}{'字符数':>12}{'保真度':>10}{'失败':>6}{'无效':>6}")
+    for name, stat in totals.items():
+        seconds = stat["seconds"] or float("nan")
+        fidelity = sum(stat["similarity"]) / len(stat["similarity"]) if stat["similarity"] else float("nan")
+        print(f"{name:<12}{stat['pages'] / seconds:>10.1f}{stat['bytes'] / 1024 / 1024 / seconds:>10.2f}"
+              f"{stat['chars']:>12}{fidelity:>10.3f}{stat['failures']:>6}{stat['invalid']:>6}")
+
+
+if __name__ == "__main__":
+    main()
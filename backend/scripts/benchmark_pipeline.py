@@ -0,0 +1,90 @@
+"""
+本地脚本：生成管线吞吐基准（使用本地假模型后端，不访问网络）
+
+以 AI_BACKEND=fake 运行 GeminiProcessor.generate_mindmap_structure，
+并发提交互不相同的文本（避免结果缓存命中），统计吞吐、延迟分位数与失败数，
+用于在排除模型延迟的情况下度量清洗/排队/重试/校验等后端开销。
+
+使用方法（在 backend 目录执行）：
+   python scripts/benchmark_pipeline.py
+   python scripts/benchmark_pipeline.py --requests 500 --users 20 --latency 0.5 --error-rate 0.05 --burst 50:5
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="生成管线吞吐基准（假模型后端）")
+    parser.add_argument("--requests", type=int, default=200, help="总请求数")
+    parser.add_argument("--users", type=int, default=10, help="模拟用户数（公平调度按用户分组）")
+    parser.add_argument("--latency", type=float, default=0.2, help="假模型单次调用延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟抖动（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="可重试错误概率")
+    parser.add_argument("--burst", default="0:0", help="429 突发，格式 间隔:长度，如 50:5")
+    parser.add_argument("--size", type=int, default=5000, help="每条输入的字符数")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """须在导入应用模块之前设置，配置在导入时读取"""
+    interval, _, length = args.burst.partition(":")
+    os.environ.update({
+        "AI_BACKEND": "fake",
+        "AI_FAKE_LATENCY_SECONDS": str(args.latency),
+        "AI_FAKE_LATENCY_JITTER_SECONDS": str(args.jitter),
+        "AI_FAKE_ERROR_RATE": str(args.error_rate),
+        "AI_FAKE_BURST_INTERVAL": interval or "0",
+        "AI_FAKE_BURST_LENGTH": length or "0",
+        "AI_RESULT_CACHE_PERSIST": "false",
+    })
+
+
+def build_text(index, size):
+    paragraph = f"第{index}号文档。知识管理的核心在于建立可检索、可复用的结构。本段讨论笔记方法与定期回顾。\n\n"
+    return (f"基准文档 {index}\n" + paragraph * (size // len(paragraph) + 1))[:size]
+
+
+async def run(args):
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+    from app.core.ai_processor import GeminiProcessor
+
+    processor = GeminiProcessor()
+    latencies = []
+    failures = {}
+
+    async def one(index):
+        started = time.perf_counter()
+        result = await processor.generate_mindmap_structure(build_text(index, args.size), user_id=index % args.users)
+        if result["success"]:
+            latencies.append(time.perf_counter() - started)
+        else:
+            failures[result.get("error", "unknown")] = failures.get(result.get("error", "unknown"), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(args.requests)])
+    elapsed = time.perf_counter() - started
+
+    print(f"\n请求数 {args.requests}，成功 {len(latencies)}，失败 {sum(failures.values())}，耗时 {elapsed:.2f}s")
+    print(f"吞吐: {len(latencies) / elapsed:.1f} 请求/秒")
+    if latencies:
+        ordered = sorted(latencies)
+        print(f"延迟 p50={statistics.median(ordered):.3f}s  "
+              f"p95={ordered[int(len(ordered) * 0.95) - 1]:.3f}s  max={ordered[-1]:.3f}s")
+    for error, count in failures.items():
+        print(f"  失败 {count} 次: {error}")
+    print(f"指标: {processor.get_metrics()}")
+
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+"""
+测试公共配置：将 backend 目录加入 sys.path，使 `pytest` 在任意目录下都能导入 app 包
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,121 @@
+"""
+文本提取预算（ExtractionBudget / BudgetCollector）测试
+"""
+
+from app.core.extraction_budget import ExtractionBudget
+
+
+def test_unlimited_budget_collects_everything():
+    budget = ExtractionBudget()
+    assert not budget.limited
+    collector = budget.select(["a" * 100, "b" * 100], "页")
+    assert collector.text == "a" * 100 + "\n" + "b" * 100
+    assert collector.report() is None
+
+
+def test_unknown_strategy_falls_back_to_head():
+    assert ExtractionBudget(max_chars=10, strategy="random").strategy == "head"
+    assert ExtractionBudget(max_chars=-5).max_chars == 0
+
+
+def test_head_truncates_the_unit_that_exhausts_the_budget():
+    collector = ExtractionBudget(max_chars=250).collector("页")
+    assert collector.add("a" * 100)
+    assert collector.add("b" * 100)
+    assert not collector.add("c" * 100)
+    assert not collector.add("d" * 100)
+    assert collector.texts == ["a" * 100, "b" * 100, "c" * 50]
+
+    report = collector.report()
+    assert report["strategy"] == "head"
+    assert report["truncated"] is True
+    assert report["total_units"] == 4
+    assert report["extracted_units"] == 3
+    assert report["skipped_units"] == 1
+    assert report["extracted_chars"] == 250
+    assert report["skipped_chars"] == 150
+    assert report["skipped_chars_estimated"] is False
+    assert report["skipped_ratio"] == round(150 / 400, 3)
+
+
+def test_empty_units_do_not_consume_budget():
+    collector = ExtractionBudget(max_chars=100).collector("段落")
+    assert collector.add("")
+    assert collector.add("x" * 100)
+    assert collector.report() is None
+
+
+def test_unit_that_does_not_fit_at_all_is_skipped():
+    collector = ExtractionBudget(max_chars=100).collector("页")
+    assert collector.add("a" * 100)
+    assert not collector.add("b" * 40)
+    assert collector.texts == ["a" * 100]
+    report = collector.report()
+    assert report["truncated"] is False
+    assert report["skipped_units"] == 1
+    assert report["skipped_chars"] == 40
+
+
+def test_unread_units_are_estimated_from_the_read_average():
+    collector = ExtractionBudget(max_chars=150).collector("页")
+    collector.total_units = 10
+    collector.extend(["a" * 100, "b" * 100])
+    collector.skip_unread(8)
+    report = collector.report()
+    assert report["total_units"] == 10
+    assert report["extracted_units"] == 2
+    assert report["skipped_units"] == 8
+    # 已读单元平均 100 字符：截断 50 + 未读 8 页约 800
+    assert report["skipped_chars"] == 850
+    assert report["skipped_chars_estimated"] is True
+
+
+def test_token_budget_uses_the_larger_ratio():
+    budget = ExtractionBudget(max_chars=1000, max_tokens=10)
+    assert budget.cost("word " * 40) > 1.0
+    assert ExtractionBudget(max_chars=1000).cost("x" * 500) == 0.5
+
+
+def test_sample_indices_spread_over_all_units():
+    budget = ExtractionBudget(max_chars=300, strategy="sample")
+    assert budget.sample_indices(10, 0.0) == list(range(10))
+    assert budget.sample_indices(3, 0.25) == [0, 1, 2]
+    assert budget.sample_indices(10, 0.25) == [0, 2, 5, 7]
+    assert budget.sample_plan(10, ["x" * 100, "y" * 100]) == [0, 3, 6]
+
+
+def test_sample_strategy_selects_evenly_and_reports_skips():
+    units = [f"{index}" * 100 for index in range(10)]
+    collector = ExtractionBudget(max_chars=300, strategy="sample").select(units, "页")
+    assert collector.texts == [units[0], units[3], units[6]]
+    report = collector.report()
+    assert report["strategy"] == "sample"
+    assert report["extracted_units"] == 3
+    assert report["skipped_units"] == 7
+    assert report["skipped_chars"] == 700
+    assert report["skipped_chars_estimated"] is False
+
+
+def test_collect_sampled_counts_unfetched_units_as_unread():
+    collector = ExtractionBudget(max_chars=300, strategy="sample").collector("页")
+    collector.total_units = 20
+    probe = ["p" * 100, "q" * 100]
+    collector.collect_sampled(20, [0, 10], probe, {10: "r" * 100})
+    assert collector.texts == ["p" * 100, "r" * 100]
+    report = collector.report()
+    assert report["skipped_units"] == 18
+    assert collector.unread_units == 17
+    assert report["skipped_chars_estimated"] is True
+
+
+def test_record_writes_budget_into_parse_report():
+    collector = ExtractionBudget(max_chars=50).collector("行")
+    collector.extend(["x" * 40, "y" * 40])
+    parse_report = {}
+    collector.record(parse_report)
+    assert parse_report["budget"]["unit"] == "行"
+    assert parse_report["budget"]["extracted_chars"] == 50
+
+    untouched = {}
+    ExtractionBudget().collector("行").record(untouched)
+    assert untouched == {}
@@ -0,0 +1,95 @@
+"""
+文本类文件按预算提取测试：预算在读取时生效，只解码需要的字节，而不是解码全文后再截断
+"""
+
+import pytest
+
+from app.core.extraction_budget import ExtractionBudget
+from app.core.file_parser import FileParser
+
+LINES = 20000
+
+
+@pytest.fixture
+def parser(monkeypatch):
+    parser = FileParser()
+    parser.decoded_bytes = []
+    decode = parser._decode_text
+
+    def tracked(file_bytes, final=True):
+        parser.decoded_bytes.append(len(file_bytes))
+        return decode(file_bytes, final)
+
+    monkeypatch.setattr(parser, "_decode_text", tracked)
+    return parser
+
+
+def _write(tmp_path, name: str, content: str) -> str:
+    path = tmp_path / name
+    path.write_bytes(content.encode("utf-8"))
+    return str(path)
+
+
+def test_head_budget_decodes_only_the_beginning(parser, tmp_path):
+    content = "\n".join(f"第{index:05d}行 内容" for index in range(LINES))
+    path = _write(tmp_path, "notes.txt", content)
+
+    text, report = parser.parse_path_with_report(path, "notes.txt", ExtractionBudget(max_chars=500))
+    assert text.startswith("第00000行 内容\n第00001行 内容")
+    assert len(text.replace("\n", "")) <= 500
+    assert sum(parser.decoded_bytes) < len(content.encode("utf-8")) // 10
+
+    budget = report["budget"]
+    assert budget["skipped_chars_estimated"]
+    # 未解码部分的行数按比例估算
+    assert abs(budget["total_units"] - LINES) < LINES * 0.05
+
+
+def test_head_budget_keeps_reading_until_markdown_output_fills_it(parser, tmp_path):
+    # 代码块行在处理后被丢弃，需要继续读取才能填满预算
+    content = "```\n" * 3000 + "\n".join(f"- 要点{index}" for index in range(LINES))
+    path = _write(tmp_path, "notes.md", content)
+
+    text, report = parser.parse_path_with_report(path, "notes.md", ExtractionBudget(max_chars=2000))
+    assert text.startswith("• 要点0\n• 要点1")
+    assert len(parser.decoded_bytes) > 1
+    assert sum(parser.decoded_bytes) < len(content.encode("utf-8")) // 2
+    assert report["budget"]["truncated"] or report["budget"]["skipped_units"]
+
+
+def test_head_budget_cuts_srt_between_captions(parser, tmp_path):
+    blocks = [
+        f"{index + 1}\n00:{index // 60 % 60:02d}:{index % 60:02d},000 --> 00:{index // 60 % 60:02d}:{index % 60:02d},900\n"
+        f"字幕第{index}句，内容互不相同的编号{index * 7919}"
+        for index in range(LINES // 4)
+    ]
+    content = "\n\n".join(blocks)
+    path = _write(tmp_path, "talk.srt", content)
+
+    text, report = parser.parse_path_with_report(path, "talk.srt", ExtractionBudget(max_chars=800))
+    assert "字幕第0句" in text
+    assert sum(parser.decoded_bytes) < len(content.encode("utf-8")) // 10
+    assert report["budget"]["skipped_chars_estimated"]
+
+
+def test_sample_budget_decodes_only_sampled_lines(parser, tmp_path):
+    content = "\n".join(f"line {index:05d} " + "x" * 40 for index in range(LINES))
+    path = _write(tmp_path, "notes.txt", content)
+
+    text, report = parser.parse_path_with_report(path, "notes.txt", ExtractionBudget(max_chars=5000, strategy="sample"))
+    numbers = [int(line.split()[1]) for line in text.split("\n")]
+    assert numbers == sorted(numbers)
+    # 抽中的行覆盖全文，而不是集中在开头
+    assert numbers[-1] > LINES * 0.9
+    assert len(text.replace("\n", "")) <= 5000
+    assert sum(parser.decoded_bytes) < len(content) // 5
+    assert report["budget"]["strategy"] == "sample"
+
+
+def test_small_file_is_parsed_as_before(parser, tmp_path):
+    content = "# 标题\n正文第一段\n- 要点"
+    path = _write(tmp_path, "notes.md", content)
+
+    text, report = parser.parse_path_with_report(path, "notes.md", ExtractionBudget(max_chars=5000))
+    assert text == parser._process_markdown_content(content)
+    assert "budget" not in report
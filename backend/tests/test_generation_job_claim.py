@@ -0,0 +1,68 @@
+"""
+生成任务认领测试：按用户轮转认领，执行期间的心跳只刷新仍由本 worker 执行的任务
+（使用内存 SQLite，仅创建 generation_jobs 表）
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.generation_job import GenerationJob, JobStatus
+
+
+async def _import_service():
+    # 服务模块间接导入的缓存服务在导入时启动清理任务，需在事件循环内导入
+    from app.services.generation_job_service import GenerationJobService
+    return GenerationJobService
+
+
+GenerationJobService = asyncio.run(_import_service())
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    GenerationJob.__table__.create(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def _queue(db, user_id: int, count: int, start: datetime) -> None:
+    for index in range(count):
+        db.add(GenerationJob(
+            user_id=user_id, status=JobStatus.QUEUED, source_type="text", input_text=f"{user_id}-{index}",
+            priority=1, credits_charged=False, attempts=0, created_at=start + timedelta(seconds=index)
+        ))
+    db.commit()
+
+
+def test_claims_rotate_between_users(db):
+    start = datetime.now(timezone.utc) - timedelta(minutes=10)
+    # 用户 1 先提交了大量任务，用户 2、3 随后各提交少量任务
+    _queue(db, 1, 10, start)
+    _queue(db, 2, 2, start + timedelta(minutes=1))
+    _queue(db, 3, 1, start + timedelta(minutes=2))
+
+    claimed = [GenerationJobService.claim_next_job(db, "worker") for _ in range(6)]
+    assert [job.user_id for job in claimed] == [1, 2, 3, 1, 2, 1]
+    # 同一用户内按提交顺序执行
+    assert [job.input_text for job in claimed if job.user_id == 1] == ["1-0", "1-1", "1-2"]
+
+
+def test_heartbeat_only_touches_jobs_still_owned_by_worker(db):
+    _queue(db, 1, 1, datetime.now(timezone.utc))
+    job = GenerationJobService.claim_next_job(db, "worker-a")
+    assert GenerationJobService.heartbeat(db, job.id, "worker-a")
+    assert not GenerationJobService.heartbeat(db, job.id, "worker-b")
+
+    job.status = JobStatus.QUEUED
+    job.worker_id = None
+    db.commit()
+    assert not GenerationJobService.heartbeat(db, job.id, "worker-a")
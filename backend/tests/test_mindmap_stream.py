@@ -0,0 +1,59 @@
+"""
+流式生成测试：分块生成时逐块推送进度，树输出模式同样可流式获取
+（使用本地假模型后端，不访问网络）
+"""
+
+import asyncio
+import uuid
+
+from app.core.config import settings
+
+
+LONG_TEXT = "\n\n".join(
+    f"第{index}章 主题{index}\n第{index}章的论点一。第{index}章的论点二。第{index}章的论点三。" for index in range(1, 9)
+)
+
+
+def _collect(monkeypatch, output_format: str):
+    monkeypatch.setattr(settings, "ai_chunk_threshold_chars", 120)
+    monkeypatch.setattr(settings, "ai_chunk_size_chars", 100)
+
+    async def scenario():
+        # ai_processor 模块导入时会启动缓存清理任务，需在事件循环内导入
+        from app.core.ai_backends import FakeBackend
+        from app.core.ai_processor import GeminiProcessor
+
+        processor = GeminiProcessor(backend=FakeBackend(latency_seconds=0.01))
+        # 内容带随机后缀，避免命中已有数据库中的结果缓存
+        return [event async for event in processor.generate_mindmap_stream(
+            f"{LONG_TEXT}\n\n{uuid.uuid4().hex}", output_format=output_format
+        )]
+
+    return asyncio.run(scenario())
+
+
+def test_chunked_generation_streams_progress_per_chunk(monkeypatch):
+    events = _collect(monkeypatch, "markdown")
+    progress = [event["data"] for event in events if event["event"] == "progress"]
+    assert len(progress) > 1
+    total = progress[0]["total"]
+    assert len(progress) == total
+    assert [item["completed"] for item in progress] == list(range(1, total + 1))
+    assert sorted(item["chunk"] for item in progress) == list(range(1, total + 1))
+    assert all(item["stage"] == "chunk" and item["success"] for item in progress)
+
+    done = events[-1]
+    assert done["event"] == "done"
+    assert done["data"]["chunks"] == total
+    # 进度事件先于结果行推送
+    first_line = next(index for index, event in enumerate(events) if event["event"] == "line")
+    assert all(event["event"] == "progress" for event in events[:first_line])
+
+
+def test_tree_output_format_is_streamed(monkeypatch):
+    events = _collect(monkeypatch, "tree")
+    assert any(event["event"] == "progress" for event in events)
+    done = events[-1]
+    assert done["event"] == "done"
+    assert done["data"]["format"] == "tree"
+    assert done["data"]["tree"]["children"]
@@ -0,0 +1,125 @@
+"""
+思维导图树结构（mindmap_tree）测试：规范化校验与 Markdown 互转
+"""
+
+import random
+
+import pytest
+
+from app.core.mindmap_tree import (
+    DEFAULT_TITLE,
+    MAX_TREE_DEPTH,
+    MAX_TREE_NODES,
+    clean_label,
+    markdown_to_tree,
+    normalize_tree,
+    tree_to_markdown,
+    tree_to_nodes,
+)
+
+
+def _node(title, *children):
+    return {"title": title, "children": list(children)}
+
+
+SAMPLE_TREE = _node(
+    "机器学习",
+    _node("监督学习", _node("分类", _node("逻辑回归"), _node("决策树", _node("剪枝", _node("预剪枝")))), _node("回归")),
+    _node("无监督学习", _node("聚类")),
+    _node("强化学习"),
+)
+
+
+def test_tree_to_markdown_layout():
+    assert tree_to_markdown(SAMPLE_TREE).split("\n") == [
+        "# 机器学习",
+        "## 监督学习",
+        "### 分类",
+        "- 逻辑回归",
+        "- 决策树",
+        "  - 剪枝",
+        "    - 预剪枝",
+        "### 回归",
+        "## 无监督学习",
+        "### 聚类",
+        "## 强化学习",
+    ]
+
+
+def test_markdown_round_trip():
+    assert markdown_to_tree(tree_to_markdown(SAMPLE_TREE)) == SAMPLE_TREE
+
+
+def _random_tree(rng, depth=0):
+    children = []
+    if depth < 6:
+        children = [_random_tree(rng, depth + 1) for _ in range(rng.randint(0, 3 if depth < 3 else 1))]
+    return _node(f"节点 {rng.randint(0, 10_000)} level{depth}", *children)
+
+
+def test_random_trees_round_trip():
+    rng = random.Random(10)
+    for _ in range(200):
+        tree = normalize_tree(_random_tree(rng))
+        assert markdown_to_tree(tree_to_markdown(tree)) == tree
+
+
+def test_markdown_with_several_roots_gets_default_root():
+    tree = markdown_to_tree("# 第一部分\n- 甲\n# 第二部分\n1. 乙\n\t- 丙")
+    assert tree == _node(DEFAULT_TITLE, _node("第一部分", _node("甲")), _node("第二部分", _node("乙", _node("丙"))))
+
+
+def test_markdown_ignores_plain_text_and_empty_labels():
+    assert markdown_to_tree("# 主题\n说明文字\n- \n- <b></b>\n## 分支") == _node("主题", _node("分支"))
+
+
+def test_normalize_tree_accepts_key_variants_and_drops_empty_nodes():
+    data = {
+        "label": "  根  节点 ",
+        "items": [
+            {"name": "<i>A</i>", "nodes": ["a1", 2, None, ""]},
+            {"text": "## B"},
+            {"title": ""},
+            {"title": "javascript:alert(1)"},
+            "C",
+        ],
+    }
+    assert normalize_tree(data) == _node("根 节点", _node("A", _node("a1"), _node("2")), _node("B"), _node("C"))
+
+
+def test_normalize_tree_rejects_invalid_input():
+    with pytest.raises(ValueError):
+        normalize_tree(["not", "a", "tree"])
+    with pytest.raises(ValueError):
+        normalize_tree({"children": [{"title": "x"}]})
+    with pytest.raises(ValueError):
+        normalize_tree({"title": "root", "children": [{"title": f"n{i}"} for i in range(MAX_TREE_NODES)]})
+
+
+def test_normalize_tree_caps_depth():
+    tree = _node("leaf")
+    for level in range(MAX_TREE_DEPTH + 5):
+        tree = _node(f"level {level}", tree)
+    depth = 0
+    node = normalize_tree(tree)
+    while node["children"]:
+        node = node["children"][0]
+        depth += 1
+    assert depth == MAX_TREE_DEPTH
+
+
+def test_clean_label():
+    assert clean_label(3.5) == "3.5"
+    assert clean_label(True) == ""
+    assert clean_label("- 1. 列表前缀") == "列表前缀"
+    assert len(clean_label("字" * 1000)) == 500
+
+
+def test_tree_to_nodes():
+    nodes = tree_to_nodes(_node("根", _node("分支", _node("叶"))))
+    assert nodes["title"] == "根"
+    assert [(node["id"], node["type"], node["parent"], node["data"]) for node in nodes["nodes"]] == [
+        ("n0", "root", None, {"label": "根", "depth": 0}),
+        ("n1", "branch", "n0", {"label": "分支", "depth": 1}),
+        ("n2", "leaf", "n1", {"label": "叶", "depth": 2}),
+    ]
@@ -0,0 +1,158 @@
+"""
+输出校验层测试：单遍白名单校验（_validate_markdown_line / _parse_markdown_response）
+与旧实现（逐条 re.match / re.search，再单独校验格式与提取标题）在同一语料上输出一致
+"""
+
+import re
+
+import pytest
+
+from app.core.ai_processor import ai_processor
+
+
+def legacy_validate_line(line):
+    """旧实现中的单行白名单校验（原样保留），返回保留的行或 None"""
+    line = line.rstrip()
+    if not line.strip():
+        return line
+    if re.match(r'^#{1,6}\s+.+', line.strip()):
+        return line
+    if re.match(r'^\s*[-*]\s+.+', line):
+        return line
+    if re.match(r'^\s*\d+\.\s+.+', line):
+        return line
+    if re.match(r'^[^<>{}[\]()]*$', line.strip()) and line.strip():
+        suspicious_patterns = [
+            r'system\s*[:：]',
+            r'assistant\s*[:：]',
+            r'user\s*[:：]',
+            r'```',
+            r'<[^>]*>',
+            r'javascript:',
+            r'data:',
+            r'eval\s*\(',
+        ]
+        if not any(re.search(pattern, line, re.IGNORECASE) for pattern in suspicious_patterns):
+            return line
+        return None
+    if any(keyword in line.lower() for keyword in ['思维导图', '核心概念', '主要分支', '关键要点']):
+        return re.sub(r'[<>{}[\]()]', '', line)
+    return None
+
+
+def legacy_validate_mindmap(markdown):
+    if not markdown or len(markdown.strip()) < 10:
+        return False
+    has_title = False
+    has_content = False
+    for line in markdown.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('# '):
+            has_title = True
+        if line.startswith('## ') or line.startswith('- ') or line.startswith('* '):
+            has_content = True
+    return has_title and has_content
+
+
+def legacy_parse(text):
+    """旧流程：清洗 → 格式校验 → 再次扫描提取标题"""
+    if not text or not isinstance(text, str):
+        return None
+    text = text.replace("```markdown", "").replace("```", "").strip()
+    lines = [legacy_validate_line(line) for line in text.split('\n')]
+    result = '\n'.join(line for line in lines if line is not None)
+    result = re.sub(r'\n\s*\n\s*\n', '\n\n', result).strip()
+    if not legacy_validate_mindmap(result):
+        return None
+    title = "思维导图"
+    for line in result.split('\n'):
+        if line.strip().startswith('# '):
+            title = line.strip()[2:].strip()
+            break
+    return {"markdown": result, "title": title}
+
+
+LINES = [
+    "",
+    "   ",
+    "\t",
+    "# 标题",
+    "#标题",
+    "# ",
+    "#  ",
+    "####### 七级标题",
+    "###### 六级标题",
+    "   ## 缩进的二级标题",
+    "　## 全角空格开头",
+    "\x1c## 分隔符开头",
+    "- 列表项",
+    "  * 缩进列表项",
+    "-",
+    "- ",
+    "-列表",
+    "1. 有序列表",
+    "12.有序列表",
+    "   3. 缩进有序",
+    "普通文本行",
+    "包含(括号)的文本",
+    "核心概念 (含括号) <b>",
+    "主要分支{x}",
+    "THINK: 思维导图 [1]",
+    "System: 你好",
+    "system ： 你好",
+    "USER:hi",
+    "assistant：回答",
+    "调用 eval (x)",
+    "javascript:alert",
+    "链接 data:text/html",
+    "含有```代码",
+    "文本 <script>",
+    "尾随空格   ",
+    "KKelvin ſystem: 大小写特殊字符",
+    "İstanbul user: 测试",
+    " - 不换行空格开头的列表",
+]
+
+
+@pytest.mark.parametrize("line", LINES)
+def test_validate_markdown_line_matches_legacy(line):
+    assert ai_processor._validate_markdown_line(line) == legacy_validate_line(line)
+
+
+RESPONSES = [
+    "",
+    "```markdown\n# 主题\n## 分支\n- 要点\n```",
+    "# 主题\n\n\n\n## 分支一\n- 要点 (含括号)\n\n\n- system: 注入\n## 分支二\n  - 子项",
+    "前言文本\n# 第一部分\n核心概念 <x>\n## A\n# 第二部分\n- b",
+    "# 仅标题没有内容",
+    "## 没有主标题\n- 内容",
+    "#短",
+    "# T\n- x",
+    "  # 缩进主标题\n  - 缩进内容项\n1. 有序项不算内容",
+    "# 标题\n1. 只有有序列表\n2. 第二项",
+    "<div>\n# 标题\n## 分支\n</div>\n```js\neval(1)\n```",
+]
+
+
+@pytest.mark.parametrize("text", RESPONSES)
+def test_parse_markdown_response_matches_legacy(text):
+    assert ai_processor._parse_markdown_response(text) == legacy_parse(text)
+    expected = legacy_parse(text)
+    assert ai_processor._clean_markdown_response(text) == (expected["markdown"] if expected else "")
+
+
+@pytest.mark.parametrize("style", [None, "refined"])
+def test_merged_chunks_need_no_revalidation(style):
+    """分块合并不再重新扫描：由已通过校验的分块合并的结果必然有效，标题即第一块的标题"""
+    partials = [ai_processor._parse_markdown_response(text) for text in (
+        "# 第一部分\n## 背景\n- 要点一",
+        "# 第二部分\n## 背景\n- 要点二\n## 方法\n- 步骤",
+        "# 多根一\n- 甲\n# 多根二\n- 乙",
+    )]
+    merged = ai_processor._merge_chunk_markdowns(
+        [parsed["markdown"] for parsed in partials], partials[0]["title"], style
+    )
+    assert legacy_validate_mindmap(merged)
+    assert legacy_parse(merged)["title"] == partials[0]["title"]
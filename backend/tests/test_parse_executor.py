@@ -0,0 +1,72 @@
+"""
+文件解析执行器测试：超时只影响执行该任务的 worker 进程
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.services.parse_executor import ParseExecutor, ParseTimeoutError
+
+
+def test_timeout_kills_only_the_slow_job(tmp_path):
+    notes = tmp_path / "notes.txt"
+    notes.write_text("第一章 概述\n内容要点", encoding="utf-8")
+
+    async def scenario():
+        executor = ParseExecutor(workers=2, timeout_seconds=2.0, memory_limit_mb=0)
+        executor.start()
+        try:
+            # 等两个 worker 完成启动，避免启动耗时打乱下面的时序
+            await asyncio.gather(executor._submit(time.sleep, 0.3), executor._submit(time.sleep, 0.3))
+
+            async def other_parse():
+                # 在慢任务超时被终止时仍在另一个 worker 上执行
+                await asyncio.sleep(1.0)
+                await executor._submit(time.sleep, 1.8)
+                return await executor.parse(str(notes), "notes.txt")
+
+            slow, other = await asyncio.gather(
+                executor._submit(time.sleep, 30), other_parse(), return_exceptions=True
+            )
+            # 被终止的 worker 在其 IO 线程收到 EOF 后才会被替换
+            await asyncio.sleep(0.5)
+            return slow, other, executor.get_metrics()
+        finally:
+            executor.shutdown()
+
+    slow, other, metrics = asyncio.run(scenario())
+    assert isinstance(slow, ParseTimeoutError)
+    text, _ = other
+    assert "内容要点" in text
+    assert metrics["timeouts"] == 1
+    assert metrics["worker_restarts"] == 1
+
+
+def test_timeout_excludes_time_spent_waiting_for_a_worker():
+    async def scenario():
+        executor = ParseExecutor(workers=1, timeout_seconds=1.5, memory_limit_mb=0)
+        executor.start()
+        try:
+            # 第二个任务排队约 1 秒，加上执行时间超过 1.5 秒，但执行本身未超时
+            return await asyncio.gather(
+                executor._submit(time.sleep, 1.0), executor._submit(time.sleep, 1.0)
+            )
+        finally:
+            executor.shutdown()
+
+    assert asyncio.run(scenario()) == [None, None]
+
+
+def test_worker_exception_is_raised_in_caller():
+    async def scenario():
+        executor = ParseExecutor(workers=1, timeout_seconds=10, memory_limit_mb=0)
+        try:
+            with pytest.raises(ValueError):
+                await executor._submit(int, "不是数字")
+            return await executor._submit(int, "42")
+        finally:
+            executor.shutdown()
+
+    assert asyncio.run(scenario()) == 42
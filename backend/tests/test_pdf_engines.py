@@ -0,0 +1,61 @@
+"""
+PDF 引擎测试：页数读取的引擎回退、损坏文件，以及两栏页改由 pdfplumber 逐栏提取
+"""
+
+import pytest
+
+from app.core import pdf_engines
+from app.core.pdf_engines import count_pdf_pages, extract_pdf_pages
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("pdfplumber")
+
+
+def _build_pdf() -> bytes:
+    document = fitz.open()
+    two_columns = document.new_page()
+    for row in range(8):
+        two_columns.insert_text((50, 80 + row * 14), f"left column line {row} alpha")
+        two_columns.insert_text((320, 80 + row * 14), f"right column line {row} beta")
+    two_columns.insert_text((50, 400), "A full width footer paragraph that spans the page from left edge to right")
+    single = document.new_page()
+    for row in range(8):
+        single.insert_text((50, 80 + row * 14), f"single column body line {row} with enough text")
+    table = document.new_page()
+    for row in range(8):
+        for column, x in enumerate((50, 200, 350)):
+            table.insert_text((x, 80 + row * 14), f"c{row}{column}")
+    return document.tobytes()
+
+
+def test_two_column_page_is_extracted_column_by_column():
+    texts, engine = extract_pdf_pages(_build_pdf(), ["pymupdf", "pdfplumber", "pypdf2"])
+    assert engine == "pymupdf+pdfplumber"
+    first = texts[0]
+    assert first.index("left column line 7") < first.index("right column line 0")
+    # 分栏区域之外横跨两栏的行整行保留
+    assert "A full width footer paragraph that spans the page from left edge to right" in first
+    assert "single column body line 0" in texts[1]
+    # 单元格很短的表格不按分栏处理，保持按行输出
+    assert texts[2].index("c00") < texts[2].index("c01") < texts[2].index("c10")
+
+
+def test_column_fallback_requires_pdfplumber_in_engine_order():
+    texts, engine = extract_pdf_pages(_build_pdf(), ["pymupdf", "pypdf2"])
+    assert engine == "pymupdf"
+    assert texts[0].index("right column line 0") < texts[0].index("left column line 7")
+
+
+def test_count_falls_back_when_engine_cannot_open_file(monkeypatch):
+    def unreadable(source):
+        raise RuntimeError("cannot open broken document")
+
+    monkeypatch.setitem(pdf_engines.PAGE_COUNTERS, "pymupdf", unreadable)
+    assert count_pdf_pages(_build_pdf()) == 3
+
+
+def test_corrupt_pdf_raises_after_trying_every_engine():
+    with pytest.raises(Exception):
+        count_pdf_pages(_build_pdf()[:200])
+    with pytest.raises(Exception):
+        extract_pdf_pages(b"%PDF-1.7 broken", ["pymupdf", "pdfplumber", "pypdf2"])
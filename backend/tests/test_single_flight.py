@@ -0,0 +1,93 @@
+"""
+单飞合并（SingleFlight）测试
+"""
+
+import asyncio
+
+from app.core.ai_concurrency import SingleFlight
+
+
+class BudgetError(Exception):
+    pass
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight()
+        runs = []
+
+        async def work():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*[flight.do("key", work) for _ in range(5)])
+        return results, runs, flight.get_stats()
+
+    results, runs, stats = asyncio.run(scenario())
+    assert results == ["result"] * 5
+    assert len(runs) == 1
+    assert stats["executed"] == 1 and stats["collapsed"] == 4 and stats["inflight"] == 0
+
+
+def test_followers_reissue_when_leader_fails_on_its_own_budget():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        def make(name, has_budget):
+            async def work():
+                calls.append(name)
+                await asyncio.sleep(0.01)
+                if name == "leader":
+                    raise BudgetError(name)
+                return name
+            return lambda: work(), lambda e: isinstance(e, BudgetError) and has_budget
+
+        leader = flight.do("key", *make("leader", False))
+        follower_a = flight.do("key", *make("a", True))
+        follower_b = flight.do("key", *make("b", True))
+        expired = flight.do("key", *make("expired", False))
+        results = await asyncio.gather(leader, follower_a, follower_b, expired, return_exceptions=True)
+        return results, calls, flight.get_stats()
+
+    results, calls, stats = asyncio.run(scenario())
+    assert isinstance(results[0], BudgetError)
+    # 两个仍有预算的等待者重新发起时再次合并，由先重新发起的一方执行
+    assert results[1] == results[2] == "a"
+    assert isinstance(results[3], BudgetError)
+    assert calls == ["leader", "a"]
+    assert stats["reissued"] == 2
+
+
+def test_other_errors_are_shared():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("bad request")
+
+        return await asyncio.gather(
+            *[flight.do("key", fail, reissue_if=lambda e: isinstance(e, BudgetError)) for _ in range(3)],
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_finished_task_is_not_joined():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def value():
+            return 1
+
+        first = await flight.do("key", value)
+        second = await flight.do("key", value)
+        return first, second, flight.get_stats()
+
+    first, second, stats = asyncio.run(scenario())
+    assert (first, second) == (1, 1)
+    assert stats["executed"] == 2
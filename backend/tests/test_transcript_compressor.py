@@ -0,0 +1,74 @@
+"""
+字幕压缩（TranscriptCompressor）测试
+"""
+
+from app.core.transcript_compressor import Caption, TranscriptCompressor, format_timestamp, group_by_time_window
+
+
+def _texts(captions):
+    return [caption.text for caption in captions]
+
+
+def test_short_replies_are_kept():
+    compressor = TranscriptCompressor()
+    kept, stats = compressor.compress([
+        Caption(0, "我们今天先看一下好的方案"),
+        Caption(2, "好的"),
+        Caption(4, "Did you say yes to the plan"),
+        Caption(6, "yes"),
+    ])
+    assert _texts(kept) == ["我们今天先看一下好的方案", "好的", "Did you say yes to the plan", "yes"]
+    assert stats["duplicates_removed"] == 0
+
+
+def test_identical_consecutive_captions_are_removed():
+    compressor = TranscriptCompressor()
+    kept, stats = compressor.compress([Caption(0, "大家好，欢迎收看"), Caption(1, "大家好，欢迎收看！")])
+    assert _texts(kept) == ["大家好，欢迎收看"]
+    assert stats["duplicates_removed"] == 1
+
+
+def test_rolling_caption_keeps_most_complete_line_and_first_start():
+    compressor = TranscriptCompressor()
+    kept, _ = compressor.compress([
+        Caption(10.0, "今天我们来讲"),
+        Caption(11.0, "今天我们来讲机器学习"),
+        Caption(12.0, "机器学习"),
+    ])
+    assert len(kept) == 1
+    assert kept[0].start == 10.0
+    assert kept[0].text == "今天我们来讲机器学习"
+
+
+def test_phrase_in_the_middle_is_not_a_duplicate():
+    compressor = TranscriptCompressor()
+    kept, _ = compressor.compress([Caption(0, "第一部分介绍数据结构与算法"), Caption(1, "数据结构")])
+    assert _texts(kept) == ["第一部分介绍数据结构与算法", "数据结构"]
+
+
+def test_overlap_with_previous_caption_is_trimmed():
+    compressor = TranscriptCompressor()
+    kept, stats = compressor.compress([
+        Caption(0, "the quick brown fox"),
+        Caption(1, "brown fox jumps over the lazy dog"),
+    ])
+    assert _texts(kept) == ["the quick brown fox", "jumps over the lazy dog"]
+    assert stats["overlaps_trimmed"] == 1
+
+
+def test_fillers_and_repeated_phrases_are_cleaned():
+    compressor = TranscriptCompressor()
+    assert compressor.clean_text("嗯 这个这个这个问题") == "这个问题"
+    assert compressor.clean_text("um so so we start") == "so we start"
+    assert TranscriptCompressor(remove_fillers=False).clean_text("嗯 开始") == "嗯 开始"
+
+
+def test_group_by_time_window():
+    groups = group_by_time_window([
+        Caption(None, "开场"),
+        Caption(5, "第一句"),
+        Caption(65, "第二句"),
+        Caption(70, "第三句"),
+    ], 60)
+    assert groups == [(None, ["开场"]), (0, ["第一句"]), (60, ["第二句", "第三句"])]
+    assert format_timestamp(3725.9) == "01:02:05"